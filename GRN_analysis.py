@@ -0,0 +1,146 @@
+#!/usr/bin/env python
+from grn import count_matrix
+from grn import analysis
+from grn import cyjs
+from grn import api
+import argparse
+import numpy
+import sys
+
+###################################################################################################################################################################################
+
+# Read command line arguments
+parser = argparse.ArgumentParser(description = 'Compute degree, PageRank, hub/authority scores, feedback loops and community modules for a GRN')
+parser.add_argument('grn', type = str, help = 'Cytoscape JSON file of the GRN (.cyjs), or a motif count matrix (see GRN_to_countMatrix.py)')
+parser.add_argument('out', type = str, help = 'Output file (TSV with one line per node)')
+parser.add_argument('-o', '--cyjs', dest = 'o', type = str, required = False, help = 'Also write the network with the results added to the node data to this cyjs file')
+parser.add_argument('-F', '--format', dest = 'F', choices = count_matrix.FORMATS, required = False, help = 'Count matrix format. Default = guessed from the file')
+parser.add_argument('-e', '--exprs', dest = 'e', type = str, required = False, help = 'Gene expression data file, used with -t to replace the motifs of a count matrix by their reference TF genes')
+parser.add_argument('-t', '--tfanno', dest = 't', type = str, required = False, help = 'Transcription Factor annotation file, used with -e')
+parser.add_argument('-r', '--resolution', dest = 'r', type = float, default = 1.0, help = 'Resolution of the community detection. Higher values give smaller communities. Default = 1')
+
+args = parser.parse_args()
+
+if bool(args.e) != bool(args.t):
+	parser.error('-e and -t must be given together')
+
+is_cyjs = args.grn.endswith('.cyjs')
+
+###################################################################################################################################################################################
+
+# Read the network as node indices and edge counts
+# cyjs files are streamed, so the only copy of the network in memory is the edge arrays
+node_index = dict()
+sources = list()
+targets = list()
+counts = list()
+
+if is_cyjs:
+	for element_type, data in cyjs.iter_elements(args.grn):
+		if element_type == 'node':
+			node_index[data['value']] = len(node_index)
+		else:
+			sources.append(node_index[data['source']])
+			targets.append(node_index[data['target']])
+			counts.append(data['count'])
+else:
+	matrix = count_matrix.read(args.grn, args.F).sorted()
+
+	# Without expression and annotation data the motifs are the source nodes, otherwise the reference TF gene of each motif (as in countMatrix_to_GRN.py)
+	if args.e:
+		gene_expression = api.load_expression(args.e)
+		motif_ref_gene, motif_associated_genes = api.select_reference_genes(api.load_tf_annotation(args.t), gene_expression, matrix.motifs)
+	else:
+		gene_expression = None
+		motif_ref_gene = dict((motif_id, [motif_id, None]) for motif_id in matrix.motifs)
+
+	# An edge made by a motif is replaced by a later motif with the same source node
+	edges = dict()
+
+	for row, col, count in zip(matrix.rows.tolist(), matrix.cols.tolist(), matrix.counts.tolist()):
+		target_node = matrix.genes[row]
+		motif_id = matrix.motifs[col]
+
+		if count == 0 or motif_id not in motif_ref_gene:
+			continue
+
+		if gene_expression is not None and target_node not in gene_expression:
+			continue
+
+		source_node = motif_ref_gene[motif_id][0]
+
+		for node in (source_node, target_node):
+			if node not in node_index:
+				node_index[node] = len(node_index)
+
+		edges[(node_index[source_node], node_index[target_node])] = count
+
+	sources = [source for source, target in edges]
+	targets = [target for source, target in edges]
+	counts = list(edges.values())
+
+nodes = list(node_index)
+sys.stdout.write('Read network with %d nodes and %d edges\n' % (len(nodes), len(counts)))
+
+###################################################################################################################################################################################
+
+# Compute the node measures
+A = analysis.adjacency(nodes, sources, targets, counts)
+
+in_degree, out_degree, in_weight, out_weight = analysis.degrees(A)
+pagerank = analysis.pagerank(A)
+hub, authority = analysis.hits(A)
+feedback_loop = analysis.feedback_loops(A)
+community, modularity = analysis.communities(A, args.r)
+
+sys.stdout.write('Found %d feedback loops (%d nodes) and %d communities (modularity %.4f)\n' % (len(set(feedback_loop[feedback_loop >= 0].tolist())), (feedback_loop >= 0).sum(), len(set(community.tolist())), modularity))
+
+COLUMNS = ['in_degree', 'out_degree', 'in_weight', 'out_weight', 'pagerank', 'hub', 'authority', 'feedback_loop', 'community']
+values = [in_degree, out_degree, in_weight, out_weight, pagerank, hub, authority, feedback_loop, community]
+
+def node_attributes(i):
+	# Results for node i, with integer counts and weights written as integers
+	attributes = dict()
+
+	for column, value in zip(COLUMNS, values):
+		value = value[i].item()
+		attributes[column] = int(value) if isinstance(value, float) and value.is_integer() and column not in ('pagerank', 'hub', 'authority') else value
+
+	return attributes
+
+###################################################################################################################################################################################
+
+# Write the results table
+lines = ['node\t%s' % '\t'.join(COLUMNS)]
+
+for i, node in enumerate(nodes):
+	attributes = node_attributes(i)
+	lines.append('%s\t%s' % (node, '\t'.join(str(attributes[column]) for column in COLUMNS)))
+
+with open(args.out, 'w') as out:
+	out.write('\n'.join(lines) + '\n')
+
+sys.stdout.write('Wrote results for %d nodes to %s\n' % (len(nodes), args.out))
+
+# Write the network with the results added to the node data
+# A cyjs input is copied element by element; a network from a count matrix is written with its edge counts
+if args.o:
+	grn = cyjs.CyjsWriter(cyjs.cyjs_filename(args.o))
+
+	if is_cyjs:
+		for element_type, data in cyjs.iter_elements(args.grn):
+			if element_type == 'node':
+				data.update(node_attributes(node_index[data['value']]))
+				grn.add_node(data.pop('value'), **data)
+			else:
+				grn.add_edge(data.pop('source'), data.pop('target'), **data)
+	else:
+		for i, node in enumerate(nodes):
+			grn.add_node(node, **node_attributes(i))
+
+		for source, target, count in zip(sources, targets, counts):
+			grn.add_edge(nodes[source], nodes[target], count = count)
+
+	sys.stdout.write('Wrote network to %s\n' % grn.close())
+
+###################################################################################################################################################################################
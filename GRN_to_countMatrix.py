@@ -1,7 +1,7 @@
 #!/usr/bin/env python
-import networkx as nx
+from grn import count_matrix
+from grn import cyjs
 import argparse
-import json
 import sys
 
 ###################################################################################################################################################################################
@@ -10,60 +10,36 @@ import sys
 parser = argparse.ArgumentParser(description = 'Convert a GRN to a motif count matrix')
 parser.add_argument('cyjs', type = str, help = 'Cytoscape JSON file of the GRN')
 parser.add_argument('out', type = str, help = 'Output file')
+parser.add_argument('-F', '--format', dest = 'F', choices = count_matrix.FORMATS, required = False, help = 'Output format: dense TSV, sparse COO triplet TSV, Matrix Market (mtx) or NumPy/SciPy sparse archive (npz). Default = mtx/npz for files with these extensions, otherwise dense')
 
 args = parser.parse_args()
 
 ###################################################################################################################################################################################
 
 # Read network
-grn_json_file = open(args.cyjs, 'r')
-grn_json = json.load(grn_json_file)
-grn_json_file.close()
+# Edges are streamed from the cyjs file without building the graph
+edges = list()
+n_nodes = 0
 
-# Convert JSON to networkx
-grn = nx.cytoscape_graph(grn_json)
-sys.stdout.write('Read network with %d nodes and %d edges\n' % (grn.number_of_nodes(), grn.number_of_edges()))
+for element_type, data in cyjs.iter_elements(args.cyjs):
+	if element_type == 'node':
+		n_nodes += 1
+	else:
+		edges.append((data['target'], data['source_motif'], data['count']))
+
+sys.stdout.write('Read network with %d nodes and %d edges\n' % (n_nodes, len(edges)))
 
 ###################################################################################################################################################################################
 
 # Create count matrix
-motifs = set()
-gene_motif_count = dict()
-
-for source, target, metadata in grn.edges(data = True):
-	motif_id = metadata['source_motif']
-	count = int(metadata['count'])
-
-	motifs.add(motif_id)
-
-	# Check if target gene is already in count table
-	if target not in gene_motif_count:
-		gene_motif_count[target] = dict()
-
-	gene_motif_count[target][motif_id] = count
+matrix = count_matrix.from_edges(edges)
 
 ###################################################################################################################################################################################
 
 # Write output file
-out = open(args.out, 'w')
-
-# Write file header
-motifs = sorted(motifs)
-out.write('Motif\t%s\n' % '\t'.join(motifs))
-
-for gene_id in sorted(gene_motif_count):
-	out.write(gene_id)
-
-	for motif_id in motifs:
-		if motif_id in gene_motif_count[gene_id]:
-			count = gene_motif_count[gene_id][motif_id]
-		else:
-			count = 0
-
-		out.write('\t%d' % count)
-
-	out.write('\n')
+matrix_format = args.F if args.F else count_matrix.guess_format(args.out, check_header = False)
+count_matrix.write(matrix, args.out, matrix_format)
 
-out.close()
+sys.stdout.write('Wrote %d x %d count matrix (%d non-zero entries) to %s\n' % (len(matrix.genes), len(matrix.motifs), len(matrix), args.out))
 
 ###################################################################################################################################################################################
\ No newline at end of file
@@ -0,0 +1,29 @@
+#!/usr/bin/env python
+from grn import query
+import argparse
+import sys
+import os
+
+###################################################################################################################################################################################
+
+# Read command-line arguments
+parser = argparse.ArgumentParser(description = 'Compile a GRN into an indexed database for fast module queries')
+parser.add_argument('cyjs', type = str, help = 'Cytoscape JSON file of the GRN')
+parser.add_argument('out', type = str, help = 'Output file (SQLite database)')
+
+args = parser.parse_args()
+
+###################################################################################################################################################################################
+
+# Replace any existing index
+if os.path.exists(args.out):
+	os.remove(args.out)
+
+connection = query.compile_index(args.cyjs, args.out)
+grn = query.GRNIndex(connection)
+
+sys.stdout.write('Indexed network with %d nodes and %d edges (%d motifs) in %s\n' % (grn.number_of_nodes(), grn.number_of_edges(), len(grn.motifs()), args.out))
+
+connection.close()
+
+###################################################################################################################################################################################
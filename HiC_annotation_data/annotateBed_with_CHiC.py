@@ -1,140 +1,149 @@
 #!/usr/bin/env python
-from numpy import random
-import pybedtools as pb
+import multiprocessing
 import argparse
 import sys
 import os
 
+# Shared modules live in the directory above this script
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from grn import intervals
+from grn import annotate
+from grn import profiling
+
 #############################################################################################################################################################################################
 
 parser = argparse.ArgumentParser(description = 'Annotate a BED file to an associated gene using CHiC data')
 parser.add_argument('bed', type = str, help = 'BED file to annotate')
-parser.add_argument('chic', type = str, help = 'BED file of CHiC interactions. Target gene should be 5th column')
+parser.add_argument('chic', type = str, nargs = '+', help = 'BED file of CHiC interactions. Target gene should be 5th column. With several files (e.g. one per cell type), every peak is annotated in each of them and with a consensus gene')
 parser.add_argument('out', type = str, help = 'Output file')
 parser.add_argument('-g', '--genome', dest = 'g', type = str, default = 'hg38', help = 'Genome version to use with Homer (for sites with no CHiC annotation). Default = hg38')
 parser.add_argument('-d', '--dist', dest = 'd', type = int, default = 200000, help = 'Maximum distance between peak and target gene (for sites with no CHiC annotation). Default = 200000')
+parser.add_argument('-t', '--tss', dest = 't', type = str, required = False, help = 'BED file of gene TSSs (gene ID in 4th column, optional strand in 6th column). Sites with no CHiC annotation are assigned to the nearest TSS in this file instead of using Homer')
+parser.add_argument('-j', '--jobs', dest = 'j', type = int, default = 1, help = 'Number of chromosomes to annotate in parallel. Default = 1')
+parser.add_argument('-n', '--names', dest = 'n', type = str, nargs = '+', required = False, help = 'Cell type names for several CHiC files, in the same order. Default: the first part of each file name (e.g. CD34)')
 
-args = parser.parse_args()
-
-#############################################################################################################################################################################################
-
-# Read CHiC annotations
-chic_annotated_bed = list()
-
-with open(args.chic, 'r') as chic:
-	for num,line in enumerate(chic):
-		if num == 0:
-			continue
+profiling.add_arguments(parser)
 
-		fields = line.strip().split('\t')
-
-		chrom = fields[0]
-		start = fields[1]
-		end = fields[2]
-		geneID = fields[4]
-
-		site = '\t'.join([chrom, start, end, geneID])
-		chic_annotated_bed.append(site)
-
-chic_annotated_bed = pb.BedTool(chic_annotated_bed).sort()
-sys.stderr.write('Read %d sites annotated by CHiC\n' % chic_annotated_bed.count())
-
-#############################################################################################################################################################################################
-
-# Read bed file and separate sites based on:
-# - Sites with a CHiC annotation
-# - Sites with no ChIC annotation
+args = parser.parse_args()
 
-bed = pb.BedTool(args.bed).sort()
-bed_with_CHiC = bed.intersect(chic_annotated_bed, wa = True, u = True)
-bed_without_CHiC = bed.intersect(chic_annotated_bed, v = True)
+if args.n and len(args.n) != len(args.chic):
+	parser.error('give one name (-n) for each CHiC file')
 
-perc_with_CHiC = bed_with_CHiC.count() / bed.count() * 100
-perc_without_CHiC = bed_without_CHiC.count() / bed.count() * 100
+by_cell_type = len(args.chic) > 1
+cell_types = args.n if args.n else annotate.cell_type_names(args.chic)
 
-sys.stderr.write('Read %d sites from %s\n' % (bed.count(), args.bed))
-sys.stderr.write('\t- %d (%.2f%%) of these could be annoted by CHiC\n' % (bed_with_CHiC.count(), perc_with_CHiC))
-sys.stderr.write('\t- %d (%.2f%%) of these could not be annoted by CHiC\n' % (bed_without_CHiC.count(), perc_without_CHiC))
+profiler = profiling.from_args(args)
+profiler.start()
 
 #############################################################################################################################################################################################
 
-# Sites annotated by CHiC
-# Extract CHiC annotated gene from CHiC annotation
-
-bed_with_CHiC = bed_with_CHiC.intersect(chic_annotated_bed, wo = True)
-annotated_peaks = dict()
-
-for site in bed_with_CHiC:
-	chrom = site[0]
-	start = site[1]
-	end = site[2]
-	geneID = site[6]
+# Read CHiC annotations
+# These are read from a pre-sorted binary cache next to each CHiC file, which is (re)built if it is missing or out of date
+chic_sets = list()
 
-	peak = '%s\t%s\t%s' % (chrom, start, end)
+with profiler.stage('load_chic'):
+	for chic_file, cell_type in zip(args.chic, cell_types):
+		chic_sets.append(annotate.load_chic(chic_file)[0])
 
-	annotated_peaks[peak] = geneID
+		if by_cell_type:
+			sys.stderr.write('Read %d sites annotated by CHiC in %s\n' % (len(chic_sets[-1]), cell_type))
+		else:
+			sys.stderr.write('Read %d sites annotated by CHiC\n' % len(chic_sets[-1]))
 
 #############################################################################################################################################################################################
 
-# Sites that cannot be annotated by CHiC
-# Write sites as a bed file and use Homer's annotatePeaks.pl to find closest gene
-
-sys.stderr.write('\nAnnotating remaining peaks with Homer\n')
-
-bed_tmp_file = 'tmp.%d' % int(random.randint(1e6))
-homer_tmp_output = 'tmp.%d' % int(random.randint(1e6))
-
-bed_without_CHiC.saveas(bed_tmp_file)
-
-homer = 'annotatePeaks.pl %s %s -noann > %s' % (bed_tmp_file, args.g, homer_tmp_output)
-os.system(homer)
-
-annotated_count = 0
-
-with open(homer_tmp_output, 'r') as homer:
-	for num,line in enumerate(homer):
-		if num == 0:
-			continue
-
-		fields = line.strip().split('\t')
-
-		chrom = fields[1]
-		start = int(fields[2])
-		end = int(fields[3])
-
-		try:
-			dist_to_tss = abs(int(fields[9]))
-		except:
-			dist_to_tss = args.d + 1
-
-		if dist_to_tss <= args.d:
-
-			if len(fields) == 19:
-				geneID = fields[15]
-			else:
-				continue
-
-			peak = '%s\t%d\t%d' % (chrom, start - 1, end) # Homer automatically adds 1 to every start position - remove this
-			annotated_peaks[peak] = geneID
-			annotated_count = annotated_count + 1
+# Read bed file and annotate sites:
+# - Sites with a CHiC annotation are assigned to the CHiC target gene
+# - Sites with no ChIC annotation are assigned to the closest gene, using a local TSS file or Homer's annotatePeaks.pl
+# With several CHiC files, the sites are annotated in every cell type at once and assigned to the gene found in most cell types.
+# Only sites with no CHiC annotation in any cell type are assigned to the closest gene
+# With -j, the sites are split by chromosome and the CHiC annotation of each chromosome is done in a separate process
+
+with profiler.stage('read_peaks'):
+	bed = intervals.read_bed(args.bed).sort()
+	tss = annotate.read_tss(args.t) if args.t else None
+
+n_sites = len(bed)
+sys.stderr.write('Read %d sites from %s\n' % (n_sites, args.bed))
+
+if args.t:
+	sys.stderr.write('Annotating sites with no CHiC annotation with nearest TSS in %s\n' % args.t)
+else:
+	sys.stderr.write('Annotating sites with no CHiC annotation with Homer\n')
+
+# With -j, the CHiC step (chic_genes, or cell_type_chic_genes with several CHiC files) is run for each chromosome in a separate process, and the
+# results are merged in chromosome order (the order of the sorted sites). The nearest gene step is then run once for the sites of all chromosomes,
+# so Homer is only started once
+chic_function = annotate.cell_type_chic_genes if by_cell_type else annotate.chic_genes
+
+with profiler.stage('annotate'):
+	if args.j > 1 and n_sites > 0:
+		shards = annotate.chromosome_shards(bed, *chic_sets)
+		sys.stderr.write('Annotating %d chromosomes with %d processes\n' % (len(shards), args.j))
+
+		# Submit the largest chromosomes first, but merge the results in chromosome order
+		pool = multiprocessing.Pool(args.j)
+		pending = dict((shard[0], pool.apply_async(chic_function, (shard[1], list(shard[2:])) if by_cell_type else shard[1:3])) for shard in sorted(shards, key = lambda shard: -len(shard[1])))
+		pool.close()
+
+		results = list()
+
+		for shard in profiler.progress(shards, 'Annotating chromosomes'):
+			results.append(pending[shard[0]].get())
+			profiler.count('chromosomes', shard[0], peaks = len(shard[1]))
+
+		pool.join()
+
+		if by_cell_type:
+			targets, consensus, support = annotate.merge_chic_shards(results)
+			annotated_bed, keep, n_with_CHiC, annotated_count = annotate.add_nearest_genes(bed, consensus, support > 0, tss, args.d, args.g, profiler = profiler)
+			cell_type_genes, support = targets[:, keep].T, support[keep]
+		else:
+			genes, has_chic = annotate.merge_chic_shards(results)
+			annotated_bed, keep, n_with_CHiC, annotated_count = annotate.add_nearest_genes(bed, genes, has_chic, tss, args.d, args.g, profiler = profiler)
+	elif by_cell_type:
+		annotated_bed, cell_type_genes, support, n_with_CHiC, annotated_count = annotate.annotate_peaks_by_cell_type(bed, chic_sets, tss, args.d, args.g, profiler = profiler)
+	else:
+		annotated_bed, n_with_CHiC, annotated_count = annotate.annotate_peaks(bed, chic_sets[0], tss, args.d, args.g, profiler = profiler)
+
+n_without_CHiC = n_sites - n_with_CHiC
+
+perc_with_CHiC = n_with_CHiC / n_sites * 100
+perc_without_CHiC = n_without_CHiC / n_sites * 100
+
+if by_cell_type:
+	sys.stderr.write('\t- %d (%.2f%%) of these could be annoted by CHiC in at least one cell type\n' % (n_with_CHiC, perc_with_CHiC))
+	sys.stderr.write('\t- %d (%.2f%%) of these could not be annoted by CHiC in any cell type\n' % (n_without_CHiC, perc_without_CHiC))
+else:
+	sys.stderr.write('\t- %d (%.2f%%) of these could be annoted by CHiC\n' % (n_with_CHiC, perc_with_CHiC))
+	sys.stderr.write('\t- %d (%.2f%%) of these could not be annoted by CHiC\n' % (n_without_CHiC, perc_without_CHiC))
 
 sys.stderr.write('Successfully annotated %d sites to closest gene within %d bp\n' % (annotated_count, args.d))
 
-os.remove(bed_tmp_file)
-os.remove(homer_tmp_output)
-
 #############################################################################################################################################################################################
 
-# Convert annotated peak table back to a BED file and write to output
+# Write annotated sites (sorted by position) to output
+# With several CHiC files, the consensus gene (4th column) is followed by the number of cell types assigning it (0 for the closest gene) and the CHiC
+# target gene in every cell type ('.' if none), under a header line naming the cell types
+
+with profiler.stage('write'):
+	with open(args.out, 'w') as out:
+		if by_cell_type:
+			out.write('#chrom\tstart\tend\tgene\tcell_types\t%s\n' % '\t'.join(cell_types))
 
-annotated_bed = []
+			for chrom, start, end, geneID, n_cell_types, genes in zip(annotated_bed.chroms, annotated_bed.starts, annotated_bed.ends, annotated_bed.names, support.tolist(), cell_type_genes.tolist()):
+				out.write('%s\t%d\t%d\t%s\t%d\t%s\n' % (chrom, start, end, geneID, n_cell_types, '\t'.join(gene if gene else '.' for gene in genes)))
+		else:
+			for chrom, start, end, geneID in zip(annotated_bed.chroms, annotated_bed.starts, annotated_bed.ends, annotated_bed.names):
+				out.write('%s\t%d\t%d\t%s\n' % (chrom, start, end, geneID))
 
-for site in annotated_peaks:
-	annotated_bed.append('%s\t%s' % (site, annotated_peaks[site]))
+sys.stderr.write('Wrote %d annotated peaks to %s\n' % (len(annotated_bed), args.out))
 
-annotated_bed = pb.BedTool(annotated_bed).sort()
-annotated_bed.saveas(args.out)
+if by_cell_type:
+	for cell_type, n_annotated in zip(cell_types, (cell_type_genes != '').sum(axis = 0).tolist()):
+		sys.stderr.write('\t- %d annotated by CHiC in %s\n' % (n_annotated, cell_type))
 
-sys.stderr.write('Wrote %d annotated peaks to %s\n' % (annotated_bed.count(), args.out))
+profiler.finish()
 
 #############################################################################################################################################################################################
@@ -0,0 +1,169 @@
+#!/usr/bin/env python
+import argparse
+import numpy
+import json
+import sys
+import os
+
+###################################################################################################################################################################################
+
+# Generate a synthetic data set for the benchmarks
+# Peaks, motif positions, motif PWMs, gene TSSs, expression, TF annotation, footprints and CHiC interactions are drawn at random (from a fixed seed)
+# on chromosomes with the hg38 chromosome sizes, so the data has a realistic density at genome scale
+
+parser = argparse.ArgumentParser(description = 'Generate a synthetic data set for benchmarking')
+parser.add_argument('out', type = str, help = 'Output directory')
+parser.add_argument('-p', '--peaks', dest = 'p', type = int, default = 10000, help = 'Number of peaks. Default = 10000')
+parser.add_argument('-n', '--motifs', dest = 'n', type = int, default = 80, help = 'Number of motifs. Default = 80')
+parser.add_argument('-g', '--genes', dest = 'g', type = int, default = 20000, help = 'Number of genes. Default = 20000')
+parser.add_argument('-c', '--chic', dest = 'c', type = int, required = False, help = 'Number of CHiC interactions. Default = 2 x number of peaks')
+parser.add_argument('-r', '--rate', dest = 'r', type = float, default = 0.1, help = 'Mean number of sites of each motif per peak. Default = 0.1')
+parser.add_argument('-s', '--seed', dest = 's', type = int, default = 1, help = 'Random seed. Default = 1')
+
+args = parser.parse_args()
+
+###################################################################################################################################################################################
+
+CHROM_SIZES = [('chr1', 248956422), ('chr2', 242193529), ('chr3', 198295559), ('chr4', 190214555), ('chr5', 181538259), ('chr6', 170805979), ('chr7', 159345973),
+	('chr8', 145138636), ('chr9', 138394717), ('chr10', 133797422), ('chr11', 135086622), ('chr12', 133275309), ('chr13', 114364328), ('chr14', 107043718),
+	('chr15', 101991189), ('chr16', 90338345), ('chr17', 83257441), ('chr18', 80373285), ('chr19', 58617616), ('chr20', 64444167), ('chr21', 46709983),
+	('chr22', 50818468), ('chrX', 156040895)]
+
+PEAK_WIDTH = 400
+MOTIF_WIDTH = 10
+FOOTPRINT_WIDTH = 20
+CHIC_WIDTH = 5000
+
+random = numpy.random.RandomState(args.s)
+chrom_names = numpy.array([chrom for chrom, size in CHROM_SIZES])
+chrom_sizes = numpy.array([size for chrom, size in CHROM_SIZES], dtype = numpy.int64)
+
+def random_positions(n, width):
+	# n random (chromosome index, start) pairs, uniform over the genome, sorted by position
+	chroms = random.choice(len(chrom_sizes), n, p = chrom_sizes / chrom_sizes.sum())
+	starts = (random.random_sample(n) * (chrom_sizes[chroms] - width)).astype(numpy.int64)
+	order = numpy.lexsort((starts, chrom_names[chroms]))
+
+	return chroms[order], starts[order]
+
+def write_bed(filename, chroms, starts, ends, *columns):
+	names = chrom_names[chroms]
+
+	with open(filename, 'w') as out:
+		for fields in zip(names, starts.tolist(), ends.tolist(), *columns):
+			out.write('\t'.join(map(str, fields)) + '\n')
+
+if not os.path.exists(args.out):
+	os.makedirs(args.out)
+
+###################################################################################################################################################################################
+
+# Genes: random TSSs and strands
+gene_chroms, gene_tss = random_positions(args.g, 1)
+gene_names = numpy.array(['GENE%06d' % i for i in range(args.g)])
+gene_strands = random.choice(['+', '-'], args.g)
+
+write_bed(os.path.join(args.out, 'tss.bed'), gene_chroms, gene_tss, gene_tss + 1, gene_names, numpy.zeros(args.g, dtype = int), gene_strands)
+
+# Expression: log-normal values, with a fifth of the genes not expressed
+expression = numpy.round(random.lognormal(1, 1.5, args.g), 4)
+expression[random.random_sample(args.g) < 0.2] = 0
+
+with open(os.path.join(args.out, 'expression.tsv'), 'w') as out:
+	out.write('geneID\tsample\n')
+
+	for gene, value in zip(gene_names, expression):
+		out.write('%s\t%s\n' % (gene, value))
+
+# TF annotation: one to three (randomly chosen) TF genes for every motif
+motif_names = numpy.array(['MOTIF%03d' % i for i in range(args.n)])
+tf_genes = random.permutation(args.g)
+
+with open(os.path.join(args.out, 'tf_annotation.tsv'), 'w') as out:
+	out.write('Name\tmotif family\n')
+	n_tfs = 0
+
+	for motif in motif_names:
+		for i in range(random.randint(1, 4)):
+			out.write('%s\t%s\n' % (gene_names[tf_genes[n_tfs % args.g]], motif))
+			n_tfs += 1
+
+###################################################################################################################################################################################
+
+# Peaks, annotated with their nearest gene
+peak_chroms, peak_starts = random_positions(args.p, PEAK_WIDTH)
+peak_ends = peak_starts + PEAK_WIDTH
+
+gene_keys = gene_chroms * 2 ** 32 + gene_tss
+gene_order = numpy.argsort(gene_keys)
+peak_keys = peak_chroms * 2 ** 32 + peak_starts + PEAK_WIDTH // 2
+
+after = numpy.minimum(numpy.searchsorted(gene_keys[gene_order], peak_keys), args.g - 1)
+before = numpy.maximum(after - 1, 0)
+nearest = numpy.where(numpy.abs(gene_keys[gene_order][after] - peak_keys) < numpy.abs(gene_keys[gene_order][before] - peak_keys), after, before)
+peak_genes = gene_names[gene_order][nearest]
+
+write_bed(os.path.join(args.out, 'peaks.bed'), peak_chroms, peak_starts, peak_ends)
+write_bed(os.path.join(args.out, 'peaks_annotated.bed'), peak_chroms, peak_starts, peak_ends, peak_genes)
+
+# Footprints: two per peak
+footprint_peaks = numpy.repeat(numpy.arange(args.p), 2)
+footprint_starts = peak_starts[footprint_peaks] + random.randint(0, PEAK_WIDTH - FOOTPRINT_WIDTH, len(footprint_peaks))
+order = numpy.lexsort((footprint_starts, chrom_names[peak_chroms[footprint_peaks]]))
+
+write_bed(os.path.join(args.out, 'footprints.bed'), peak_chroms[footprint_peaks][order], footprint_starts[order], footprint_starts[order] + FOOTPRINT_WIDTH)
+
+# CHiC interactions: bait fragments near a gene, with the gene in the 5th column (the first line is a header)
+n_chic = args.c if args.c is not None else 2 * args.p
+chic_chroms, chic_starts = random_positions(n_chic, CHIC_WIDTH)
+chic_genes = gene_names[random.randint(0, args.g, n_chic)]
+
+with open(os.path.join(args.out, 'chic.bed'), 'w') as out:
+	out.write('chrom\tstart\tend\tbait\tgene\n')
+
+	for i in range(n_chic):
+		out.write('%s\t%d\t%d\t%s\t%s\n' % (chrom_names[chic_chroms[i]], chic_starts[i], chic_starts[i] + CHIC_WIDTH, chic_genes[i], chic_genes[i]))
+
+###################################################################################################################################################################################
+
+# Motifs: a random PWM in Homer format and a BED file of sites for every motif
+# Sites fall inside peaks (a Poisson number per peak) and, as many again, at random positions elsewhere in the genome
+motif_dir = os.path.join(args.out, 'motifs')
+bed_dir = os.path.join(args.out, 'motif_BED_files')
+
+for directory in (motif_dir, bed_dir):
+	if not os.path.exists(directory):
+		os.makedirs(directory)
+
+for motif in motif_names:
+	pwm = random.dirichlet(numpy.ones(4) * 0.5, random.randint(8, 13))
+
+	with open(os.path.join(motif_dir, '%s.motif' % motif), 'w') as out:
+		out.write('>%s\t%s\t%.6f\n' % (''.join('ACGT'[i] for i in pwm.argmax(axis = 1)), motif, numpy.log(pwm.max(axis = 1) / 0.25).sum() * 0.7))
+
+		for row in pwm:
+			out.write('\t'.join('%.3f' % value for value in row) + '\n')
+
+	sites_per_peak = random.poisson(args.r, args.p)
+	site_peaks = numpy.repeat(numpy.arange(args.p), sites_per_peak)
+	site_chroms = peak_chroms[site_peaks]
+	site_starts = peak_starts[site_peaks] + random.randint(0, PEAK_WIDTH - MOTIF_WIDTH, len(site_peaks))
+
+	background_chroms, background_starts = random_positions(len(site_peaks), MOTIF_WIDTH)
+	site_chroms = numpy.concatenate([site_chroms, background_chroms])
+	site_starts = numpy.concatenate([site_starts, background_starts])
+	order = numpy.lexsort((site_starts, chrom_names[site_chroms]))
+
+	write_bed(os.path.join(bed_dir, '%s.bed' % motif), site_chroms[order], site_starts[order], site_starts[order] + MOTIF_WIDTH)
+
+###################################################################################################################################################################################
+
+# Record the parameters, so benchmark results can be compared between runs at the same scale
+params = {'peaks': args.p, 'motifs': args.n, 'genes': args.g, 'chic': n_chic, 'rate': args.r, 'seed': args.s}
+
+with open(os.path.join(args.out, 'params.json'), 'w') as out:
+	json.dump(params, out, indent = 1, sort_keys = True)
+
+sys.stdout.write('Generated %d peaks, %d motifs, %d genes and %d CHiC interactions in %s\n' % (args.p, args.n, args.g, n_chic, args.out))
+
+###################################################################################################################################################################################
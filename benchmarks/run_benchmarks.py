@@ -0,0 +1,175 @@
+#!/usr/bin/env python
+import subprocess
+import argparse
+import platform
+import datetime
+import shutil
+import json
+import time
+import sys
+import os
+
+###################################################################################################################################################################################
+
+# Benchmark the command line tools on a synthetic data set (see generate_data.py)
+# Each stage is run as a separate process. Its wall time and peak resident set size (from os.wait4) are recorded and appended to a JSON history,
+# and compared with the previous run on a data set of the same scale, so that regressions show up early.
+# Homer is replaced by the stub in benchmarks/stub_homer, so the benchmarks measure this project's code rather than Homer.
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCHMARK_DIR)
+
+parser = argparse.ArgumentParser(description = 'Run the benchmark suite and record wall time and peak memory use of each stage')
+parser.add_argument('data', type = str, help = 'Data directory created by generate_data.py. Generated with -p/-n if it does not exist')
+parser.add_argument('-p', '--peaks', dest = 'p', type = int, default = 10000, help = 'Number of peaks when generating data. Default = 10000')
+parser.add_argument('-n', '--motifs', dest = 'n', type = int, default = 80, help = 'Number of motifs when generating data. Default = 80')
+parser.add_argument('-s', '--stages', dest = 's', type = str, nargs = '+', required = False, help = 'Only run these stages (default: all)')
+parser.add_argument('-o', '--history', dest = 'o', type = str, default = os.path.join(BENCHMARK_DIR, 'history.json'), help = 'JSON history file to append results to. Default = benchmarks/history.json')
+parser.add_argument('-l', '--label', dest = 'l', type = str, default = '', help = 'Label to record with the results')
+parser.add_argument('-t', '--threshold', dest = 't', type = float, default = 0.2, help = 'Relative increase in wall time or memory reported as a regression. Default = 0.2')
+parser.add_argument('--fail-on-regression', dest = 'fail', action = 'store_true', required = False, help = 'Exit with status 1 if a regression is found')
+
+args = parser.parse_args()
+
+###################################################################################################################################################################################
+
+def run_stage(command, env, log_file):
+	# Run a command and return (wall time in seconds, peak RSS in MB, exit status)
+	start_time = time.time()
+
+	with open(log_file, 'w') as log:
+		process = subprocess.Popen(command, stdout = log, stderr = subprocess.STDOUT, env = env, cwd = REPO_DIR)
+		pid, status, usage = os.wait4(process.pid, 0)
+
+	process.returncode = status
+	wall_time = time.time() - start_time
+
+	# ru_maxrss is in kilobytes on Linux and bytes on macOS
+	max_rss = usage.ru_maxrss / (2 ** 20 if sys.platform == 'darwin' else 2 ** 10)
+
+	return wall_time, max_rss, os.WEXITSTATUS(status) if os.WIFEXITED(status) else -1
+
+def git_commit():
+	try:
+		return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd = REPO_DIR, stderr = subprocess.DEVNULL).decode().strip()
+	except (OSError, subprocess.CalledProcessError):
+		return None
+
+###################################################################################################################################################################################
+
+# Generate data if needed
+data = os.path.abspath(args.data)
+
+if not os.path.exists(os.path.join(data, 'params.json')):
+	subprocess.check_call([sys.executable, os.path.join(BENCHMARK_DIR, 'generate_data.py'), data, '-p', str(args.p), '-n', str(args.n)])
+
+with open(os.path.join(data, 'params.json'), 'r') as params_file:
+	params = json.load(params_file)
+
+# Outputs are written to a work directory, which is cleared before a run of all stages
+# When only some stages are run, outputs of earlier runs (e.g. the network used by later stages) are reused
+work = os.path.join(data, 'work')
+
+if os.path.exists(work) and not args.s:
+	shutil.rmtree(work)
+
+if not os.path.exists(work):
+	os.mkdir(work)
+
+env = dict(os.environ)
+env['PATH'] = os.path.join(BENCHMARK_DIR, 'stub_homer') + os.pathsep + env.get('PATH', '')
+env['STUB_HOMER_TSS'] = os.path.join(data, 'tss.bed')
+
+def script(name):
+	return [sys.executable, os.path.join(REPO_DIR, name)]
+
+peaks = os.path.join(data, 'peaks_annotated.bed')
+motif_beds = os.path.join(data, 'motif_BED_files')
+exprs = os.path.join(data, 'expression.tsv')
+annot = os.path.join(data, 'tf_annotation.tsv')
+grn = os.path.join(work, 'grn.cyjs')
+
+# Stages, in the order they are run. Later stages use the network written by build
+STAGES = [
+	('findMotifs', script('findMotifs.py') + [os.path.join(data, 'peaks.bed'), os.path.join(data, 'motifs'), 'hg38', os.path.join(work, 'found_motifs')]),
+	('build', script('build_gene_regulatory_network.py') + [peaks, motif_beds, exprs, annot, grn]),
+	('build_all_genes', script('build_gene_regulatory_network.py') + [peaks, motif_beds, exprs, annot, os.path.join(work, 'grn_all.cyjs'), '-a']),
+	('build_footprints', script('build_gene_regulatory_network.py') + [peaks, motif_beds, exprs, annot, os.path.join(work, 'grn_footprints.cyjs'), '-f', os.path.join(data, 'footprints.bed'), '-C', os.path.join(work, 'footprint_cache')]),
+	('annotate_homer', script('HiC_annotation_data/annotateBed_with_CHiC.py') + [os.path.join(data, 'peaks.bed'), os.path.join(data, 'chic.bed'), os.path.join(work, 'annotated_homer.bed')]),
+	('annotate_tss', script('HiC_annotation_data/annotateBed_with_CHiC.py') + [os.path.join(data, 'peaks.bed'), os.path.join(data, 'chic.bed'), os.path.join(work, 'annotated_tss.bed'), '-t', os.path.join(data, 'tss.bed')]),
+	('GRN_to_countMatrix', script('GRN_to_countMatrix.py') + [grn, os.path.join(work, 'counts.tsv')]),
+	('countMatrix_to_GRN', script('countMatrix_to_GRN.py') + [os.path.join(work, 'counts.tsv'), exprs, annot, os.path.join(work, 'grn_from_counts.cyjs')]),
+	('extract_TF_module', script('extract_TF_module_from_GRN.py') + [grn, 'MOTIF000', os.path.join(work, 'module.txt')]),
+]
+
+stage_names = [name for name, command in STAGES]
+
+for name in args.s or []:
+	if name not in stage_names:
+		parser.error('unknown stage %s (choose from %s)' % (name, ', '.join(stage_names)))
+
+###################################################################################################################################################################################
+
+# Run the stages
+results = dict()
+
+for name, command in STAGES:
+	if args.s and name not in args.s:
+		continue
+
+	# findMotifs.py skips motifs that are already done, so always start it from an empty output directory
+	if name == 'findMotifs':
+		shutil.rmtree(os.path.join(work, 'found_motifs'), ignore_errors = True)
+
+	wall_time, max_rss, status = run_stage(command, env, os.path.join(work, '%s.log' % name))
+	results[name] = {'wall_time': round(wall_time, 3), 'max_rss_mb': round(max_rss, 1), 'exit_status': status}
+
+	sys.stdout.write('%-20s %10.2f s %10.1f MB%s\n' % (name, wall_time, max_rss, '' if status == 0 else '   FAILED (see %s)' % os.path.join(work, '%s.log' % name)))
+
+###################################################################################################################################################################################
+
+# Compare with the last run at the same scale and append to the history
+if os.path.exists(args.o):
+	with open(args.o, 'r') as history_file:
+		history = json.load(history_file)
+else:
+	history = list()
+
+previous = [run for run in history if run['params'] == params]
+regressions = list()
+
+if len(previous) > 0:
+	for name, result in results.items():
+		before = previous[-1]['stages'].get(name)
+
+		if before is None or before['exit_status'] != 0 or result['exit_status'] != 0:
+			continue
+
+		for measure in ('wall_time', 'max_rss_mb'):
+			if before[measure] > 0 and result[measure] > before[measure] * (1 + args.t):
+				regressions.append(name)
+				sys.stdout.write('Regression: %s %s %.2f -> %.2f (+%.0f%%)\n' % (name, measure, before[measure], result[measure], (result[measure] / before[measure] - 1) * 100))
+
+history.append({
+	'time': datetime.datetime.now().isoformat(timespec = 'seconds'),
+	'commit': git_commit(),
+	'label': args.l,
+	'host': platform.node(),
+	'python': platform.python_version(),
+	'params': params,
+	'stages': results,
+})
+
+tmp_file = '%s.tmp.%d' % (args.o, os.getpid())
+
+with open(tmp_file, 'w') as history_file:
+	json.dump(history, history_file, indent = 1)
+
+os.replace(tmp_file, args.o)
+
+sys.stdout.write('Recorded %d stages in %s\n' % (len(results), args.o))
+
+if args.fail and len(regressions) > 0:
+	sys.exit(1)
+
+###################################################################################################################################################################################
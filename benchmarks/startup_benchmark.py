@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+import subprocess
+import argparse
+import time
+import sys
+import os
+
+###################################################################################################################################################################################
+
+# Start-up benchmark for the command line (python -m grn <command>, see grn/cli.py)
+# Each command is run with --help, which imports everything the command imports at start-up and exits before any work is done.
+# The start-up time of a command is the median wall time of several runs less that of an empty Python process, and the modules it imports are
+# read from python -X importtime. Both are checked against the budget of the command: a time limit and heavy dependencies it must not import
+# at start-up (they are imported later, by the code that uses them). Exits with status 1 if a command is over its budget.
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCHMARK_DIR)
+
+HEAVY = ['networkx', 'pybedtools', 'scipy']
+
+# Command -> (start-up time budget in seconds, heavy modules allowed)
+# The network queries are pure Python; commands reading BED files or count matrices import numpy; analyze uses scipy sparse matrices throughout
+PURE_PYTHON = 0.15
+NUMPY = 0.6
+
+BUDGETS = {
+	'find-motifs': (NUMPY, []),
+	'pack-motifs': (NUMPY, []),
+	'index-bed': (NUMPY, []),
+	'annotate': (NUMPY, []),
+	'build': (NUMPY, []),
+	'build-batch': (NUMPY, []),
+	'update': (NUMPY, []),
+	'serve': (NUMPY, []),
+	'extract': (PURE_PYTHON, []),
+	'index': (PURE_PYTHON, []),
+	'analyze': (1.2, ['scipy']),
+	'compare': (NUMPY, []),
+	'to-matrix': (NUMPY, []),
+	'from-matrix': (NUMPY, []),
+}
+
+parser = argparse.ArgumentParser(description = 'Measure the start-up time and imports of every command and check them against a budget')
+parser.add_argument('-c', '--commands', dest = 'c', type = str, nargs = '+', required = False, help = 'Only check these commands (default: all)')
+parser.add_argument('-n', '--runs', dest = 'n', type = int, default = 5, help = 'Number of runs of each command. Default = 5')
+parser.add_argument('-f', '--factor', dest = 'f', type = float, default = 1.0, help = 'Multiply the time budgets by this factor (e.g. for slow machines). Default = 1')
+
+args = parser.parse_args()
+
+for command in args.c or []:
+	if command not in BUDGETS:
+		parser.error('unknown command %s (choose from %s)' % (command, ', '.join(sorted(BUDGETS))))
+
+###################################################################################################################################################################################
+
+def median_time(command, runs):
+	times = list()
+
+	for i in range(runs):
+		start_time = time.time()
+		subprocess.call(command, stdout = subprocess.DEVNULL, stderr = subprocess.DEVNULL, cwd = REPO_DIR)
+		times.append(time.time() - start_time)
+
+	return sorted(times)[len(times) // 2]
+
+def imported_modules(command):
+	# Names of the modules imported by a command, from the python -X importtime report on stderr
+	output = subprocess.run([sys.executable, '-X', 'importtime'] + command[1:], stdout = subprocess.DEVNULL, stderr = subprocess.PIPE, cwd = REPO_DIR).stderr.decode()
+	modules = set()
+
+	for line in output.splitlines():
+		if line.startswith('import time:') and '|' in line:
+			modules.add(line.rsplit('|', 1)[1].strip())
+
+	return modules
+
+###################################################################################################################################################################################
+
+interpreter = median_time([sys.executable, '-c', 'pass'], args.n)
+sys.stdout.write('Python start-up: %.3f s\n' % interpreter)
+
+over_budget = list()
+
+for command, (budget, allowed) in sorted(BUDGETS.items()):
+	if args.c and command not in args.c:
+		continue
+
+	cli_command = [sys.executable, '-m', 'grn', command, '--help']
+	startup = max(median_time(cli_command, args.n) - interpreter, 0)
+	heavy = sorted(module for module in HEAVY if module not in allowed and module in imported_modules(cli_command))
+	budget *= args.f
+
+	problems = list()
+
+	if startup > budget:
+		problems.append('over the budget of %.2f s' % budget)
+
+	if len(heavy) > 0:
+		problems.append('imports %s' % ', '.join(heavy))
+
+	if len(problems) > 0:
+		over_budget.append(command)
+
+	sys.stdout.write('%-14s %8.3f s   (budget %.2f s)%s\n' % (command, startup, budget, '   FAILED: %s' % '; '.join(problems) if problems else ''))
+
+if len(over_budget) > 0:
+	sys.stdout.write('%d commands over budget: %s\n' % (len(over_budget), ', '.join(over_budget)))
+	sys.exit(1)
+
+###################################################################################################################################################################################
@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+import numpy
+import zlib
+import sys
+import os
+
+###################################################################################################################################################################################
+
+# Stand-in for Homer's annotatePeaks.pl, used by the benchmarks so they can run without Homer installed
+# Only the two uses in this project are supported:
+#	annotatePeaks.pl <BED> <genome> -noann -m <motif file> -mbed <output BED>	writes random motif sites inside the peaks (with palindromic duplicates)
+#	annotatePeaks.pl <BED> <genome> -noann										writes a Homer annotation table assigning each peak to the nearest TSS in $STUB_HOMER_TSS
+# Output is deterministic for a given peak file and motif
+# Motifs named in $STUB_HOMER_FAIL (comma-separated) fail after writing part of their output, like an interrupted Homer job (used by the tests)
+
+SITE_RATE = 0.1
+MOTIF_WIDTH = 10
+
+def read_peaks(filename):
+	peaks = []
+
+	with open(filename, 'r') as bed:
+		for line in bed:
+			fields = line.rstrip('\r\n').split('\t')
+			peaks.append((fields[0], int(fields[1]), int(fields[2])))
+
+	return peaks
+
+def find_motifs(peaks, motif_file, mbed_file):
+	motif = os.path.basename(motif_file).replace('.motif', '')
+	random = numpy.random.RandomState(zlib.crc32(motif.encode()))
+
+	sites_per_peak = random.poisson(SITE_RATE, len(peaks))
+	palindromic = random.random_sample(len(peaks)) < 0.2
+
+	with open(mbed_file, 'w') as out:
+		for (chrom, start, end), n_sites, is_palindrome in zip(peaks, sites_per_peak, palindromic):
+			for site_start in random.randint(start, max(start + 1, end - MOTIF_WIDTH), n_sites):
+				out.write('%s\t%d\t%d\t%s\t8.000000\t+\n' % (chrom, site_start, site_start + MOTIF_WIDTH, motif))
+
+				if is_palindrome:
+					out.write('%s\t%d\t%d\t%s\t8.000000\t-\n' % (chrom, site_start, site_start + MOTIF_WIDTH, motif))
+
+def annotate(peaks):
+	tss = dict()
+
+	with open(os.environ['STUB_HOMER_TSS'], 'r') as tss_file:
+		for line in tss_file:
+			fields = line.rstrip('\r\n').split('\t')
+			tss.setdefault(fields[0], []).append((int(fields[1]), fields[3]))
+
+	for chrom in tss:
+		tss[chrom].sort()
+
+	chrom_positions = dict((chrom, numpy.array([position for position, gene in tss[chrom]])) for chrom in tss)
+
+	sys.stdout.write('\t'.join(['PeakID'] + ['Column%d' % i for i in range(1, 19)]) + '\n')
+
+	for i, (chrom, start, end) in enumerate(peaks):
+		if chrom not in tss:
+			continue
+
+		centre = (start + end) // 2
+		positions = chrom_positions[chrom]
+		j = min(numpy.searchsorted(positions, centre), len(positions) - 1)
+
+		if j > 0 and abs(positions[j - 1] - centre) <= abs(positions[j] - centre):
+			j -= 1
+
+		fields = ['Peak%d' % i, chrom, str(start + 1), str(end), '+'] + ['NA'] * 14
+		fields[9] = str(centre - positions[j])
+		fields[15] = tss[chrom][j][1]
+
+		sys.stdout.write('\t'.join(fields) + '\n')
+
+###################################################################################################################################################################################
+
+peaks = read_peaks(sys.argv[1])
+
+if '-mbed' in sys.argv:
+	motif_file = sys.argv[sys.argv.index('-m') + 1]
+	mbed_file = sys.argv[sys.argv.index('-mbed') + 1]
+
+	if os.path.basename(motif_file).replace('.motif', '') in os.environ.get('STUB_HOMER_FAIL', '').split(','):
+		find_motifs(peaks[:len(peaks) // 2], motif_file, mbed_file)
+		sys.exit(1)
+
+	find_motifs(peaks, motif_file, mbed_file)
+else:
+	annotate(peaks)
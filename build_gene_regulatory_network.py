@@ -1,10 +1,17 @@
 #!/usr/bin/env python
-import pybedtools as pb
-import networkx as nx
+from grn import footprint_cache
+from grn import cooccurrence
+from grn import significance
+from grn import intervals
+from grn import network
+from grn import store
+from grn import api
+from grn import cyjs
+from grn import profiling
 import argparse
-import json
+import numpy
+import time
 import sys
-import os
 
 ###################################################################################################################################################################################
 
@@ -18,143 +25,240 @@ parser.add_argument('out', type = str, help = 'Output file')
 parser.add_argument('-f', type = str, required = False, help = 'An optional BED file of DNaseI/ATAC-Seq footprints to filter motifs against')
 parser.add_argument('-a', action = 'store_true', required = False, help = 'Include all genes in the network - not just transcription factor genes. Default: False')
 parser.add_argument('-m', type = float, default = float(0), help = 'Minimum gene expression value for gene to include in the network. Default = 0')
+parser.add_argument('-b', '--bedtools', dest = 'b', action = 'store_true', required = False, help = 'Count motifs with pybedtools intersect instead of the built-in interval index (slower, for cross-checking). Default: False')
+parser.add_argument('-C', '--cache', dest = 'C', type = str, required = False, help = 'Directory for the cache of footprint-filtered motif positions (with -f). Default: footprint_cache in the motif directory')
+parser.add_argument('--cache-size', dest = 'cache_size', type = float, default = footprint_cache.MAX_CACHE_SIZE / 2 ** 20, help = 'Maximum size of the footprint cache in MB. Least recently used entries are deleted above this size. Default = %(default)d')
+parser.add_argument('-r', '--regions', dest = 'regions', type = str, required = False, help = 'BED file of regions (e.g. a locus panel). Only peaks overlapping these regions are used, and only their motif sites are read (through the index of bgzip-compressed, tabix-indexed motif and footprint files)')
+parser.add_argument('-P', '--provenance', dest = 'P', action = 'store_true', required = False, help = 'Record the peaks behind every edge in the network, so it can be updated with update_gene_regulatory_network.py. Default: False')
+parser.add_argument('-N', '--permutations', dest = 'N', type = int, default = 0, help = 'Number of permutations of a null model used to give every edge an empirical p-value and FDR. Default: 0 (no significance test, or %d with --fdr)' % significance.DEFAULT_PERMUTATIONS)
+parser.add_argument('--background', dest = 'background', type = str, required = False, help = 'BED file of background peaks (e.g. the union of ATAC-Seq peaks) to draw length-matched null peaks from. Default: shuffle motif sites within the peaks')
+parser.add_argument('--fdr', dest = 'fdr', type = float, required = False, help = 'Only keep edges with at most this FDR (implies a significance test)')
+parser.add_argument('-j', '--processes', dest = 'j', type = int, default = 1, help = 'Number of processes for the significance test. Default = 1')
+parser.add_argument('--seed', dest = 'seed', type = int, default = 0, help = 'Random seed for the significance test. Default = 0')
+parser.add_argument('--incidence', dest = 'incidence', type = str, required = False, help = 'Write the peak x motif matrix of motif counts to this file (any count matrix format, guessed from the extension)')
+parser.add_argument('--cooccurrence', dest = 'cooccurrence', type = str, required = False, help = 'Write the co-occurrence and enrichment of every pair of motifs found in the same peaks to this file')
+parser.add_argument('--combinatorial', dest = 'combinatorial', action = 'store_true', required = False, help = 'Add edges from combined source nodes (TF A+TF B) for enriched motif pairs to the genes with peaks containing both motifs. Default: False')
+parser.add_argument('--pair-fdr', dest = 'pair_fdr', type = float, default = 0.05, help = 'Maximum FDR of the co-occurrence of a motif pair for combinatorial edges. Default = 0.05')
+parser.add_argument('-S', '--score-cutoffs', dest = 'S', type = float, nargs = '+', required = False, help = 'Motif score cutoffs. Only motif sites with at least each score are counted, and one network is written for every cutoff (<out>_<cutoff>.cyjs). All cutoffs are counted in a single pass over the peaks. Needs motif files with scores (from findMotifs.py)')
+parser.add_argument('--pwm-dir', dest = 'pwm_dir', type = str, required = False, help = 'Directory of the Homer .motif files used to find the motifs. With this, score cutoffs are relative: multiples of the log-odds threshold of each motif (1 = the threshold used for the scan)')
+parser.add_argument('--cutoff-counts', dest = 'cutoff_counts', action = 'store_true', required = False, help = 'With score cutoffs, write a single network of the edges at the lowest cutoff, with the count at every cutoff as edge attributes (count_<cutoff>). Default: False')
+profiling.add_arguments(parser)
 
 args = parser.parse_args()
 
+if args.fdr is not None and args.N == 0:
+	args.N = significance.DEFAULT_PERMUTATIONS
+
+if args.b and args.P:
+	parser.error('peak provenance (-P) is not available with bedtools (-b)')
+
+if args.b and args.regions:
+	parser.error('region-restricted builds (--regions) are not available with bedtools (-b)')
+
+if args.b and args.N > 0:
+	parser.error('the significance test (-N/--fdr) is not available with bedtools (-b)')
+
+if args.b and (args.incidence or args.cooccurrence or args.combinatorial):
+	parser.error('motif co-occurrence (--incidence/--cooccurrence/--combinatorial) is not available with bedtools (-b)')
+
+if (args.pwm_dir or args.cutoff_counts) and not args.S:
+	parser.error('--pwm-dir and --cutoff-counts need score cutoffs (-S)')
+
+if args.S and (args.b or args.P or args.N > 0 or args.incidence or args.cooccurrence or args.combinatorial):
+	parser.error('score cutoffs (-S) cannot be combined with -b, -P, -N/--fdr or motif co-occurrence')
+
+if args.S and len(set(args.S)) != len(args.S):
+	parser.error('score cutoffs must be unique')
+
+# pybedtools is only needed to cross-check with bedtools
+if args.b:
+	import pybedtools as pb
+
+profiler = profiling.from_args(args)
+profiler.start()
+
 ###################################################################################################################################################################################
 
 # Read bed file of peaks from which to build the network
-peaks = pb.BedTool(args.bed).sort()
-sys.stdout.write('Read %d peaks from %s\n' % (peaks.count(), args.bed))
+with profiler.stage('read_peaks'):
+	if args.b:
+		peaks = pb.BedTool(args.bed).sort()
+		sys.stdout.write('Read %d peaks from %s\n' % (peaks.count(), args.bed))
+	else:
+		peaks = api.load_peaks(args.bed)
+		sys.stdout.write('Read %d peaks from %s\n' % (len(peaks), args.bed))
+
+		# In a region-restricted build, motifs (and footprints) are only read around the peaks in the regions
+		if args.regions:
+			peaks = api.peaks_in_regions(peaks, intervals.read_bed(args.regions))
+			sys.stdout.write('Kept %d peaks overlapping the regions in %s\n' % (len(peaks), args.regions))
+
+regions = peaks if args.regions else None
 
 ###################################################################################################################################################################################
 
 # Read motif bed files
+# Unless using bedtools, motifs are read from the binary motif store in the motif directory, which is (re)built if it is missing or out of date
 motif_positions = dict()
 
-for motif_bed_file in os.listdir(args.dir):
-	if not motif_bed_file.endswith('.bed'):
-		continue # Skip file if it has the wrong file extension
-
-	motif_id = motif_bed_file.replace('.bed', '')
-	motif_positions[motif_id] = pb.BedTool('%s/%s' % (args.dir, motif_bed_file))
+with profiler.stage('load_motifs'):
+	if args.b:
+		for motif_id, motif_bed_file in store.motif_bed_files(args.dir).items():
+			motif_positions[motif_id] = pb.BedTool(motif_bed_file)
+	else:
+		motif_positions = api.load_motifs(args.dir, log = sys.stdout, regions = regions)
 
 # Check if a footprint bed file is provided
 # Only keep motifs that occur in footprints
 if args.f:
-	footprints = pb.BedTool(args.f).sort()
+	with profiler.stage('filter_footprints'):
+		if args.b:
+			footprints = pb.BedTool(args.f).sort()
 
-	for motif_id in motif_positions:
-		motif_positions[motif_id] = motif_positions[motif_id].intersect(footprints, wa = True, u = True)
+			for motif_id in motif_positions:
+				motif_positions[motif_id] = motif_positions[motif_id].intersect(footprints, wa = True, u = True)
+		else:
+			motif_positions = api.filter_motifs(args.dir, motif_positions, args.f, args.C, args.cache_size * 2 ** 20, log = sys.stdout, regions = regions)
 
 sys.stdout.write('Read motif positions for %d motifs\n' % len(motif_positions))
 
 ###################################################################################################################################################################################
 
-# Read gene expression data
-gene_expression = dict()
-
-with open(args.exprs, 'r') as exprs:
-	for num,line in enumerate(exprs):
-		if num == 0:
-			continue # Skip first line
+with profiler.stage('read_expression'):
+	# Read gene expression data
+	gene_expression = api.load_expression(args.exprs, args.m)
 
-		gene_id, value = line.strip().split('\t')
-		value = float(value)
+	# Read TF annotation data
+	# For each motif, find the TF gene with the highest expression. Use this as the reference source node for that motif
+	tf_annotation = api.load_tf_annotation(args.annot)
+	motif_ref_gene, motif_associated_genes = api.select_reference_genes(tf_annotation, gene_expression, motif_positions)
 
-		if value >= args.m:
-			gene_expression[gene_id] = value
-
-# Read TF annotation data
-# For each motif, find the TF gene with the highest expression. Use this as the reference source node for that motif
-motif_associated_genes = []
-motif_ref_gene = dict()
+sys.stdout.write('Read gene expression and annotation data for %d TF genes and %d TF families\n' % (len(motif_associated_genes), len(motif_ref_gene)))
 
-with open(args.annot, 'r') as annot:
-	for num,line in enumerate(annot):
-		if num == 0:
-			continue # Skip first line
+# Score cutoffs of each motif, absolute or relative to the threshold in its .motif file
+if args.S:
+	motif_cutoffs = api.score_cutoffs(motif_ref_gene, args.S, args.pwm_dir)
+	cutoff_labels = ['%g' % cutoff for cutoff in args.S]
 
-		gene_id, motif_id = line.strip().split('\t')
+###################################################################################################################################################################################
 
-		if motif_id not in motif_positions:
-			continue # Skip if motif is not included in the motif bed file directory
+# Align motifs to peaks
+# Each motif yields a list of (gene ID, number of motifs) for the genes whose peaks contain that motif
+def bedtools_gene_hits():
+	for motif_id in motif_positions:
+		if motif_id not in motif_ref_gene:
+			continue
 
-		# Check gene is expressed
-		if gene_id in gene_expression:
-			value = gene_expression[gene_id]
-			motif_associated_genes.append(gene_id)
+		peaks_with_motif = peaks.intersect(motif_positions[motif_id], wo = True)
+		yield motif_id, [(hit[3], 1) for hit in peaks_with_motif]
 
-			# Check if motif has already been found
-			# If not, add it to the motif_ref_gene dictionary with an empty gene ID and -Inf expression value
-			if motif_id not in motif_ref_gene:
-				motif_ref_gene[motif_id] = ['', float('-inf')]
+# With provenance, the peaks behind each (motif, gene) pair are also recorded
+provenance = dict() if args.P else None
 
-			# Check if expression of gene is higher than the current motif reference gene. If yes, replace it
-			if value > motif_ref_gene[motif_id][1]:
-				motif_ref_gene[motif_id] = [gene_id, value]
+# For motif co-occurrence, the peaks hit by each motif are also recorded
+incidence = dict() if args.incidence or args.cooccurrence or args.combinatorial else None
 
-sys.stdout.write('Read gene expression and annotation data for %d TF genes and %d TF families\n' % (len(motif_associated_genes), len(motif_ref_gene)))
+def profiled_gene_hits(motif_gene_hits):
+	# Record the number of hits and the time taken to count them for each motif
+	n_motifs = len([motif_id for motif_id in motif_positions if motif_id in motif_ref_gene])
+	start_time = time.time()
 
-###################################################################################################################################################################################
+	for motif_id, gene_hits in profiler.progress(motif_gene_hits, 'Counting motifs', n_motifs):
+		profiler.count('motifs', motif_id, hits = sum(hit_count for gene_id, hit_count in gene_hits), elapsed = time.time() - start_time)
+		yield motif_id, gene_hits
+		start_time = time.time()
 
-# Build the GRN
-grn = nx.DiGraph()
+if args.b:
+	motif_gene_hits = bedtools_gene_hits()
+elif args.S:
+	# With score cutoffs, each motif yields a list of gene hits for every cutoff
+	motif_gene_hits = api.motif_gene_hits_by_cutoff(peaks, motif_positions, motif_cutoffs, motif_ref_gene)
+else:
+	motif_gene_hits = api.motif_gene_hits(peaks, motif_positions, motif_ref_gene, provenance, incidence)
 
-for motif_id in motif_positions:
-	if motif_id not in motif_ref_gene:
-		continue # Skip if motif has no annotation data
+if profiler.enabled and not args.S:
+	motif_gene_hits = profiled_gene_hits(motif_gene_hits)
 
-	source_node, source_node_exprs = motif_ref_gene[motif_id]
+###################################################################################################################################################################################
 
-	# Align motif to peaks and count the number of motifs associated with each gene
-	peaks_with_motif = peaks.intersect(motif_positions[motif_id], wo = True)
-	gene_motif_count = dict()
+# Test the significance of every edge against a permutation null model
+# The motif counts are needed for all edges before the network is written, so motifs are counted here rather than while the graph is built
+edge_significance = None
 
-	for hit in peaks_with_motif:
-		gene_id = hit[3]
+if args.N > 0:
+	with profiler.stage('count_motifs'):
+		motif_gene_hits = list(motif_gene_hits)
 
-		# Unless the full GRN has been requested, skip gene if not a TF
-		if not args.a and gene_id not in motif_associated_genes:
-			continue
+	with profiler.stage('significance'):
+		background = intervals.read_bed(args.background) if args.background else None
+		tf_genes = None if args.a else set(motif_associated_genes)
 
-		# Skip if gene is not expressed
-		if gene_id not in gene_expression:
-			continue
+		edge_significance = significance.edge_significance(motif_gene_hits, motif_ref_gene, gene_expression, tf_genes, peaks, motif_positions, args.N, background, args.j, args.seed, args.fdr)
 
-		# Check if gene already count and add if not
-		if gene_id not in gene_motif_count:
-			gene_motif_count[gene_id] = 0
+	if args.fdr is not None:
+		sys.stdout.write('Tested edges with %d permutations. Kept %d edges with FDR <= %g\n' % (args.N, len(edge_significance), args.fdr))
+	else:
+		sys.stdout.write('Tested %d edges with %d permutations\n' % (len(edge_significance), args.N))
 
-		gene_motif_count[gene_id] += 1
+###################################################################################################################################################################################
 
-	# Create nodes/edges
-	for target_node in gene_motif_count:
-		# Check if source and target nodes are already present in GRN. Add them if not
-		if not grn.has_node(source_node):
-			grn.add_node(source_node, expression = source_node_exprs)
+# Build the GRN
+# Unless the full GRN has been requested, only TF genes are included as targets
+# Motifs are counted as the graph is built, so the build_graph stage includes motif counting
+# With score cutoffs, motifs are counted at every cutoff first, then one network is built for each cutoff (or a single network with the count at every cutoff)
+if not args.S:
+	with profiler.stage('build_graph'):
+		grn = network.build_graph(motif_gene_hits, motif_ref_gene, gene_expression, None if args.a else set(motif_associated_genes), cyjs.CyjsWriter(cyjs.cyjs_filename(args.out)), provenance, profiler, edge_significance)
+
+	sys.stdout.write('Built network with %d nodes and %d edges\n' % (grn.number_of_nodes(), grn.number_of_edges()))
+else:
+	with profiler.stage('count_motifs'):
+		motif_cutoff_hits = list(motif_gene_hits)
+
+	with profiler.stage('build_graph'):
+		if args.cutoff_counts:
+			# Edges at the lowest cutoff include the edges at every other cutoff
+			lowest = int(numpy.argmin(args.S))
+			cutoff_hits = dict((motif_id, list(zip(cutoff_labels, hits))) for motif_id, hits in motif_cutoff_hits)
+
+			grn = network.build_graph(((motif_id, hits[lowest]) for motif_id, hits in motif_cutoff_hits), motif_ref_gene, gene_expression, None if args.a else set(motif_associated_genes), cyjs.CyjsWriter(cyjs.cyjs_filename(args.out)), profiler = profiler, cutoff_hits = cutoff_hits)
+			sys.stdout.write('Built network with %d nodes and %d edges with counts at %d score cutoffs\n' % (grn.number_of_nodes(), grn.number_of_edges(), len(args.S)))
+		else:
+			out_base = args.out[:-len('.cyjs')] if args.out.endswith('.cyjs') else args.out
+
+			for k, label in enumerate(cutoff_labels):
+				cutoff_grn = network.build_graph(((motif_id, hits[k]) for motif_id, hits in motif_cutoff_hits), motif_ref_gene, gene_expression, None if args.a else set(motif_associated_genes), cyjs.CyjsWriter(cyjs.cyjs_filename('%s_%s' % (out_base, label))))
+				sys.stdout.write('Built network with %d nodes and %d edges for score cutoff %s: %s\n' % (cutoff_grn.number_of_nodes(), cutoff_grn.number_of_edges(), label, cutoff_grn.close()))
+
+			grn = None
 
-		if not grn.has_node(target_node):
-			target_node_exprs = gene_expression[target_node]
-			grn.add_node(target_node, expression = target_node_exprs)
+###################################################################################################################################################################################
 
-		grn.add_edge(source_node, target_node, count = gene_motif_count[target_node], source_motif = motif_id)
+# Motif co-occurrence
+# The peak x motif incidence matrix is built from the motif counts of each peak recorded above, so peaks and motifs are only read once
+if incidence is not None:
+	with profiler.stage('cooccurrence'):
+		motif_ids, M = cooccurrence.incidence_matrix(len(peaks), incidence)
+		sys.stdout.write('Built %d x %d peak x motif incidence matrix (%d non-zero entries)\n' % (M.shape[0], M.shape[1], M.nnz))
 
-sys.stdout.write('Built network with %d nodes and %d edges\n' % (grn.number_of_nodes(), grn.number_of_edges()))
+		if args.incidence:
+			cooccurrence.write_incidence(args.incidence, peaks, motif_ids, M)
 
-###################################################################################################################################################################################
+		pairs = cooccurrence.cooccurrence(M, peaks.ends - peaks.starts)
 
-# Write network as a Cytoscape JSON file
-cytoscape = nx.cytoscape_data(grn)
+		if args.cooccurrence:
+			cooccurrence.write_cooccurrence(args.cooccurrence, motif_ids, pairs)
+			sys.stdout.write('Wrote co-occurrence of %d motif pairs to %s\n' % (len(pairs), args.cooccurrence))
 
-# Ensure output file has correct file extension
-outfile = args.out
+		if args.combinatorial:
+			n_pairs = cooccurrence.add_combinatorial_edges(grn, peaks, motif_ids, M, pairs, motif_ref_gene, gene_expression, None if args.a else set(motif_associated_genes), args.pair_fdr)
+			sys.stdout.write('Added combinatorial edges for %d motif pairs. Network has %d nodes and %d edges\n' % (n_pairs, grn.number_of_nodes(), grn.number_of_edges()))
 
-if not outfile.endswith('.cyjs'):
-	outfile = outfile + '.cyjs'
+# Finish writing the Cytoscape JSON file
+if grn is not None:
+	with profiler.stage('write_cyjs'):
+		grn.close()
 
-out = open(outfile, 'w')
-json.dump(cytoscape, out)
-out.close()
+profiler.finish()
 
 ###################################################################################################################################################################################
\ No newline at end of file
@@ -0,0 +1,162 @@
+#!/usr/bin/env python
+from grn import intervals
+from grn import cyjs
+from grn import network
+from grn import footprint_cache
+from grn import api
+import argparse
+import numpy
+import sys
+import os
+
+###################################################################################################################################################################################
+
+# Read command line arguments
+parser = argparse.ArgumentParser(description = 'Build Gene Regulatory Networks for many combinations of peak sets and expression samples in one run')
+parser.add_argument('dir', type = str, help = 'Directory of BED files with the genomic coordinates for each TF motif to inlclude in the GRN')
+parser.add_argument('annot', type = str, help = 'Transcription Factor (TF) annotation file with gene ID and name of the motif it can bind to')
+parser.add_argument('out', type = str, help = 'Output directory')
+parser.add_argument('-p', '--peaks', dest = 'p', type = str, nargs = '+', default = [], help = 'Annotated BED files of peaks (with associated gene ID in 4th column). A network is built for every peak file and expression sample')
+parser.add_argument('-e', '--exprs', dest = 'e', type = str, nargs = '+', default = [], help = 'Gene expression files with gene ID (1st column) and one or more expression columns. Each column is treated as a sample')
+parser.add_argument('-M', '--manifest', dest = 'M', type = str, required = False, help = 'Tab-delimited manifest with a header line and columns: name, peak BED file, expression file and (optionally) expression column. Used instead of -p/-e')
+parser.add_argument('-f', type = str, required = False, help = 'An optional BED file of DNaseI/ATAC-Seq footprints to filter motifs against')
+parser.add_argument('-C', '--cache', dest = 'C', type = str, required = False, help = 'Directory for the cache of footprint-filtered motif positions (with -f). Default: footprint_cache in the motif directory')
+parser.add_argument('--cache-size', dest = 'cache_size', type = float, default = footprint_cache.MAX_CACHE_SIZE / 2 ** 20, help = 'Maximum size of the footprint cache in MB. Least recently used entries are deleted above this size. Default = %(default)d')
+parser.add_argument('-a', action = 'store_true', required = False, help = 'Include all genes in the network - not just transcription factor genes. Default: False')
+parser.add_argument('-m', type = float, default = float(0), help = 'Minimum gene expression value for gene to include in the network. Default = 0')
+
+args = parser.parse_args()
+
+###################################################################################################################################################################################
+
+# Work out which networks to build as a list of (output name, peak file, expression file, expression column)
+# Expression column is None for the first column of a file listed in the manifest
+combinations = list()
+
+def file_stem(filename):
+	return os.path.splitext(os.path.basename(filename))[0]
+
+if args.M:
+	manifest_dir = os.path.dirname(os.path.abspath(args.M))
+
+	with open(args.M, 'r') as manifest:
+		for num,line in enumerate(manifest):
+			if num == 0 or not line.strip():
+				continue # Skip header line
+
+			fields = line.rstrip('\r\n').split('\t')
+			name, peak_file, exprs_file = fields[:3]
+			column = fields[3] if len(fields) > 3 and fields[3] else None
+
+			# Paths in the manifest are relative to the manifest file
+			peak_file = os.path.join(manifest_dir, peak_file)
+			exprs_file = os.path.join(manifest_dir, exprs_file)
+
+			combinations.append((name, peak_file, exprs_file, column))
+else:
+	if len(args.p) == 0 or len(args.e) == 0:
+		parser.error('either a manifest (-M) or at least one peak file (-p) and expression file (-e) are required')
+
+	expression_samples = list()
+
+	for exprs_file in args.e:
+		with open(exprs_file, 'r') as exprs:
+			columns = exprs.readline().rstrip('\r\n').split('\t')[1:]
+
+		expression_samples.extend((exprs_file, column) for column in columns)
+
+	# Sample names are the expression column names, prefixed with the file name if the same column name is used in more than one file
+	column_names = [column for exprs_file, column in expression_samples]
+
+	for peak_file in args.p:
+		for exprs_file, column in expression_samples:
+			sample = column if column_names.count(column) == 1 else '%s_%s' % (file_stem(exprs_file), column)
+			combinations.append(('%s_%s' % (file_stem(peak_file), sample), peak_file, exprs_file, column))
+
+sys.stdout.write('Building %d networks\n' % len(combinations))
+
+###################################################################################################################################################################################
+
+# Read motif positions (through the motif store) and filter against footprints if requested
+motif_positions = api.load_motifs(args.dir, log = sys.stdout)
+
+if args.f:
+	motif_positions = api.filter_motifs(args.dir, motif_positions, args.f, args.C, args.cache_size * 2 ** 20, log = sys.stdout)
+
+sys.stdout.write('Read motif positions for %d motifs\n' % len(motif_positions))
+
+# Read TF annotation data. Only motifs with at least one annotated TF can be part of a network
+tf_annotation = api.load_tf_annotation(args.annot)
+annotated_motifs = set(motif_id for gene_id, motif_id in tf_annotation)
+annotated_motifs = dict((motif_id, motif_positions[motif_id]) for motif_id in motif_positions if motif_id in annotated_motifs)
+
+###################################################################################################################################################################################
+
+# Read every peak file once, then align motifs to the union of all peaks in a single pass
+peak_files = sorted(set(peak_file for name, peak_file, exprs_file, column in combinations))
+peak_sets = dict((peak_file, api.load_peaks(peak_file)) for peak_file in peak_files)
+
+chrom_index = dict()
+peak_keys = numpy.vstack([numpy.column_stack([intervals.chrom_codes(peak_sets[peak_file], chrom_index), peak_sets[peak_file].starts, peak_sets[peak_file].ends]) for peak_file in peak_files])
+union_keys, union_index = numpy.unique(peak_keys, axis = 0, return_inverse = True)
+union_index = union_index.ravel()
+
+chrom_names = numpy.array(sorted(chrom_index, key = chrom_index.get), dtype = str)
+union_peaks = intervals.Intervals(chrom_names[union_keys[:, 0]] if len(union_keys) > 0 else [], union_keys[:, 1], union_keys[:, 2])
+
+sys.stdout.write('Read %d peak files with %d distinct peaks\n' % (len(peak_files), len(union_peaks)))
+
+motif_union_counts = dict(intervals.iter_motif_peak_counts(union_peaks, annotated_motifs))
+
+# Number of motifs associated with each gene, for each peak file
+peak_set_gene_hits = dict()
+offset = 0
+
+for peak_file in peak_files:
+	peaks = peak_sets[peak_file]
+	peak_union_index = union_index[offset:offset + len(peaks)]
+	offset += len(peaks)
+
+	peak_set_gene_hits[peak_file] = [(motif_id, intervals.gene_hit_counts(peaks, motif_union_counts[motif_id][peak_union_index])) for motif_id in annotated_motifs]
+
+###################################################################################################################################################################################
+
+# Read expression data and select the reference gene of each motif for every sample at once
+exprs_files = sorted(set(exprs_file for name, peak_file, exprs_file, column in combinations))
+samples = dict()
+
+for exprs_file in exprs_files:
+	genes, columns, values = network.read_expression_matrix(exprs_file)
+	motif_ref_genes = network.select_reference_genes_matrix(tf_annotation, genes, values, args.m, motif_positions)
+	tf_genes = set(gene_id for gene_id, motif_id in tf_annotation if motif_id in motif_positions)
+
+	for i, column in enumerate(columns):
+		expressed = numpy.flatnonzero(values[:, i] >= args.m)
+		gene_expression = dict((genes[j], float(values[j, i])) for j in expressed)
+		sample_tf_genes = tf_genes.intersection(gene_expression)
+
+		samples[(exprs_file, column)] = (gene_expression, motif_ref_genes[i], sample_tf_genes)
+
+		if i == 0:
+			samples[(exprs_file, None)] = samples[(exprs_file, column)]
+
+###################################################################################################################################################################################
+
+# Build and write each network
+if not os.path.exists(args.out):
+	os.mkdir(args.out)
+
+for name, peak_file, exprs_file, column in combinations:
+	if (exprs_file, column) not in samples:
+		sys.stderr.write('Warning: no column %s in %s. Skipping %s\n' % (column, exprs_file, name))
+		continue
+
+	gene_expression, motif_ref_gene, tf_genes = samples[(exprs_file, column)]
+
+	grn = cyjs.CyjsWriter(cyjs.cyjs_filename(os.path.join(args.out, name)))
+	network.build_graph(peak_set_gene_hits[peak_file], motif_ref_gene, gene_expression, None if args.a else tf_genes, grn)
+	outfile = grn.close()
+
+	sys.stdout.write('Built network %s with %d nodes and %d edges\n' % (outfile, grn.number_of_nodes(), grn.number_of_edges()))
+
+###################################################################################################################################################################################
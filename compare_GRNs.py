@@ -0,0 +1,143 @@
+#!/usr/bin/env python
+from grn import count_matrix
+from grn import compare
+from grn import cyjs
+import argparse
+import numpy
+import sys
+
+###################################################################################################################################################################################
+
+# Read command line arguments
+parser = argparse.ArgumentParser(description = 'Compare GRNs of two or more conditions and write a merged network with per-condition edge attributes')
+parser.add_argument('grns', type = str, nargs = '+', help = 'Cytoscape JSON files (.cyjs) or motif count matrices of the GRNs to compare. The first is the reference condition')
+parser.add_argument('out', type = str, help = 'Output file (merged cyjs network)')
+parser.add_argument('-n', '--names', dest = 'n', type = str, nargs = '+', required = False, help = 'Condition names, in the same order as the GRNs. Default: file names without extension')
+parser.add_argument('-r', '--rewiring', dest = 'r', type = str, required = False, help = 'Write per-motif (TF) rewiring scores for every condition to this TSV file')
+parser.add_argument('-l', '--log2-fold', dest = 'l', type = float, default = 1.0, help = 'Minimum absolute log2 fold change of the motif count (with a pseudocount of 1) for an edge present in both conditions to count as changed. Default = 1')
+parser.add_argument('-F', '--format', dest = 'F', choices = count_matrix.FORMATS, required = False, help = 'Format of count matrix inputs. Default = guessed from the file')
+
+args = parser.parse_args()
+
+if len(args.grns) < 2:
+	parser.error('at least two GRNs are needed')
+
+if args.n and len(args.n) != len(args.grns):
+	parser.error('one name is needed for every GRN')
+
+names = args.n if args.n else [compare.condition_name(filename) for filename in args.grns]
+
+if len(set(names)) != len(names):
+	parser.error('condition names must be unique (use -n)')
+
+###################################################################################################################################################################################
+
+# Read networks and align them on a shared gene x motif index
+networks = list()
+
+for filename, name in zip(args.grns, names):
+	networks.append(compare.read_network(filename, name, args.F))
+	sys.stdout.write('Read %s with %d edges from %s\n' % (name, len(networks[-1].counts), filename))
+
+genes, motifs, gene_codes, motif_codes, counts = compare.align(networks)
+log2_fold, status = compare.classify(counts, args.l)
+
+sys.stdout.write('Aligned %d edges between %d genes and %d motifs\n' % (len(counts), len(genes), len(motifs)))
+
+for i, name in enumerate(names[1:], 1):
+	n_status = numpy.bincount(status[:, i], minlength = len(compare.STATUS))
+	sys.stdout.write('%s vs %s: %d gained, %d lost, %d changed, %d unchanged edges\n' % (name, names[0], n_status[compare.GAINED], n_status[compare.LOST], n_status[compare.CHANGED], n_status[compare.UNCHANGED]))
+
+###################################################################################################################################################################################
+
+# Per-motif rewiring scores
+reference_targets, targets, gained, lost, changed, jaccard_distance, weighted = compare.rewiring(motif_codes, len(motifs), counts, status)
+
+# Source node of each motif: its source node in the first network that has it
+motif_sources = dict()
+
+for network in networks:
+	for motif_id, source_node in network.motif_sources.items():
+		motif_sources.setdefault(motif_id, source_node)
+
+if args.r:
+	lines = [compare.REWIRING_HEADER]
+
+	for i, name in enumerate(names[1:], 1):
+		for m, motif_id in enumerate(motifs.tolist()):
+			lines.append('%s\t%s\t%s\t%d\t%d\t%d\t%d\t%d\t%.4f\t%.4f' % (motif_id, motif_sources[motif_id], name, reference_targets[m, i], targets[m, i], gained[m, i], lost[m, i], changed[m, i], jaccard_distance[m, i], weighted[m, i]))
+
+	with open(args.r, 'w') as out:
+		out.write('\n'.join(lines) + '\n')
+
+	sys.stdout.write('Wrote rewiring scores for %d motifs to %s\n' % (len(motifs), args.r))
+
+###################################################################################################################################################################################
+
+# Write the merged network
+# Nodes keep their expression in each condition (expression_<condition>); source nodes also get the largest rewiring score of their motifs in each
+# condition (rewiring_<condition>). Edges get count_<condition> for every condition and log2fc_<condition> and status_<condition> for every
+# condition other than the reference
+grn = cyjs.CyjsWriter(cyjs.cyjs_filename(args.out))
+
+source_rewiring = dict()
+
+for m, motif_id in enumerate(motifs.tolist()):
+	scores = source_rewiring.setdefault(motif_sources[motif_id], numpy.zeros(len(names)))
+	numpy.maximum(scores, weighted[m], out = scores)
+
+# Nodes with at least one edge, in the order they are first seen
+edge_nodes = set(genes.tolist()) | set(motif_sources[motif_id] for motif_id in motifs.tolist())
+node_names = dict()
+
+for network in networks:
+	for node in network.nodes:
+		if node in edge_nodes:
+			node_names.setdefault(node, None)
+
+for node in node_names:
+	attributes = dict()
+
+	for network in networks:
+		if network.nodes.get(node) is not None:
+			attributes['expression_%s' % network.name] = network.nodes[node]
+
+	if node in source_rewiring:
+		for i, name in enumerate(names[1:], 1):
+			attributes['rewiring_%s' % name] = round(float(source_rewiring[node][i]), 4)
+
+	grn.add_node(node, **attributes)
+
+# Motifs with the same source node (e.g. motifs of one TF family) can have edges to the same target. Only the last of these is kept, as in a single network
+# Edges are written in the order of the first edge of each (source, target) pair, with the attributes of the last (as CyjsWriter.add_edge does)
+node_codes = dict((node, code) for code, node in enumerate(node_names))
+source_codes = numpy.array([node_codes[motif_sources[motif_id]] for motif_id in motifs.tolist()], dtype = numpy.int64)[motif_codes]
+target_codes = numpy.array([node_codes[gene] for gene in genes.tolist()], dtype = numpy.int64)[gene_codes]
+
+pair_keys = source_codes * len(node_codes) + target_codes
+pairs, first = numpy.unique(pair_keys, return_index = True)
+last = len(pair_keys) - 1 - numpy.unique(pair_keys[::-1], return_index = True)[1]
+n_replaced = len(pair_keys) - len(pairs)
+
+# The writer groups edges by source node in node order, so adding them in that order lets it copy them straight to the file
+rows = last[numpy.lexsort((first, source_codes[first]))]
+
+# Edge attributes are built a column at a time
+node_list = list(node_names)
+columns = dict(source_motif = motifs[motif_codes[rows]].tolist())
+
+for i, name in enumerate(names):
+	columns['count_%s' % name] = counts[rows, i].tolist()
+
+for i, name in enumerate(names[1:], 1):
+	columns['log2fc_%s' % name] = [round(value, 4) for value in log2_fold[rows, i].tolist()]
+	columns['status_%s' % name] = compare.STATUS[status[rows, i]].tolist()
+
+grn.add_edges([node_list[code] for code in source_codes[rows].tolist()], [node_list[code] for code in target_codes[rows].tolist()], **columns)
+
+if n_replaced > 0:
+	sys.stderr.write('Warning: %d edges were replaced by an edge of another motif with the same source node\n' % n_replaced)
+
+sys.stdout.write('Wrote merged network with %d nodes and %d edges to %s\n' % (grn.number_of_nodes(), grn.number_of_edges(), grn.close()))
+
+###################################################################################################################################################################################
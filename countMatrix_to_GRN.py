@@ -1,7 +1,7 @@
 #!/usr/bin/env python
-import networkx as nx
+from grn import count_matrix
+from grn import cyjs
 import argparse
-import json
 import sys
 
 ###################################################################################################################################################################################
@@ -12,6 +12,7 @@ parser.add_argument('matrix', type = str, help = 'Motif count matrix file')
 parser.add_argument('exprs', type = str, help = 'Gene expression data file')
 parser.add_argument('tfanno', type = str, help = 'Transcription Factor annotation file')
 parser.add_argument('out', type = str, help = 'Output file')
+parser.add_argument('-F', '--format', dest = 'F', choices = count_matrix.FORMATS, required = False, help = 'Count matrix format: dense TSV, sparse COO triplet TSV, Matrix Market (mtx) or NumPy/SciPy sparse archive (npz). Default = guessed from the file')
 
 args = parser.parse_args()
 
@@ -67,64 +68,47 @@ sys.stdout.write('Read gene expression data for %d genes\n' % len(gene_expressio
 ###################################################################################################################################################################################
 
 # Read count matrix and create GRN
-grn = nx.DiGraph()
+# The network is streamed straight to the Cytoscape JSON file
+grn = cyjs.CyjsWriter(cyjs.cyjs_filename(args.out))
 
-with open(args.matrix, 'r') as matrix:
-	for num,row in enumerate(matrix):
-		columns = row.strip().split('\t')
+matrix = count_matrix.read(args.matrix, args.F).sorted()
+sys.stdout.write('Read count matrix with %d genes, %d motifs and %d non-zero entries\n' % (len(matrix.genes), len(matrix.motifs), len(matrix)))
 
-		if num == 0:
-			motifs = columns
-		else:
-			target_node = columns[0]
-			target_node = target_node.replace(' ', '') # Strip tailing whitespace from target node ID
-
-			# Check if gene is expressed and get expression value
-			if target_node in gene_expression:
-				exprs_value = gene_expression[target_node]
-			else:
-				continue # Skip non-expressed genes
+for row, col, count in zip(matrix.rows.tolist(), matrix.cols.tolist(), matrix.counts.tolist()):
+	target_node = matrix.genes[row]
+	motif_id = matrix.motifs[col]
 
-			for i in range(1, len(columns)):
-				motif_id = motifs[i]
+	# Check if gene is expressed and get expression value
+	if target_node in gene_expression:
+		exprs_value = gene_expression[target_node]
+	else:
+		continue # Skip non-expressed genes
 
-				if motif_id in motif_family_ref:
-					source_node = motif_family_ref[motif_id][0]
-				else:
-					continue
+	if motif_id in motif_family_ref:
+		source_node = motif_family_ref[motif_id][0]
+	else:
+		continue
 
-				count = int(columns[i])
+	if count == 0:
+		continue # Skip edges with 0 motifs
 
-				if count == 0:
-					continue # Skip edges with 0 motifs
+	# Check if source and target nodes are already present in network
+	# Add them if they not
+	if not grn.has_node(source_node):
+		source_node_exprs = gene_expression[source_node]
+		grn.add_node(source_node, expression = source_node_exprs)
 
-				# Check if source and target nodes are already present in network
-				# Add them if they not
-				if not grn.has_node(source_node):
-					source_node_exprs = gene_expression[source_node]
-					grn.add_node(source_node, expression = source_node_exprs)
+	if not grn.has_node(target_node):
+		grn.add_node(target_node, expression = exprs_value)
 
-				if not grn.has_node(target_node):
-					grn.add_node(target_node, expression = exprs_value)
-
-				# Create edge
-				grn.add_edge(source_node, target_node, count = count)
+	# Create edge
+	grn.add_edge(source_node, target_node, count = count)
 
 sys.stdout.write('Created GRN with %d nodes and %d edges\n' % (grn.number_of_nodes(), grn.number_of_edges()))
 
 ###################################################################################################################################################################################
 
-# Write network as a Cytoscape JSON file
-cytoscape = nx.cytoscape_data(grn)
-
-# Ensure output file has the correct file extension
-outfile = args.out
+# Finish writing the Cytoscape JSON file
+grn.close()
 
-if not outfile.endswith('.cyjs'):
-	outfile = outfile + '.cyjs'
-
-out = open(outfile, 'w')
-json.dump(cytoscape, out)
-out.close()
-
-###################################################################################################################################################################################
+###################################################################################################################################################################################
\ No newline at end of file
@@ -1,55 +1,89 @@
 #!/usr/bin/env python
-import networkx as nx
+from grn import query
 import argparse
-import json
 import sys
 
 ###################################################################################################################################################################################
 
 # Read command-line arguments
 parser = argparse.ArgumentParser(description = 'Extract a transcription factor module from a gene regulatory network')
-parser.add_argument('cyjs', type = str, help = 'Cytoscape JSON file of the GRN')
-parser.add_argument('motif', type = str, help = 'Name of the TF motif to extract the module for')
-parser.add_argument('out', type = str, help = 'Output file')
+parser.add_argument('cyjs', type = str, help = 'Cytoscape JSON file of the GRN, or an index created with GRN_to_index.py')
+parser.add_argument('motif', type = str, nargs = '?', help = 'Name of the TF motif to extract the module for. Several motifs can be given separated by commas')
+parser.add_argument('out', type = str, nargs = '?', help = 'Output file')
+parser.add_argument('-i', '--intersection', dest = 'i', action = 'store_true', required = False, help = 'With several motifs, only keep genes that are targets of every motif (default: targets of any motif)')
+parser.add_argument('-c', '--min-count', dest = 'c', type = int, default = 0, help = 'Minimum number of motifs on an edge for it to be followed. Default = 0')
+parser.add_argument('-k', '--hops', dest = 'k', type = int, default = 1, help = 'Number of hops to follow from the motif. Default = 1 (direct targets only)')
+parser.add_argument('-u', '--upstream', dest = 'u', action = 'store_true', required = False, help = 'Follow edges upstream (regulators of the motif\'s TF genes) instead of downstream (targets)')
+parser.add_argument('-b', '--batch', dest = 'b', type = str, required = False, help = 'Tab-delimited file of queries to answer in one run, with a header line and columns: output file, motifs, and optionally mode (union/intersection), minimum count, hops and direction (downstream/upstream). Missing values default to the command-line options')
 
 args = parser.parse_args()
 
+if not args.b and (args.motif is None or args.out is None):
+	parser.error('a motif and output file are required unless a batch file (-b) is given')
+
 ###################################################################################################################################################################################
 
-# Read network
-grn_json_file = open(args.cyjs, 'r')
-grn_json = json.load(grn_json_file)
-grn_json_file.close()
+# Collect queries as (output file, motifs, mode, minimum count, hops, direction)
+default_mode = 'intersection' if args.i else 'union'
+default_direction = 'upstream' if args.u else 'downstream'
+queries = list()
 
-# Convert JSON to networkx
-grn = nx.cytoscape_graph(grn_json)
-sys.stdout.write('Read network with %d nodes and %d edges\n' % (grn.number_of_nodes(), grn.number_of_edges()))
+if args.b:
+	with open(args.b, 'r') as batch:
+		for num,line in enumerate(batch):
+			if num == 0 or not line.strip():
+				continue # Skip header line
 
-###################################################################################################################################################################################
+			fields = line.rstrip('\r\n').split('\t')
+			fields = fields + [''] * (6 - len(fields))
+
+			out, motifs, mode, min_count, hops, direction = fields[:6]
 
-# Extract targets from GRN
-module = []
+			queries.append((out, motifs.split(','), mode or default_mode, int(min_count) if min_count else args.c, int(hops) if hops else args.k, direction or default_direction))
+else:
+	queries.append((args.out, args.motif.split(','), default_mode, args.c, args.k, default_direction))
 
-for source_node, target_node, metadata in grn.edges(data = True):
-	if metadata['source_motif'] == args.motif:
-		module.append(target_node)
+###################################################################################################################################################################################
 
-# Count number of targets
-# If none are found, return an error and exit
-if len(module) == 0:
-	sys.stderr.write('Warning: No genes found in TF module. Check spelling of motif ID and try again. Exiting\n')
-	sys.exit(1)
+# Read network
+# A single query for the direct targets of motifs in a cyjs file is answered while reading its edges. Otherwise cyjs files are compiled into an
+# in-memory index, and compiled indexes are queried directly
+if query.can_stream(args.cyjs, [query_args[1:] for query_args in queries]):
+	module, n_nodes, n_edges = query.stream_module(args.cyjs, *queries[0][1:4])
+	modules = [module]
 else:
-	sys.stdout.write('Found %d genes\n' % len(module))
+	grn = query.open_network(args.cyjs)
+	n_nodes, n_edges = grn.number_of_nodes(), grn.number_of_edges()
+	modules = None
+
+sys.stdout.write('Read network with %d nodes and %d edges\n' % (n_nodes, n_edges))
 
 ###################################################################################################################################################################################
 
-# Write module genes to file
-out = open(args.out, 'w')
+# Extract modules from GRN and write module genes to file
+n_empty = 0
+
+for num, (out_file, motifs, mode, min_count, hops, direction) in enumerate(queries):
+	module = modules[num] if modules is not None else grn.query(motifs, mode, min_count, hops, direction)
+
+	# Count number of targets
+	# If none are found, return an error
+	if len(module) == 0:
+		sys.stderr.write('Warning: No genes found in TF module for %s. Check spelling of motif ID and try again\n' % ','.join(motifs))
+		n_empty += 1
+		continue
+	else:
+		sys.stdout.write('Found %d genes for %s\n' % (len(module), ','.join(motifs)))
+
+	out = open(out_file, 'w')
 
-for gene_id in sorted(module):
-	out.write(gene_id + '\n')
+	for gene_id in sorted(module):
+		out.write(gene_id + '\n')
 
-out.close()
+	out.close()
 
-###################################################################################################################################################################################
\ No newline at end of file
+if n_empty > 0:
+	sys.stderr.write('Exiting\n')
+	sys.exit(1)
+
+###################################################################################################################################################################################
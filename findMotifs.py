@@ -1,7 +1,11 @@
 ﻿#!/usr/bin/env python
-import pybedtools
+from grn import scan_cache
+from grn import scan
+from grn import store
+from grn import profiling
+import multiprocessing
 import argparse
-import numpy
+import sys
 import os
 
 ###############################################################################################################################################################
@@ -9,80 +13,159 @@ import os
 parser = argparse.ArgumentParser()
 parser.add_argument('bed', type = str, help = 'BED file to use for motif search')
 parser.add_argument('dir', type = str, help = 'Directory of motif files to use with Homer')
-parser.add_argument('genome', type = str, help = 'Genome version to use with Homer')
+parser.add_argument('genome', type = str, help = 'Genome version to use with Homer, or a FASTA file (with .fai index) for the native scanner')
 parser.add_argument('out', type = str, help = 'Output directory')
 parser.add_argument('-d', '--dist', dest = 'd', type = int, default = 2, help = 'Maximum distance between duplicate motif pairs. Default = 2')
+parser.add_argument('-j', '--jobs', dest = 'j', type = int, default = 1, help = 'Number of motifs to scan in parallel. Default = 1')
+parser.add_argument('-b', '--backend', dest = 'b', choices = ['homer', 'native'], default = 'homer', help = 'Motif scanner to use: Homer annotatePeaks.pl, or the built-in PWM scanner which reads peak sequences from a FASTA file. Default = homer')
+parser.add_argument('-z', '--bgzip', dest = 'z', action = 'store_true', required = False, help = 'Write motif BED files bgzip-compressed with a tabix index (<motif>.bed.gz), for smaller motif directories and region-restricted builds (needs pysam). Default: False')
+parser.add_argument('-C', '--cache-dir', dest = 'C', type = str, required = False, help = 'Scan cache directory, which can be shared between output directories. Peaks already scanned for a motif (with the same motif file, genome and scanner) are read from the cache, so only new peaks are scanned. Default: scan_cache in the output directory')
+parser.add_argument('--no-cache', dest = 'no_cache', action = 'store_true', required = False, help = 'Scan every peak without using the scan cache. Default: False')
+profiling.add_arguments(parser)
 
 args = parser.parse_args()
 
+profiler = profiling.from_args(args)
+profiler.start()
+
 ###############################################################################################################################################################
 
 # Convert relative path of bed file and input directory to an absolute path
 bed = os.path.abspath(args.bed)
 motif_dir = os.path.abspath(args.dir)
+out_dir = os.path.abspath(args.out)
 
-# If the output directory does not already exists, create it, then go there
+# If the output directory does not already exists, create it
+if not os.path.exists(out_dir):
+	os.mkdir(out_dir)
 
-if not os.path.exists(args.out):
-	os.mkdir(args.out)
+scan.remove_stale_scratch(out_dir)
 
-os.chdir(args.out)
+# The scan cache holds the sites found in every peak scanned before, for each motif file, genome and scanner
+if args.no_cache:
+	cache = None
+else:
+	cache = scan_cache.ScanCache(os.path.abspath(args.C) if args.C else os.path.join(out_dir, scan_cache.CACHE_DIR), os.path.abspath(args.genome) if args.b == 'native' else args.genome, args.b)
 
 ###############################################################################################################################################################
 
-for motif_file in os.listdir(motif_dir):
+# Find motifs that still need to be scanned
+# Motifs recorded in the manifest for the same peak file, or with a BED file already in the output directory but not in the manifest, are skipped
+peaks_checksum = store.md5sum(bed)
+completed = scan.read_manifest(out_dir)
+motif_files = list()
+n_skipped = 0
+
+for motif_file in sorted(os.listdir(motif_dir)):
 	if not motif_file.endswith('.motif'):
 		continue
 
 	motif = motif_file.replace('.motif', '')
 
 	# Check if BED file already exists
-	if os.path.exists('%s.bed' % motif):
-		continue
-
-	# Search for motif in BED file using Homer
-	homer = 'annotatePeaks.pl %s %s -noann -m %s/%s -mbed %s_raw.bed > Homer_output.tsv' % (bed, args.genome, motif_dir, motif_file, motif)
-	os.system(homer)
+	if motif in completed:
+		is_complete = completed[motif][2] in (None, peaks_checksum)
+	else:
+		is_complete = scan.motif_bed_exists(out_dir, motif)
 
-	# Homer has trouble dealing with palindromic motifs which result in each motif being found twice.
-	# These need to be removed.
+	if is_complete:
+		n_skipped += 1
+		continue
 
-	motif_bed = pybedtools.BedTool('%s_raw.bed' % motif).sort()
-	prev_line = list()
+	motif_files.append('%s/%s' % (motif_dir, motif_file))
 
-	out = open('%s.bed' % motif, 'w')
+sys.stdout.write('Scanning %d motifs (%d already complete) with %d jobs\n' % (len(motif_files), n_skipped, args.j))
 
-	for site in motif_bed:
-		chrom = site[0]
-		start = int(site[1])
-		end = int(site[2])
-		strand = site[5]
+###############################################################################################################################################################
 
-		# Get the center position of the motif
-		pos = int(numpy.ceil(numpy.mean([start, end])))
+# Search for motifs using Homer or the native scanner
+# The native scanner reads the peak sequences once and shares them with every job. With the scan cache, only the sequences of peaks that are
+# not in the cache for at least one motif are read
+# Each finished motif is recorded in the manifest straight away so an interrupted run can be resumed
+if cache is not None and len(motif_files) > 0:
+	scan.load_cache_peaks(bed)
+
+if args.b == 'native':
+	if len(motif_files) > 0:
+		with profiler.stage('load_sequences'):
+			sequences = scan.load_native_sequences(os.path.abspath(args.genome), bed, cache, motif_files)
+
+		sys.stdout.write('Read %d peak sequences (%d bp) from %s\n' % (len(sequences), len(sequences.codes) - len(sequences), args.genome))
+
+		if sequences.missing > 0:
+			sys.stderr.write('Warning: %d peaks are on chromosomes not found in %s\n' % (sequences.missing, args.genome))
+
+	scan_motif = scan.scan_motif_native
+	jobs = [(motif_file, out_dir, args.d, args.z, cache) for motif_file in motif_files]
+else:
+	scan_motif = scan.scan_motif
+	jobs = [(bed, args.genome, motif_file, out_dir, args.d, args.z, cache) for motif_file in motif_files]
+timings = list()
+failed = list()
+
+manifest = scan.open_manifest(out_dir)
+
+def record(result):
+	motif, n_sites, elapsed, n_cached, n_scanned = result
+
+	manifest.write('%s\t%d\t%.2f\t%s\n' % (motif, n_sites, elapsed, peaks_checksum))
+	manifest.flush()
+
+	timings.append(result)
+
+	if cache is None:
+		profiler.count('motifs', motif, sites = n_sites, elapsed = elapsed)
+		sys.stdout.write('Found %d sites for %s (%.1f s)\n' % (n_sites, motif, elapsed))
+	else:
+		profiler.count('motifs', motif, sites = n_sites, elapsed = elapsed, cached_peaks = n_cached, scanned_peaks = n_scanned)
+		sys.stdout.write('Found %d sites for %s (%.1f s, %d peaks from the scan cache, %d scanned)\n' % (n_sites, motif, elapsed, n_cached, n_scanned))
+
+with profiler.stage('scan'):
+	if args.j > 1:
+		pool = multiprocessing.Pool(args.j)
+		pending = [(job[-5], pool.apply_async(scan_motif, job)) for job in jobs]
+		pool.close()
+
+		for motif_file, result in profiler.progress(pending, 'Scanning motifs'):
+			try:
+				record(result.get())
+			except Exception as error:
+				failed.append(motif_file)
+				sys.stderr.write('Error: %s\n' % error)
+
+		pool.join()
+	else:
+		for job in profiler.progress(jobs, 'Scanning motifs'):
+			try:
+				record(scan_motif(*job))
+			except Exception as error:
+				failed.append(job[-5])
+				sys.stderr.write('Error: %s\n' % error)
+
+manifest.close()
 
-		is_duplicate = False
+###############################################################################################################################################################
 
-		# A motif is considered a duplicate if:
-		# The motif occurs on the same chromosome but opposite strand than the motif found on the previous line, and
-		# the distance between the center positions of these motifs is < 2
+# Per-motif timing summary, slowest first
+if len(timings) > 0:
+	sys.stdout.write('\nMotif\tSites\tSeconds\n')
 
-		if len(prev_line) != 0:
-			prev_chrom, prev_pos, prev_strand = prev_line
+	for motif, n_sites, elapsed, n_cached, n_scanned in sorted(timings, key = lambda timing: timing[2], reverse = True):
+		sys.stdout.write('%s\t%d\t%.2f\n' % (motif, n_sites, elapsed))
 
-			if chrom == prev_chrom and strand != prev_strand:
-				dist = abs(pos - prev_pos)
+	sys.stdout.write('Total\t%d\t%.2f\n' % (sum(timing[1] for timing in timings), sum(timing[2] for timing in timings)))
 
-				if dist <= args.d:
-					is_duplicate = True
+	# Scan cache hits (peaks read from the cache) and misses (peaks scanned) over all motifs
+	if cache is not None:
+		n_cached = sum(timing[3] for timing in timings)
+		n_scanned = sum(timing[4] for timing in timings)
 
-		if not is_duplicate:
-			out.write('%s\t%d\t%d\n' % (chrom, start, end))
+		sys.stdout.write('\nScan cache: %d peak hits, %d peak misses (%.1f%% of %d motif x peak scans read from %s)\n' % (n_cached, n_scanned, 100.0 * n_cached / max(n_cached + n_scanned, 1), n_cached + n_scanned, cache.cache_dir))
 
-		prev_line = [chrom, pos, strand]
+profiler.finish()
 
-	# Clean up
-	os.system('rm %s_raw.bed' % motif)
-	os.system('rm Homer_output.tsv')
+if len(failed) > 0:
+	sys.stderr.write('%d motifs failed. Re-run the same command to retry them\n' % len(failed))
+	sys.exit(1)
 
-###############################################################################################################################################################
+###############################################################################################################################################################
\ No newline at end of file
@@ -0,0 +1 @@
+# Shared helper modules for the gene regulatory network scripts
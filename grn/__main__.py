@@ -0,0 +1,5 @@
+from grn import cli
+import sys
+
+# python -m grn <command> [arguments] (see cli.py)
+sys.exit(cli.main())
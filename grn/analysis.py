@@ -0,0 +1,188 @@
+import scipy.sparse.csgraph
+import scipy.sparse.linalg
+import scipy.sparse
+import numpy
+
+###################################################################################################################################################################################
+
+# Network analytics on a sparse (CSR) adjacency matrix, used by GRN_analysis.py
+# The network is held as a scipy.sparse matrix with A[i, j] = count of the edge from node i to node j, so that every measure is a few sparse
+# matrix products rather than a walk over a networkx graph:
+#	degrees		In/out degree and count-weighted (in/out weight) degree
+#	pagerank	PageRank with the edge counts as weights (same definition and convergence test as networkx.pagerank)
+#	hits		Hub and authority scores from the leading singular vectors of the weighted adjacency matrix (as networkx.hits)
+#	feedback	Strongly connected components with more than one node (or a self-loop): sets of TFs that regulate each other
+#	communities	Modules found with the Louvain method on the undirected (A + A^T) network, maximizing weighted modularity
+
+PAGERANK_ALPHA = 0.85
+PAGERANK_TOL = 1.0e-6
+MAX_ITER = 100
+
+###################################################################################################################################################################################
+
+def adjacency(nodes, sources, targets, weights):
+	# Sparse n x n adjacency matrix from edges given as node indices (duplicate edges are added)
+	return scipy.sparse.csr_matrix((numpy.asarray(weights, dtype = float), (sources, targets)), shape = (len(nodes), len(nodes)))
+
+def degrees(A):
+	# (in degree, out degree, in weight, out weight) arrays
+	B = (A != 0).astype(numpy.int64)
+
+	return numpy.asarray(B.sum(axis = 0)).ravel(), numpy.asarray(B.sum(axis = 1)).ravel(), numpy.asarray(A.sum(axis = 0)).ravel(), numpy.asarray(A.sum(axis = 1)).ravel()
+
+def pagerank(A, alpha = PAGERANK_ALPHA, tol = PAGERANK_TOL, max_iter = MAX_ITER):
+	# PageRank by power iteration. Rank from nodes with no out edges (dangling nodes) is spread evenly over all nodes
+	n = A.shape[0]
+
+	if n == 0:
+		return numpy.zeros(0)
+
+	out_weight = numpy.asarray(A.sum(axis = 1)).ravel()
+	dangling = out_weight == 0
+	scale = numpy.divide(1.0, out_weight, out = numpy.zeros(n), where = ~dangling)
+	P = scipy.sparse.diags(scale) @ A
+	PT = P.T.tocsr()
+
+	x = numpy.full(n, 1.0 / n)
+
+	for i in range(max_iter):
+		last = x
+		x = alpha * (PT @ last) + (alpha * last[dangling].sum() + 1 - alpha) / n
+
+		if numpy.abs(x - last).sum() < n * tol:
+			return x
+
+	raise ValueError('PageRank did not converge in %d iterations' % max_iter)
+
+def hits(A):
+	# (hub, authority) scores: the leading left and right singular vectors of A, each normalized to sum to 1
+	n = A.shape[0]
+
+	if A.nnz == 0:
+		return numpy.full(n, 1.0 / max(n, 1)), numpy.full(n, 1.0 / max(n, 1))
+
+	if n < 3:
+		u, s, vt = numpy.linalg.svd(A.toarray())
+	else:
+		u, s, vt = scipy.sparse.linalg.svds(A, k = 1, v0 = numpy.ones(n) / numpy.sqrt(n), maxiter = MAX_ITER * n)
+
+	hub = numpy.abs(u[:, numpy.argmax(s)])
+	authority = numpy.abs(vt[numpy.argmax(s), :])
+
+	return hub / hub.sum(), authority / authority.sum()
+
+def feedback_loops(A):
+	# Feedback loop ID of every node (-1 if the node is in none): strongly connected components of more than one node, or single nodes
+	# that regulate themselves, numbered from the largest loop down
+	n_components, labels = scipy.sparse.csgraph.connected_components(A, directed = True, connection = 'strong')
+	sizes = numpy.bincount(labels, minlength = n_components)
+
+	self_loop = A.diagonal() != 0
+	is_loop = (sizes[labels] > 1) | self_loop
+	loop_components = numpy.unique(labels[is_loop])
+
+	# Number loops by decreasing size, ties by first node
+	first_node = numpy.full(n_components, len(labels))
+	numpy.minimum.at(first_node, labels, numpy.arange(len(labels)))
+	order = loop_components[numpy.lexsort((first_node[loop_components], -sizes[loop_components]))]
+
+	loop_id = numpy.full(n_components, -1)
+	loop_id[order] = numpy.arange(len(order))
+
+	return numpy.where(is_loop, loop_id[labels], -1)
+
+###################################################################################################################################################################################
+
+def modularity(W, communities, resolution = 1.0):
+	# Modularity of a partition of the undirected weighted network W (symmetric, self-loops counted once in each direction)
+	two_m = W.sum()
+
+	if two_m == 0:
+		return 0.0
+
+	k = numpy.asarray(W.sum(axis = 1)).ravel()
+	C = community_matrix(communities)
+	within = (C.T @ W @ C).diagonal().sum()
+	totals = numpy.bincount(communities, weights = k)
+
+	return within / two_m - resolution * (totals ** 2).sum() / two_m ** 2
+
+def community_matrix(communities):
+	# n x k matrix with a 1 for the community of every node
+	return scipy.sparse.csr_matrix((numpy.ones(len(communities)), (numpy.arange(len(communities)), communities)), shape = (len(communities), communities.max() + 1 if len(communities) > 0 else 0))
+
+def louvain_moves(W, resolution):
+	# One level of the Louvain method: move single nodes to the neighbouring community with the largest modularity gain until no move helps
+	# Returns (community of each node, numbered from 0, whether any node moved)
+	n = W.shape[0]
+	k = numpy.asarray(W.sum(axis = 1)).ravel()
+	two_m = k.sum()
+
+	community = numpy.arange(n)
+	totals = k.copy()
+	moved = False
+	improved = True
+
+	while improved:
+		improved = False
+
+		for i in range(n):
+			neighbours = W.indices[W.indptr[i]:W.indptr[i + 1]]
+			weights = W.data[W.indptr[i]:W.indptr[i + 1]]
+			others = neighbours != i
+
+			if not others.any():
+				continue
+
+			old = community[i]
+			totals[old] -= k[i]
+
+			candidates, inverse = numpy.unique(community[neighbours[others]], return_inverse = True)
+			links = numpy.bincount(inverse, weights = weights[others])
+			gains = links - resolution * totals[candidates] * k[i] / two_m
+
+			own = numpy.flatnonzero(candidates == old)
+			stay_gain = gains[own[0]] if len(own) > 0 else -resolution * totals[old] * k[i] / two_m
+			best = numpy.argmax(gains)
+
+			new = candidates[best] if gains[best] > stay_gain + 1e-12 else old
+			totals[new] += k[i]
+
+			if new != old:
+				community[i] = new
+				improved = moved = True
+
+	return numpy.unique(community, return_inverse = True)[1], moved
+
+def communities(A, resolution = 1.0):
+	# Louvain communities of the network, ignoring edge direction. Returns (community of each node numbered from the largest down, modularity)
+	W = (A + A.T).tocsr()
+	W.sum_duplicates()
+
+	membership = numpy.arange(A.shape[0])
+	level = W
+
+	while level.shape[0] > 0:
+		community, moved = louvain_moves(level, resolution)
+
+		if not moved:
+			break
+
+		# Collapse each community into a single node and repeat on the smaller network
+		membership = community[membership]
+		C = community_matrix(community)
+		level = (C.T @ level @ C).tocsr()
+
+	# Number communities by decreasing size, ties by first node
+	sizes = numpy.bincount(membership)
+	first_node = numpy.full(len(sizes), len(membership))
+	numpy.minimum.at(first_node, membership, numpy.arange(len(membership)))
+	order = numpy.lexsort((first_node, -sizes))
+
+	renumber = numpy.empty(len(sizes), dtype = numpy.int64)
+	renumber[order] = numpy.arange(len(sizes))
+	membership = renumber[membership]
+
+	return membership, modularity(W, membership, resolution)
+
+###################################################################################################################################################################################
@@ -0,0 +1,412 @@
+from grn import intervals
+from grn import profiling
+from grn import store
+import subprocess
+import tempfile
+import zipfile
+import shutil
+import numpy
+import json
+import os
+
+###################################################################################################################################################################################
+
+# Peak annotation used by annotateBed_with_CHiC.py
+# CHiC annotation files are cached as pre-sorted NumPy arrays next to the original file (<CHiC file>.cache.npz). The cache records the size,
+# modification time and MD5 checksum of the CHiC file and is rebuilt when the file changes.
+# Peaks without a CHiC annotation can be assigned to their nearest TSS from a local TSS table, using per-chromosome binary search.
+# The CHiC step of peaks on different chromosomes is independent, so it can be run on one shard per chromosome in a process pool; the nearest gene
+# step is then run once for the peaks of every chromosome without a CHiC annotation, so Homer is only started once.
+# Several CHiC files (e.g. one per cell type) can be used at once: their sites are merged into one index, with the cell type as a group in the key
+# (as the motifs in intervals.iter_motif_peak_counts), so the CHiC target of every peak in every cell type is found in a single search.
+
+CACHE_SUFFIX = '.cache.npz'
+CACHE_VERSION = 1
+
+###################################################################################################################################################################################
+
+def read_chic(filename):
+	# Read a CHiC annotation file: the target gene is the 5th column
+	# The first line is treated as a header and skipped
+	chroms = []
+	starts = []
+	ends = []
+	genes = []
+
+	with open(filename, 'r') as chic:
+		for num,line in enumerate(chic):
+			if num == 0:
+				continue
+
+			fields = line.strip().split('\t')
+
+			chroms.append(fields[0])
+			starts.append(int(fields[1]))
+			ends.append(int(fields[2]))
+			genes.append(fields[4])
+
+	return intervals.Intervals(chroms, numpy.array(starts, dtype = numpy.int64), numpy.array(ends, dtype = numpy.int64), genes).sort()
+
+def write_cache(cache_file, chic, source):
+	# The cache is only an optimisation, so carry on without it if it cannot be written
+	try:
+		tmp_file = '%s.tmp.%d.npz' % (cache_file, os.getpid())
+		numpy.savez(tmp_file, chroms = chic.chroms, starts = chic.starts, ends = chic.ends, genes = chic.names, source = numpy.array(json.dumps(source)))
+		os.replace(tmp_file, cache_file)
+	except (OSError, IOError):
+		pass
+
+def cache_is_stale(cache_file, chic_file):
+	# A cache is stale if it is missing, cannot be read (e.g. truncated), was written by another cache version, or the CHiC file has changed
+	# If only the modification time of the CHiC file has changed but its checksum has not (e.g. it was copied or touched), the cache is kept
+	# and its source info updated, so the file is not checksummed again on the next run
+	if not os.path.exists(cache_file):
+		return True
+
+	try:
+		with numpy.load(cache_file) as cache:
+			source = json.loads(str(cache['source']))
+
+			if source.get('version') != CACHE_VERSION:
+				return True
+
+			current = store.source_info(chic_file, checksum = False)
+
+			if current['size'] != source['size']:
+				return True
+
+			if current['mtime'] == source['mtime']:
+				return False
+
+			if store.md5sum(chic_file) != source['md5']:
+				return True
+
+			chic = intervals.Intervals(cache['chroms'], cache['starts'], cache['ends'], cache['genes'])
+	except (OSError, ValueError, KeyError, EOFError, zipfile.BadZipFile):
+		return True
+
+	current['md5'] = source['md5']
+	current['version'] = CACHE_VERSION
+	write_cache(cache_file, chic, current)
+
+	return False
+
+def load_chic(filename):
+	# Load a CHiC annotation file through its cache, (re)building the cache if needed
+	# Returns (sorted Intervals with gene names, True if the cache was rebuilt)
+	cache_file = filename + CACHE_SUFFIX
+
+	if not cache_is_stale(cache_file, filename):
+		with numpy.load(cache_file) as cache:
+			chic = intervals.Intervals(cache['chroms'], cache['starts'], cache['ends'], cache['genes'])
+
+		return chic, False
+
+	chic = read_chic(filename)
+
+	source = store.source_info(filename)
+	source['version'] = CACHE_VERSION
+	write_cache(cache_file, chic, source)
+
+	return chic, True
+
+###################################################################################################################################################################################
+
+def last_overlap(query, targets):
+	# For each query interval, the index of the last overlapping target interval (in sorted target order), or -1 if there is none
+	# This matches taking the last hit of a bedtools intersect -wo against sorted targets
+	# The targets are coded first, so their chromosome codes follow their (lexicographic) order and their keys are sorted
+	chrom_index = dict()
+	target_codes = intervals.chrom_codes(targets, chrom_index) * intervals.CHROM_SHIFT
+	query_codes = intervals.chrom_codes(query, chrom_index) * intervals.CHROM_SHIFT
+
+	return last_overlap_keys(query_codes + query.starts, query_codes + query.ends, target_codes + targets.starts, target_codes + targets.ends, longest_interval(targets))
+
+def longest_interval(targets):
+	return int((targets.ends - targets.starts).max()) if len(targets) > 0 else 0
+
+def last_overlap_keys(query_starts, query_ends, target_starts, target_ends, max_length):
+	# last_overlap for packed interval keys (see intervals.py), with the targets sorted by start key and no target longer than max_length
+	# Targets are sorted by start, so the last candidate is the last target starting before the query ends.
+	# Walk back from there until an overlapping target is found, or until no earlier target could reach the query
+	candidate = numpy.searchsorted(target_starts, query_ends, side = 'left') - 1
+	result = numpy.full(len(query_starts), -1, dtype = numpy.int64)
+	pending = numpy.flatnonzero(candidate >= 0)
+
+	while len(pending) > 0:
+		i = candidate[pending]
+
+		overlaps = target_ends[i] > query_starts[pending]
+		result[pending[overlaps]] = i[overlaps]
+
+		# Continue with earlier targets that could still overlap
+		pending = pending[~overlaps]
+		candidate[pending] -= 1
+		i = candidate[pending]
+		pending = pending[(i >= 0) & (target_starts[numpy.maximum(i, 0)] + max_length > query_starts[pending])]
+
+	return result
+
+###################################################################################################################################################################################
+
+def read_tss(filename):
+	# Read a BED file of genes or TSSs with the gene ID in the 4th column
+	# The TSS is the start position, or the end position for genes on the - strand (6th column)
+	chroms = []
+	positions = []
+	genes = []
+
+	with open(filename, 'r') as tss:
+		for line in tss:
+			if line.startswith(('#', 'track', 'browser')) or not line.strip():
+				continue
+
+			fields = line.rstrip('\r\n').split('\t')
+
+			if len(fields) > 5 and fields[5] == '-':
+				position = int(fields[2]) - 1
+			else:
+				position = int(fields[1])
+
+			chroms.append(fields[0])
+			positions.append(position)
+			genes.append(fields[3])
+
+	positions = numpy.array(positions, dtype = numpy.int64)
+
+	return intervals.Intervals(chroms, positions, positions + 1, genes).sort()
+
+def nearest_tss(query, tss, max_dist):
+	# For each query interval, the gene whose TSS is closest to the centre of the interval
+	# Returns (gene IDs, distances). Intervals with no TSS within max_dist on the same chromosome get an empty gene ID
+	# The (sorted) TSSs are coded first, so their chromosome codes follow their order and their keys are sorted even for chromosomes with no query intervals
+	chrom_index = dict()
+	tss_codes = intervals.chrom_codes(tss, chrom_index)
+	query_codes = intervals.chrom_codes(query, chrom_index)
+
+	centres = query_codes * intervals.CHROM_SHIFT + (query.starts + query.ends) // 2
+	tss_keys = tss_codes * intervals.CHROM_SHIFT + tss.starts
+
+	genes = numpy.full(len(query), '', dtype = object)
+	distances = numpy.full(len(query), -1, dtype = numpy.int64)
+
+	if len(tss) == 0 or len(query) == 0:
+		return genes, distances
+
+	# The nearest TSS is either the last TSS at or before the centre or the first TSS after it
+	after = numpy.searchsorted(tss_keys, centres, side = 'right')
+	before = numpy.maximum(after - 1, 0)
+	after = numpy.minimum(after, len(tss_keys) - 1)
+
+	best = numpy.where(numpy.abs(tss_keys[after] - centres) < numpy.abs(centres - tss_keys[before]), after, before)
+	best_dist = numpy.abs(tss_keys[best] - centres)
+
+	# Only keep TSSs on the same chromosome and within the maximum distance
+	keep = (tss_codes[best] == query_codes) & (best_dist <= max_dist)
+
+	genes[keep] = tss.names[best[keep]]
+	distances[keep] = best_dist[keep]
+
+	return genes, distances
+
+###################################################################################################################################################################################
+
+def homer_nearest_genes(query, genome, max_dist, tmp_dir = None):
+	# Assign each query interval to its closest gene within max_dist using Homer's annotatePeaks.pl
+	# Homer is run in a private temporary directory so concurrent jobs never share files. Returns gene IDs ('' if none)
+	genes = numpy.full(len(query), '', dtype = object)
+
+	if len(query) == 0:
+		return genes
+
+	scratch = tempfile.mkdtemp(prefix = 'annotate.', dir = tmp_dir)
+
+	try:
+		bed_file = os.path.join(scratch, 'peaks.bed')
+		homer_output = os.path.join(scratch, 'Homer_output.tsv')
+
+		with open(bed_file, 'w') as bed:
+			for chrom, start, end in zip(query.chroms, query.starts, query.ends):
+				bed.write('%s\t%d\t%d\n' % (chrom, start, end))
+
+		with open(homer_output, 'w') as homer_out, open(os.path.join(scratch, 'Homer.log'), 'w') as homer_log:
+			status = subprocess.call(['annotatePeaks.pl', bed_file, genome, '-noann'], stdout = homer_out, stderr = homer_log, cwd = scratch)
+
+		if status != 0:
+			raise RuntimeError('annotatePeaks.pl failed (exit status %d)' % status)
+
+		homer_genes = dict()
+
+		with open(homer_output, 'r') as homer:
+			for num,line in enumerate(homer):
+				if num == 0:
+					continue
+
+				fields = line.strip().split('\t')
+
+				try:
+					dist_to_tss = abs(int(fields[9]))
+				except:
+					dist_to_tss = max_dist + 1
+
+				if dist_to_tss <= max_dist and len(fields) == 19:
+					# Homer automatically adds 1 to every start position - remove this
+					homer_genes[(fields[1], int(fields[2]) - 1, int(fields[3]))] = fields[15]
+	finally:
+		shutil.rmtree(scratch, ignore_errors = True)
+
+	for i, (chrom, start, end) in enumerate(zip(query.chroms, query.starts, query.ends)):
+		genes[i] = homer_genes.get((chrom, int(start), int(end)), '')
+
+	return genes
+
+###################################################################################################################################################################################
+
+def chic_genes(peaks, chic):
+	# The CHiC step of annotate_peaks: the gene of the last CHiC site overlapping each peak. Returns (gene IDs ('' if none), mask of peaks with a CHiC site)
+	has_chic = intervals.count_overlaps(peaks, chic) > 0
+	with_chic = numpy.flatnonzero(has_chic)
+
+	genes = numpy.full(len(peaks), '', dtype = object)
+	genes[with_chic] = chic.names[last_overlap(peaks.subset(with_chic), chic)]
+
+	return genes, has_chic
+
+def add_nearest_genes(peaks, genes, has_chic, tss = None, max_dist = 200000, genome = 'hg38', tmp_dir = None, profiler = None):
+	# The nearest gene step of annotate_peaks: peaks without a CHiC annotation (has_chic) are assigned to the nearest gene within max_dist (from the
+	# TSS table if given, otherwise from Homer, which is run once for all of them). Peaks with identical coordinates are reported once
+	# Returns (sorted annotated peaks with gene IDs as names, indices of these peaks, number of peaks with a CHiC annotation, number annotated to the nearest gene)
+	if profiler is None:
+		profiler = profiling.Profiler()
+
+	without_chic = numpy.flatnonzero(~has_chic)
+	genes = genes.astype(object)
+
+	with profiler.stage('nearest_gene'):
+		if tss is not None:
+			genes[without_chic] = nearest_tss(peaks.subset(without_chic), tss, max_dist)[0]
+		else:
+			genes[without_chic] = homer_nearest_genes(peaks.subset(without_chic), genome, max_dist, tmp_dir)
+
+	annotated = genes != ''
+	n_nearest = int(numpy.count_nonzero(annotated[without_chic]))
+
+	# Keep one line per distinct peak
+	distinct = numpy.ones(len(peaks), dtype = bool)
+	distinct[1:] = (peaks.chroms[1:] != peaks.chroms[:-1]) | (peaks.starts[1:] != peaks.starts[:-1]) | (peaks.ends[1:] != peaks.ends[:-1])
+
+	keep = numpy.flatnonzero(annotated & distinct)
+	annotated_peaks = intervals.Intervals(peaks.chroms[keep], peaks.starts[keep], peaks.ends[keep], genes[keep].astype(str))
+
+	return annotated_peaks, keep, len(peaks) - len(without_chic), n_nearest
+
+def annotate_peaks(peaks, chic, tss = None, max_dist = 200000, genome = 'hg38', tmp_dir = None, profiler = None):
+	# Annotate sorted peaks with their target gene: the last overlapping CHiC site, otherwise the nearest gene within max_dist
+	# (from the TSS table if given, otherwise from Homer). Peaks with identical coordinates are reported once
+	# Returns (sorted annotated peaks with gene IDs as names, number of peaks with a CHiC annotation, number annotated to the nearest gene)
+	if profiler is None:
+		profiler = profiling.Profiler()
+
+	with profiler.stage('chic'):
+		genes, has_chic = chic_genes(peaks, chic)
+
+	annotated_peaks, keep, n_with_chic, n_nearest = add_nearest_genes(peaks, genes, has_chic, tss, max_dist, genome, tmp_dir, profiler)
+
+	return annotated_peaks, n_with_chic, n_nearest
+
+def cell_type_names(filenames):
+	# Cell type names for CHiC files: the first part of the file name (e.g. CD34 for CD34_DHS_annoated_with_CHiC.bed), or the whole
+	# file name without the .bed extension if these are not unique
+	names = [os.path.basename(filename).split('_')[0] for filename in filenames]
+
+	if len(set(names)) < len(names):
+		names = [os.path.basename(filename)[:-len('.bed')] if filename.endswith('.bed') else os.path.basename(filename) for filename in filenames]
+
+	return names
+
+def cell_type_targets(peaks, chic_sets):
+	# For each CHiC set (sorted Intervals with gene names, one per cell type) and each peak, the gene of the last overlapping CHiC site ('' if none),
+	# as annotate_peaks finds it for each set alone. Returns a cell types x peaks array of gene IDs
+	# The sites of all cell types are searched together: the key of every site and peak is offset by its cell type, so sites only match peaks of their own cell type
+	sites = intervals.Intervals(numpy.concatenate([chic.chroms for chic in chic_sets]), numpy.concatenate([chic.starts for chic in chic_sets]), numpy.concatenate([chic.ends for chic in chic_sets]), numpy.concatenate([chic.names for chic in chic_sets]))
+	cell_types = numpy.repeat(numpy.arange(len(chic_sets), dtype = numpy.int64), [len(chic) for chic in chic_sets])
+
+	# All sites are coded first, so chromosome codes follow the (lexicographic) order of every set and the keys of the sets are sorted
+	chrom_index = dict()
+	site_codes = intervals.chrom_codes(sites, chrom_index) * intervals.CHROM_SHIFT
+	peak_codes = intervals.chrom_codes(peaks, chrom_index) * intervals.CHROM_SHIFT
+	group_shift = max(len(chrom_index), 1) * intervals.CHROM_SHIFT
+
+	site_keys = cell_types * group_shift + site_codes
+	offsets = numpy.arange(len(chic_sets), dtype = numpy.int64)[:, None] * group_shift
+
+	last = last_overlap_keys((peak_codes + peaks.starts + offsets).ravel(), (peak_codes + peaks.ends + offsets).ravel(), site_keys + sites.starts, site_keys + sites.ends, longest_interval(sites))
+
+	# Peaks with no CHiC site (-1) get the empty gene ID appended to the site genes
+	return numpy.append(sites.names, '')[last].reshape(len(chic_sets), len(peaks))
+
+def consensus_genes(targets):
+	# The gene assigned to each peak by the most cell types (targets from cell_type_targets), with ties going to the cell type listed first
+	# Returns (gene IDs, number of cell types assigning the gene). Peaks without a CHiC annotation in any cell type get '' and 0
+	has_gene = targets != ''
+	agreement = numpy.zeros(targets.shape, dtype = numpy.int64)
+
+	for cell_type in range(len(targets)):
+		agreement += (targets == targets[cell_type]) & has_gene
+
+	best = numpy.argmax(agreement, axis = 0)
+	columns = numpy.arange(targets.shape[1])
+
+	return targets[best, columns], agreement[best, columns]
+
+def cell_type_chic_genes(peaks, chic_sets):
+	# The CHiC step of annotate_peaks_by_cell_type. Returns (cell types x peaks array of CHiC gene IDs ('' if none), consensus gene IDs,
+	# number of cell types assigning the consensus gene)
+	targets = cell_type_targets(peaks, chic_sets)
+	consensus, support = consensus_genes(targets)
+
+	return targets, consensus, support
+
+def annotate_peaks_by_cell_type(peaks, chic_sets, tss = None, max_dist = 200000, genome = 'hg38', tmp_dir = None, profiler = None):
+	# Annotate sorted peaks with the CHiC target gene in each of several cell types (one sorted CHiC set each) and a consensus gene: the gene
+	# assigned by most cell types (see consensus_genes). Only peaks without a CHiC annotation in any cell type are assigned to the nearest gene,
+	# which is then their consensus gene. Peaks with identical coordinates are reported once
+	# Returns (sorted annotated peaks with the consensus gene IDs as names, peaks x cell types array of CHiC gene IDs ('' if none),
+	# number of cell types assigning the consensus gene, number of peaks with a CHiC annotation, number annotated to the nearest gene)
+	if profiler is None:
+		profiler = profiling.Profiler()
+
+	with profiler.stage('chic'):
+		targets, consensus, support = cell_type_chic_genes(peaks, chic_sets)
+
+	annotated_peaks, keep, n_with_chic, n_nearest = add_nearest_genes(peaks, consensus, support > 0, tss, max_dist, genome, tmp_dir, profiler)
+
+	return annotated_peaks, targets[:, keep].T, support[keep], n_with_chic, n_nearest
+
+###################################################################################################################################################################################
+
+def chromosome_shards(peaks, *tables):
+	# Split sorted peaks, and any other interval tables (or None), by chromosome
+	# Returns a list of (chromosome, peaks, table, ...) in chromosome order
+	shards = []
+	boundaries = numpy.flatnonzero(peaks.chroms[1:] != peaks.chroms[:-1]) + 1
+	starts = numpy.concatenate([[0], boundaries]) if len(peaks) > 0 else []
+	ends = numpy.concatenate([boundaries, [len(peaks)]]) if len(peaks) > 0 else []
+
+	for start, end in zip(starts, ends):
+		chrom = peaks.chroms[start]
+		shard = [chrom, peaks.subset(numpy.arange(start, end))]
+
+		for table in tables:
+			shard.append(None if table is None else table.subset(table.chroms == chrom))
+
+		shards.append(tuple(shard))
+
+	return shards
+
+def merge_chic_shards(shards):
+	# Merge the results of the CHiC step (chic_genes or cell_type_chic_genes) for the shards of chromosome_shards, in shard order, into the
+	# results for all the peaks. Arrays over peaks are joined along their last axis
+	return tuple(numpy.concatenate([shard[i] for shard in shards], axis = -1) for i in range(len(shards[0])))
+
+###################################################################################################################################################################################
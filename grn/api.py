@@ -0,0 +1,183 @@
+from grn import footprint_cache
+from grn import intervals
+from grn import network
+from grn import store
+from grn import tabix
+from grn import pwm
+import numpy
+import sys
+import os
+
+###################################################################################################################################################################################
+
+# Library interface for building gene regulatory networks from Python
+# These functions do the work of build_gene_regulatory_network.py and are shared by the command line scripts and the GRN service (grn_service.py):
+#
+#	peaks = api.load_peaks('peaks_annotated.bed')
+#	motif_positions = api.filter_motifs('motif_BED_files', api.load_motifs('motif_BED_files'), 'footprints.bed')
+#	gene_expression = api.load_expression('expression.tsv', min_value = 1)
+#	tf_annotation = api.load_tf_annotation('TF_family_gene_annotation.tsv')
+#	grn = api.build_network(peaks, motif_positions, gene_expression, tf_annotation)
+#	api.write_network(grn, 'grn.cyjs')
+#
+# Warnings are written to stderr, as in the scripts. Other messages are only written if a log file (e.g. sys.stdout) is given.
+
+###################################################################################################################################################################################
+
+def load_peaks(filename):
+	# Read an annotated BED file of peaks (gene ID in the 4th column), sorted by position
+	return intervals.read_bed(filename, names = True).sort()
+
+def peaks_in_regions(peaks, regions):
+	# Keep the peaks that overlap any of the regions (Intervals)
+	return intervals.filter_overlapping({'peaks': peaks}, regions)['peaks']
+
+def load_motifs(motif_dir, log = None, regions = None):
+	# Read the motif positions of a motif directory through its motif store, packing the store first if it is missing or out of date
+	# Falls back to reading the BED files if the store cannot be used. Returns motif ID -> Intervals
+	# With regions (Intervals, e.g. the peaks of a region-restricted build), only the motif sites overlapping them are read (see load_motifs_in_regions)
+	if regions is not None:
+		return load_motifs_in_regions(motif_dir, regions, log)
+
+	try:
+		motif_positions, rebuilt = store.load_motif_positions(motif_dir)
+
+		if rebuilt and log is not None:
+			log.write('Packed motif positions into %s/%s\n' % (motif_dir, store.STORE_FILE))
+
+		return motif_positions
+	except (OSError, IOError) as error:
+		sys.stderr.write('Warning: could not use motif store (%s). Reading BED files instead\n' % error)
+
+	return dict((motif_id, intervals.read_bed(motif_bed_file, scores = True)) for motif_id, motif_bed_file in store.motif_bed_files(motif_dir).items())
+
+def load_motifs_in_regions(motif_dir, regions, log = None):
+	# Motif sites overlapping the regions. Compressed, indexed motif files (see tabix.py) are read through their index;
+	# any other motif files are read through the motif store and filtered. Motifs are returned in the same (sorted) order as from the store
+	motif_files = store.motif_bed_files(motif_dir)
+	merged = tabix.merge_regions(regions)
+	motif_positions = dict()
+
+	for motif_id, motif_bed_file in motif_files.items():
+		if tabix.is_indexed(motif_bed_file):
+			motif_positions[motif_id] = tabix.fetch(motif_bed_file, merged, scores = True)
+
+	if len(motif_positions) < len(motif_files):
+		if log is not None:
+			log.write('Reading %d motifs without a tabix index in full\n' % (len(motif_files) - len(motif_positions)))
+
+		unindexed = dict((motif_id, sites) for motif_id, sites in load_motifs(motif_dir, log).items() if motif_id not in motif_positions)
+		motif_positions.update(intervals.filter_overlapping(unindexed, regions))
+
+	return dict((motif_id, motif_positions[motif_id]) for motif_id in sorted(motif_positions))
+
+def filter_motifs(motif_dir, motif_positions, footprints, cache_dir = None, cache_size = footprint_cache.MAX_CACHE_SIZE, log = None, regions = None):
+	# Keep the motif sites that overlap a footprint in a BED file of footprints
+	# The result is read from (or saved to) the footprint cache if the motif store of motif_dir is up to date
+	# For motif positions read in regions (load_motifs with regions), give the same regions: only footprints near them are read (through the index of
+	# a compressed, indexed footprint file) and the cache is not used
+	if regions is not None:
+		if tabix.is_indexed(footprints):
+			# Footprints overlapping a motif site lie within one site length of a region
+			padding = max([int((sites.ends - sites.starts).max()) for sites in motif_positions.values() if len(sites) > 0] or [0])
+			footprint_sites = tabix.fetch(footprints, tabix.merge_regions(regions, padding))
+		else:
+			footprint_sites = intervals.read_bed(footprints)
+
+		return intervals.filter_overlapping(motif_positions, footprint_sites)
+
+	if not store.is_stale(os.path.join(motif_dir, store.STORE_FILE), motif_dir):
+		try:
+			motif_positions, cached = footprint_cache.load_filtered_motifs(motif_dir, motif_positions, footprints, cache_dir, cache_size)
+
+			if cached and log is not None:
+				log.write('Read footprint-filtered motif positions from cache\n')
+
+			return motif_positions
+		except (OSError, IOError) as error:
+			sys.stderr.write('Warning: could not use footprint cache (%s)\n' % error)
+
+	return intervals.filter_overlapping(motif_positions, intervals.read_bed(footprints))
+
+def load_expression(filename, min_value = float('-inf')):
+	# Gene ID -> expression value for genes with expression of at least min_value
+	return network.read_expression(filename, min_value)
+
+def load_tf_annotation(filename):
+	# List of (gene ID, motif ID)
+	return network.read_tf_annotation(filename)
+
+def select_reference_genes(tf_annotation, gene_expression, motifs):
+	# (motif ID -> [reference gene ID, expression], expressed TF genes). See network.select_reference_genes
+	return network.select_reference_genes(tf_annotation, gene_expression, motifs)
+
+###################################################################################################################################################################################
+
+def motif_gene_hits(peaks, motif_positions, motifs = None, provenance = None, incidence = None):
+	# Yield (motif ID, [(gene ID, number of motifs), ...]) for each motif (all motifs, or the given motif IDs), counted with the interval index
+	# If provenance is a dictionary, the peaks behind each (motif, gene) pair are added to it
+	# If incidence is a dictionary, the (peak indices, motif counts) of the peaks hit by each motif are added to it (see cooccurrence.incidence_matrix)
+	if motifs is not None:
+		motif_positions = dict((motif_id, motif_positions[motif_id]) for motif_id in motif_positions if motif_id in motifs)
+
+	for motif_id, peak_counts in intervals.iter_motif_peak_counts(peaks, motif_positions):
+		if provenance is not None:
+			provenance[motif_id] = network.peak_hits(peaks, peak_counts)
+
+		if incidence is not None:
+			hit = numpy.flatnonzero(peak_counts)
+			incidence[motif_id] = (hit, peak_counts[hit])
+
+		yield motif_id, intervals.gene_hit_counts(peaks, peak_counts)
+
+def score_cutoffs(motifs, cutoffs, pwm_dir = None):
+	# Motif ID -> array of score cutoffs for each motif. The cutoffs are absolute scores unless a directory of Homer .motif files is given, in which
+	# case they are relative: multiples of the log-odds threshold of each motif (<pwm_dir>/<motif ID>.motif), so 1 is the threshold used to scan it
+	motif_cutoffs = dict()
+
+	for motif_id in motifs:
+		if pwm_dir is None:
+			motif_cutoffs[motif_id] = numpy.array(cutoffs, dtype = float)
+			continue
+
+		threshold = pwm.read_homer_motif(os.path.join(pwm_dir, '%s.motif' % motif_id)).threshold
+
+		if threshold <= 0:
+			raise ValueError('The log-odds threshold of %s is not positive, so relative score cutoffs cannot be used' % motif_id)
+
+		motif_cutoffs[motif_id] = numpy.array(cutoffs, dtype = float) * threshold
+
+	return motif_cutoffs
+
+def motif_gene_hits_by_cutoff(peaks, motif_positions, motif_cutoffs, motifs = None):
+	# Yield (motif ID, [[(gene ID, number of motifs), ...] for each cutoff]) for each motif (all motifs, or the given motif IDs), counting only the
+	# motif sites with a score of at least each cutoff (motif_cutoffs from score_cutoffs). All cutoffs are counted in one pass over the peaks
+	if motifs is not None:
+		motif_positions = dict((motif_id, motif_positions[motif_id]) for motif_id in motif_positions if motif_id in motifs)
+
+	for motif_id, cutoff_counts in intervals.iter_motif_peak_counts_by_score(peaks, motif_positions, motif_cutoffs):
+		yield motif_id, [intervals.gene_hit_counts(peaks, peak_counts) for peak_counts in cutoff_counts]
+
+def build_network(peaks, motif_positions, gene_expression, tf_annotation, all_genes = False, grn = None, provenance = False, profiler = None):
+	# Build a GRN from peaks, motif positions, expression data (from load_expression, already filtered by the minimum expression)
+	# and TF annotation. Unless all_genes is set, only TF genes are included as targets
+	# grn can be a cyjs.CyjsWriter to stream the network to a file; by default a networkx DiGraph is returned
+	# With provenance, each edge records the peaks behind it (see network.build_graph)
+	motif_ref_gene, motif_associated_genes = network.select_reference_genes(tf_annotation, gene_expression, motif_positions)
+	peak_provenance = dict() if provenance else None
+
+	gene_hits = motif_gene_hits(peaks, motif_positions, motif_ref_gene, peak_provenance)
+
+	return network.build_graph(gene_hits, motif_ref_gene, gene_expression, None if all_genes else set(motif_associated_genes), grn, peak_provenance, profiler)
+
+def write_network(grn, outfile):
+	# Write a networkx GRN to a Cytoscape JSON file (adding the .cyjs extension if needed). Returns the name of the file written
+	return network.write_cyjs(grn, outfile)
+
+def network_data(grn):
+	# The Cytoscape JSON document of a networkx GRN, as a dictionary
+	import networkx as nx
+
+	return nx.cytoscape_data(grn)
+
+###################################################################################################################################################################################
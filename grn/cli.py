@@ -0,0 +1,78 @@
+import runpy
+import sys
+import os
+
+###################################################################################################################################################################################
+
+# Single entry point for the command line scripts:
+#
+#	python -m grn <command> [arguments]
+#
+# Each command runs one of the scripts in the repository with the remaining arguments, exactly as if it was run directly, so the scripts and the
+# commands always take the same options. Only this module is imported before a command is chosen, and the scripts import heavy dependencies only
+# where they are used (networkx for in-memory graphs, pybedtools for bedtools cross-checks, scipy for motif co-occurrence), so a command starts
+# with what it needs: extract (like the other network queries) is pure Python, and the count matrix commands only add numpy.
+# benchmarks/startup_benchmark.py checks the start-up time and imports of every command against a budget
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Command, script and short description, in the order they are listed
+COMMANDS = [
+	('find-motifs', 'findMotifs.py', 'Find the positions of TF binding motifs in a set of peaks'),
+	('pack-motifs', 'packMotifs.py', 'Pack the motif positions of motif directories into their motif stores'),
+	('index-bed', 'indexBed.py', 'bgzip-compress and tabix-index BED files for region-restricted builds'),
+	('annotate', os.path.join('HiC_annotation_data', 'annotateBed_with_CHiC.py'), 'Annotate peaks to genes with promoter-capture HiC'),
+	('build', 'build_gene_regulatory_network.py', 'Build a GRN'),
+	('build-batch', 'build_gene_regulatory_network_batch.py', 'Build many GRNs in one run'),
+	('update', 'update_gene_regulatory_network.py', 'Update a GRN for gained and lost peaks'),
+	('serve', 'grn_service.py', 'Build GRNs on request from a long-running process'),
+	('extract', 'extract_TF_module_from_GRN.py', 'Extract the nodes connected to a TF binding motif'),
+	('index', 'GRN_to_index.py', 'Compile a GRN into an indexed database for fast module queries'),
+	('analyze', 'GRN_analysis.py', 'Node centrality, feedback loops and community modules of a GRN'),
+	('compare', 'compare_GRNs.py', 'Compare the GRNs of two or more conditions'),
+	('to-matrix', 'GRN_to_countMatrix.py', 'Convert a GRN to a motif count matrix'),
+	('from-matrix', 'countMatrix_to_GRN.py', 'Convert a motif count matrix to a GRN'),
+]
+
+###################################################################################################################################################################################
+
+def usage():
+	lines = ['usage: python -m grn <command> [arguments]', '', 'Gene regulatory network tools. Run a command with -h for its arguments', '', 'commands:']
+	lines.extend('  %-13s %s' % (command, description) for command, script, description in COMMANDS)
+
+	return '\n'.join(lines) + '\n'
+
+def script_path(command):
+	# Path of the script run by a command (None for an unknown command)
+	for name, script, description in COMMANDS:
+		if name == command:
+			return os.path.join(REPO_DIR, script)
+
+	return None
+
+def main(argv = None):
+	# argparse is not used here, so that it is only imported by the script of the command
+	argv = sys.argv[1:] if argv is None else list(argv)
+
+	if len(argv) == 0 or argv[0] in ('-h', '--help'):
+		sys.stdout.write(usage())
+		return 0 if len(argv) > 0 else 2
+
+	script = script_path(argv[0])
+
+	if script is None:
+		sys.stderr.write(usage())
+		sys.stderr.write('\ngrn: error: unknown command %s\n' % argv[0])
+		return 2
+
+	# The script gets the remaining arguments, as if it was run directly
+	sys.argv = [script] + argv[1:]
+
+	if REPO_DIR not in sys.path:
+		sys.path.insert(0, REPO_DIR)
+
+	runpy.run_path(script, run_name = '__main__')
+
+	return 0
+
+###################################################################################################################################################################################
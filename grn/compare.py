@@ -0,0 +1,162 @@
+from grn import count_matrix
+from grn import cyjs
+import numpy
+import os
+
+###################################################################################################################################################################################
+
+# Differential comparison of GRNs built for different conditions, used by compare_GRNs.py
+# Each network is reduced to (target gene, motif, count) triplets, as in a count matrix. Gene and motif names of all networks are mapped to one
+# shared index, so that every edge has an integer key (motif index * number of genes + gene index). The union of keys is found with numpy.unique
+# and each network's counts are placed into a keys x conditions matrix with one searchsorted call; all comparisons are then column operations
+# on this matrix rather than joins of per-network dictionaries.
+#
+# Each condition is compared with the first (reference) condition. An edge is:
+#	gained		absent in the reference, present in the condition
+#	lost		present in the reference, absent in the condition
+#	changed		present in both with |log2((count + 1) / (reference count + 1))| of at least the minimum fold change
+#	absent		absent from both (the edge is only in other conditions)
+#	unchanged	otherwise
+
+STATUS = numpy.array(['unchanged', 'gained', 'lost', 'changed', 'absent'])
+UNCHANGED, GAINED, LOST, CHANGED, ABSENT = range(len(STATUS))
+
+REWIRING_HEADER = 'Motif\tSource\tCondition\tReference_targets\tTargets\tGained\tLost\tChanged\tJaccard_distance\tWeighted_rewiring'
+
+###################################################################################################################################################################################
+
+class Network(object):
+	# Edges of one network as (target gene, motif, count) arrays, the source node of each motif, and the expression of each node (None if unknown)
+
+	def __init__(self, name, targets, motifs, counts, motif_sources, nodes):
+		self.name = name
+		self.targets = numpy.asarray(targets, dtype = str)
+		self.motifs = numpy.asarray(motifs, dtype = str)
+		self.counts = numpy.asarray(counts, dtype = numpy.int64)
+		self.motif_sources = motif_sources
+		self.nodes = nodes
+
+def condition_name(filename):
+	name = os.path.basename(filename)
+
+	for extension in ('.cyjs', '.tsv', '.txt', '.mtx', '.npz'):
+		if name.endswith(extension):
+			return name[:-len(extension)]
+
+	return name
+
+def read_network(filename, name = None, format = None):
+	# Read a cyjs file (streamed) or a count matrix. Edges of a cyjs file are keyed by their source_motif attribute, or by their source node if
+	# they have none (e.g. networks made by countMatrix_to_GRN.py). In a count matrix the motifs are the source nodes
+	name = name if name else condition_name(filename)
+
+	if filename.endswith('.cyjs'):
+		targets = list()
+		motifs = list()
+		counts = list()
+		motif_sources = dict()
+		nodes = dict()
+
+		for element_type, data in cyjs.iter_elements(filename):
+			if element_type == 'node':
+				nodes[data['value']] = data.get('expression')
+			else:
+				motif_id = data.get('source_motif', data['source'])
+				motif_sources.setdefault(motif_id, data['source'])
+
+				targets.append(data['target'])
+				motifs.append(motif_id)
+				counts.append(data['count'])
+
+		return Network(name, targets, motifs, counts, motif_sources, nodes)
+
+	matrix = count_matrix.read(filename, format)
+	genes = numpy.array(matrix.genes, dtype = str)
+	motif_ids = numpy.array(matrix.motifs, dtype = str)
+	present = matrix.counts != 0
+
+	nodes = dict((motif_id, None) for motif_id in matrix.motifs)
+	nodes.update((gene_id, None) for gene_id in matrix.genes)
+
+	return Network(name, genes[matrix.rows[present]], motif_ids[matrix.cols[present]], matrix.counts[present], dict((motif_id, motif_id) for motif_id in matrix.motifs), nodes)
+
+###################################################################################################################################################################################
+
+def unique_names(names):
+	# The same as numpy.unique(names, return_inverse = True) for a list of strings: (sorted distinct names, index of each name in them)
+	# The names are coded with a dictionary and only the distinct names are sorted, which is much faster than sorting every name
+	index = dict()
+	codes = numpy.fromiter((index.setdefault(name, len(index)) for name in names), dtype = numpy.int64, count = len(names))
+
+	distinct = numpy.array(list(index), dtype = str)
+	order = numpy.argsort(distinct, kind = 'stable')
+	rank = numpy.empty(len(order), dtype = numpy.int64)
+	rank[order] = numpy.arange(len(order))
+
+	return distinct[order], rank[codes]
+
+def align(networks):
+	# Align networks on a shared gene x motif index. Returns (genes, motifs, gene index of each edge, motif index of each edge, edges x networks count matrix)
+	genes, gene_codes = unique_names([target for network in networks for target in network.targets.tolist()])
+	motifs, motif_codes = unique_names([motif_id for network in networks for motif_id in network.motifs.tolist()])
+
+	keys = motif_codes.astype(numpy.int64) * len(genes) + gene_codes
+	union = numpy.unique(keys)
+
+	counts = numpy.zeros((len(union), len(networks)), dtype = numpy.int64)
+	offset = 0
+
+	for i, network in enumerate(networks):
+		network_keys = keys[offset:offset + len(network.counts)]
+
+		# A network has at most one edge per key (a later motif replaces an edge), but add duplicates to be safe
+		numpy.add.at(counts[:, i], numpy.searchsorted(union, network_keys), network.counts)
+		offset += len(network.counts)
+
+	return genes, motifs, union % max(len(genes), 1), union // max(len(genes), 1), counts
+
+def classify(counts, min_log2_fold = 1.0, reference = 0):
+	# (log2 fold change, status) of every edge in every condition relative to the reference condition (edges x conditions arrays)
+	# Absent edges have a log2 fold change of 0; the reference column has status unchanged (or absent) by definition
+	reference_counts = counts[:, reference][:, None]
+	log2_fold = numpy.log2((counts + 1) / (reference_counts + 1))
+
+	in_reference = reference_counts > 0
+	in_condition = counts > 0
+
+	status = numpy.full(counts.shape, UNCHANGED, dtype = numpy.int64)
+	status[~in_reference & in_condition] = GAINED
+	status[in_reference & ~in_condition] = LOST
+	status[in_reference & in_condition & (numpy.abs(log2_fold) >= min_log2_fold)] = CHANGED
+	status[~in_reference & ~in_condition] = ABSENT
+	log2_fold[~in_reference & ~in_condition] = 0
+
+	return log2_fold, status
+
+def rewiring(motif_codes, n_motifs, counts, status, reference = 0):
+	# Per-motif rewiring of each condition relative to the reference (n_motifs x conditions arrays):
+	# (reference targets, targets, gained, lost, changed, Jaccard distance of the target sets, weighted rewiring = sum |count - reference count| / sum (count + reference count))
+	def per_motif(values):
+		return numpy.stack([numpy.bincount(motif_codes, weights = values[:, i], minlength = n_motifs) for i in range(values.shape[1])], axis = 1)
+
+	reference_counts = counts[:, reference][:, None]
+	in_condition = (counts > 0).astype(float)
+	in_reference = numpy.broadcast_to(reference_counts > 0, counts.shape).astype(float)
+
+	reference_targets = per_motif(in_reference)
+	targets = per_motif(in_condition)
+	gained = per_motif((status == GAINED).astype(float))
+	lost = per_motif((status == LOST).astype(float))
+	changed = per_motif((status == CHANGED).astype(float))
+
+	union = per_motif(numpy.maximum(in_condition, in_reference))
+	intersection = per_motif(in_condition * in_reference)
+	jaccard_distance = 1 - numpy.divide(intersection, union, out = numpy.ones(union.shape), where = union > 0)
+
+	difference = per_motif(numpy.abs(counts - reference_counts).astype(float))
+	total = per_motif((counts + reference_counts).astype(float))
+	weighted = numpy.divide(difference, total, out = numpy.zeros(total.shape), where = total > 0)
+
+	return reference_targets.astype(numpy.int64), targets.astype(numpy.int64), gained.astype(numpy.int64), lost.astype(numpy.int64), changed.astype(numpy.int64), jaccard_distance, weighted
+
+###################################################################################################################################################################################
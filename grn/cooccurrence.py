@@ -0,0 +1,140 @@
+from grn import count_matrix
+from grn import significance
+from grn import network
+import numpy
+
+###################################################################################################################################################################################
+
+# Motif co-occurrence in peaks, used by build_gene_regulatory_network.py (--cooccurrence, --combinatorial)
+# The motif counts of every peak are collected while motifs are counted (api.motif_gene_hits) into a sparse peak x motif incidence matrix M.
+# With B the binary (motif present) form of M, C = B^T B gives the number of peaks containing each pair of motifs in one sparse matrix product.
+#
+# Longer peaks contain more motifs of every kind, so the expected number of peaks with both motifs of a pair is computed within bins of peaks of
+# similar length (E = sum over bins of n_a * n_b / n, with n_a and n_b the peaks with each motif and n the peaks in the bin). The p-value is the
+# Poisson upper tail probability of the observed count given E (conservative, as the variance of the count is at most E), and the FDR is the
+# Benjamini-Hochberg adjusted p-value over all pairs seen together in at least one peak.
+# scipy is slow to import, so it is imported by the functions that use it and builds without these options start without it
+
+COOCCURRENCE_HEADER = 'Motif_A\tMotif_B\tPeaks_A\tPeaks_B\tPeaks_both\tExpected\tLog2_enrichment\tP-value\tFDR'
+
+# Number of peak length bins for the expected counts
+LENGTH_BINS = 10
+
+###################################################################################################################################################################################
+
+def incidence_matrix(n_peaks, motif_peak_counts):
+	# Sparse peak x motif matrix of motif counts from motif ID -> (peak indices, counts). Motifs are sorted by ID. Returns (motif IDs, CSC matrix)
+	import scipy.sparse
+
+	motif_ids = sorted(motif_peak_counts)
+	rows = [motif_peak_counts[motif_id][0] for motif_id in motif_ids]
+	cols = [numpy.full(len(hits), i) for i, hits in enumerate(rows)]
+	counts = [motif_peak_counts[motif_id][1] for motif_id in motif_ids]
+
+	if len(motif_ids) == 0:
+		return motif_ids, scipy.sparse.csc_matrix((n_peaks, 0), dtype = numpy.int64)
+
+	M = scipy.sparse.csc_matrix((numpy.concatenate(counts).astype(numpy.int64), (numpy.concatenate(rows), numpy.concatenate(cols))), shape = (n_peaks, len(motif_ids)))
+
+	return motif_ids, M
+
+def peak_labels(peaks):
+	# chrom:start-end label of every peak
+	return ['%s:%d-%d' % peak for peak in zip(peaks.chroms.tolist(), peaks.starts.tolist(), peaks.ends.tolist())]
+
+def write_incidence(filename, peaks, motif_ids, M, format = None):
+	# Write the incidence matrix as a count matrix (one row per peak) in any of the count_matrix formats
+	M = M.tocoo()
+	matrix = count_matrix.CountMatrix(peak_labels(peaks), motif_ids, M.row, M.col, M.data)
+	count_matrix.write(matrix, filename, format if format else count_matrix.guess_format(filename, check_header = False))
+
+###################################################################################################################################################################################
+
+def length_bin_counts(B, peak_lengths, n_bins = LENGTH_BINS):
+	# (bins x motifs matrix of the number of peaks with each motif, number of peaks in each bin) for peaks binned by length quantile
+	import scipy.sparse
+
+	ranks = numpy.empty(len(peak_lengths), dtype = numpy.int64)
+	ranks[numpy.argsort(peak_lengths, kind = 'stable')] = numpy.arange(len(peak_lengths))
+	bins = ranks * n_bins // max(len(peak_lengths), 1)
+
+	S = scipy.sparse.csr_matrix((numpy.ones(len(bins)), (bins, numpy.arange(len(bins)))), shape = (n_bins, len(bins)))
+
+	return (S @ B).toarray(), numpy.bincount(bins, minlength = n_bins)
+
+def cooccurrence(M, peak_lengths):
+	# Co-occurrence of every pair of motifs seen together in at least one peak
+	# Returns a list of (motif index a, motif index b, peaks with a, peaks with b, peaks with both, expected, log2 enrichment, p-value, FDR), a < b
+	import scipy.sparse
+	import scipy.stats
+
+	B = (M > 0).astype(numpy.float64).tocsc()
+	C = scipy.sparse.triu(B.T @ B, k = 1).tocoo()
+
+	motif_peaks = numpy.asarray(B.sum(axis = 0)).ravel().astype(numpy.int64)
+	bin_counts, bin_sizes = length_bin_counts(B, peak_lengths)
+	weighted = bin_counts / numpy.maximum(bin_sizes, 1)[:, None]
+
+	# Expected counts are only needed for the pairs that occur: sum over bins of n_a * n_b / n
+	observed = C.data.astype(numpy.int64)
+	expected = (weighted[:, C.row] * bin_counts[:, C.col]).sum(axis = 0)
+
+	pvalues = scipy.stats.poisson.sf(observed - 1, expected)
+	fdr = significance.benjamini_hochberg(pvalues)
+	enrichment = numpy.log2(observed / numpy.maximum(expected, 1e-300))
+
+	order = numpy.lexsort((C.col, C.row))
+
+	return [(int(C.row[i]), int(C.col[i]), int(motif_peaks[C.row[i]]), int(motif_peaks[C.col[i]]), int(observed[i]), float(expected[i]), float(enrichment[i]), float(pvalues[i]), float(fdr[i])) for i in order]
+
+def write_cooccurrence(filename, motif_ids, pairs):
+	lines = [COOCCURRENCE_HEADER]
+
+	for pair in pairs:
+		lines.append('%s\t%s\t%d\t%d\t%d\t%.4f\t%.4f\t%.4g\t%.4g' % ((motif_ids[pair[0]], motif_ids[pair[1]]) + pair[2:]))
+
+	with open(filename, 'w') as out:
+		out.write('\n'.join(lines) + '\n')
+
+###################################################################################################################################################################################
+
+def add_combinatorial_edges(grn, peaks, motif_ids, M, pairs, motif_ref_gene, gene_expression, tf_genes = None, max_fdr = 0.05):
+	# Add an edge from a combined source node (<reference gene A>+<reference gene B>) to each target gene with a peak containing both motifs of an enriched pair
+	# (FDR at most max_fdr and more co-occurrence than expected). The edge count is the number of such peaks. Targets are filtered as in network.build_graph
+	# Returns the number of pairs that made at least one edge
+	M = M.tocsc()
+	n_pairs = 0
+
+	for a, b, peaks_a, peaks_b, peaks_both, expected, enrichment, pvalue, fdr in pairs:
+		if fdr > max_fdr or enrichment <= 0:
+			continue
+
+		motif_a, motif_b = motif_ids[a], motif_ids[b]
+
+		if motif_a not in motif_ref_gene or motif_b not in motif_ref_gene or motif_ref_gene[motif_a][0] == motif_ref_gene[motif_b][0]:
+			continue # Skip if either motif has no reference gene, or both have the same one
+
+		both = numpy.intersect1d(M.indices[M.indptr[a]:M.indptr[a + 1]], M.indices[M.indptr[b]:M.indptr[b + 1]], assume_unique = True)
+		gene_hits = [(gene_id, 1) for gene_id in peaks.names[both].tolist()]
+		gene_peak_count = network.target_counts(gene_hits, gene_expression, tf_genes)
+
+		if len(gene_peak_count) == 0:
+			continue
+
+		(gene_a, expression_a), (gene_b, expression_b) = motif_ref_gene[motif_a], motif_ref_gene[motif_b]
+		source_node = '%s+%s' % (gene_a, gene_b)
+
+		if not grn.has_node(source_node):
+			grn.add_node(source_node, expression = min(expression_a, expression_b), combination = [gene_a, gene_b])
+
+		for target_node, count in gene_peak_count.items():
+			if not grn.has_node(target_node):
+				grn.add_node(target_node, expression = gene_expression[target_node])
+
+			grn.add_edge(source_node, target_node, count = count, source_motif = '%s+%s' % (motif_a, motif_b), pair_fdr = fdr)
+
+		n_pairs += 1
+
+	return n_pairs
+
+###################################################################################################################################################################################
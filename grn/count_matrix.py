@@ -0,0 +1,194 @@
+import numpy
+import os
+
+###################################################################################################################################################################################
+
+# Gene x motif count matrices used by GRN_to_countMatrix.py and countMatrix_to_GRN.py
+# Matrices are held as sparse (row, column, count) triplets and can be read/written as:
+#	dense	Tab-delimited table with a 'Motif' header line, one row per gene and one column per motif (default, for R and Excel)
+#	coo	Tab-delimited triplets with a 'Gene	Motif	Count' header line and one line per non-zero entry
+#	mtx	Matrix Market coordinate file. Gene and motif names are written to <name>.genes.tsv and <name>.motifs.tsv
+#	npz	NumPy archive in the scipy.sparse COO layout (readable with scipy.sparse.load_npz), plus 'genes' and 'motifs' name arrays
+
+FORMATS = ['dense', 'coo', 'mtx', 'npz']
+
+COO_HEADER = 'Gene\tMotif\tCount'
+MTX_HEADER = '%%MatrixMarket matrix coordinate integer general'
+
+###################################################################################################################################################################################
+
+class CountMatrix(object):
+
+	def __init__(self, genes, motifs, rows, cols, counts):
+		self.genes = list(genes)
+		self.motifs = list(motifs)
+		self.rows = numpy.asarray(rows, dtype = numpy.int64)
+		self.cols = numpy.asarray(cols, dtype = numpy.int64)
+		self.counts = numpy.asarray(counts, dtype = numpy.int64)
+
+	def __len__(self):
+		return len(self.counts)
+
+	def dense(self):
+		matrix = numpy.zeros((len(self.genes), len(self.motifs)), dtype = numpy.int64)
+		matrix[self.rows, self.cols] = self.counts
+
+		return matrix
+
+	def sorted(self):
+		# Return the matrix with entries in row-major order (the order in which a dense matrix is read)
+		order = numpy.lexsort((self.cols, self.rows))
+		return CountMatrix(self.genes, self.motifs, self.rows[order], self.cols[order], self.counts[order])
+
+def from_edges(edges):
+	# Build a count matrix from (target gene, motif ID, count) edges. Genes and motifs are sorted by name
+	targets = [target for target, motif_id, count in edges]
+	motif_ids = [motif_id for target, motif_id, count in edges]
+
+	genes = sorted(set(targets))
+	motifs = sorted(set(motif_ids))
+
+	gene_index = dict((gene_id, i) for i, gene_id in enumerate(genes))
+	motif_index = dict((motif_id, i) for i, motif_id in enumerate(motifs))
+
+	rows = [gene_index[target] for target in targets]
+	cols = [motif_index[motif_id] for motif_id in motif_ids]
+	counts = [int(count) for target, motif_id, count in edges]
+
+	return CountMatrix(genes, motifs, rows, cols, counts)
+
+###################################################################################################################################################################################
+
+def guess_format(filename, check_header = True):
+	# Guess the matrix format from the file extension, or from the header line of an existing tab-delimited file
+	if filename.endswith('.mtx'):
+		return 'mtx'
+
+	if filename.endswith('.npz'):
+		return 'npz'
+
+	if check_header and os.path.exists(filename):
+		with open(filename, 'r') as matrix_file:
+			if matrix_file.readline().rstrip('\r\n') == COO_HEADER:
+				return 'coo'
+
+	return 'dense'
+
+def mtx_name_files(filename):
+	base = filename[:-len('.mtx')] if filename.endswith('.mtx') else filename
+	return base + '.genes.tsv', base + '.motifs.tsv'
+
+def write(matrix, filename, format = 'dense'):
+	# Write a count matrix. Each format is written with a single bulk write of the whole file
+	if format == 'dense':
+		dense = matrix.dense().astype(str)
+		lines = ['Motif\t%s' % '\t'.join(matrix.motifs)]
+		lines.extend('%s\t%s' % (gene_id, '\t'.join(row)) for gene_id, row in zip(matrix.genes, dense))
+
+		with open(filename, 'w') as out:
+			out.write('\n'.join(lines) + '\n')
+
+	elif format == 'coo':
+		matrix = matrix.sorted()
+		genes = numpy.array(matrix.genes, dtype = str)
+		motifs = numpy.array(matrix.motifs, dtype = str)
+
+		lines = [COO_HEADER]
+		lines.extend('%s\t%s\t%d' % entry for entry in zip(genes[matrix.rows], motifs[matrix.cols], matrix.counts.tolist()))
+
+		with open(filename, 'w') as out:
+			out.write('\n'.join(lines) + '\n')
+
+	elif format == 'mtx':
+		matrix = matrix.sorted()
+		lines = [MTX_HEADER, '%d %d %d' % (len(matrix.genes), len(matrix.motifs), len(matrix))]
+		lines.extend('%d %d %d' % entry for entry in zip((matrix.rows + 1).tolist(), (matrix.cols + 1).tolist(), matrix.counts.tolist()))
+
+		with open(filename, 'w') as out:
+			out.write('\n'.join(lines) + '\n')
+
+		genes_file, motifs_file = mtx_name_files(filename)
+
+		with open(genes_file, 'w') as out:
+			out.write('\n'.join(matrix.genes) + '\n')
+
+		with open(motifs_file, 'w') as out:
+			out.write('\n'.join(matrix.motifs) + '\n')
+
+	elif format == 'npz':
+		numpy.savez_compressed(filename, format = numpy.array(b'coo'), shape = numpy.array([len(matrix.genes), len(matrix.motifs)]),
+			row = matrix.rows.astype(numpy.int32), col = matrix.cols.astype(numpy.int32), data = matrix.counts,
+			genes = numpy.array(matrix.genes, dtype = str), motifs = numpy.array(matrix.motifs, dtype = str))
+
+	else:
+		raise ValueError('Unknown count matrix format: %s' % format)
+
+###################################################################################################################################################################################
+
+def read_dense(filename):
+	with open(filename, 'r') as matrix_file:
+		lines = matrix_file.read().splitlines()
+
+	motifs = lines[0].strip().split('\t')[1:]
+	rows = [line.strip().split('\t') for line in lines[1:] if line.strip()]
+
+	genes = [row[0].replace(' ', '') for row in rows] # Strip tailing whitespace from gene IDs
+	counts = numpy.array([row[1:len(motifs) + 1] for row in rows], dtype = numpy.int64).reshape(len(rows), len(motifs))
+
+	gene_rows, motif_cols = numpy.nonzero(counts)
+
+	return CountMatrix(genes, motifs, gene_rows, motif_cols, counts[gene_rows, motif_cols])
+
+def read_coo(filename):
+	with open(filename, 'r') as matrix_file:
+		lines = matrix_file.read().splitlines()[1:]
+
+	entries = numpy.array([line.split('\t') for line in lines if line.strip()], dtype = str).reshape(-1, 3)
+
+	# Genes are numbered in order of first appearance and motifs are sorted by name (the column order of a dense matrix)
+	genes, gene_first, rows = numpy.unique(entries[:, 0], return_index = True, return_inverse = True)
+	motifs, cols = numpy.unique(entries[:, 1], return_inverse = True)
+
+	gene_order = numpy.argsort(gene_first, kind = 'stable')
+	gene_rank = numpy.empty(len(genes), dtype = numpy.int64)
+	gene_rank[gene_order] = numpy.arange(len(genes))
+
+	return CountMatrix(genes[gene_order].tolist(), motifs.tolist(), gene_rank[rows.ravel()], cols.ravel(), entries[:, 2].astype(numpy.int64))
+
+def read_mtx(filename):
+	with open(filename, 'r') as matrix_file:
+		lines = [line for line in matrix_file.read().splitlines() if line.strip() and not line.startswith('%')]
+
+	entries = numpy.array([line.split() for line in lines[1:]], dtype = numpy.int64).reshape(-1, 3)
+
+	genes_file, motifs_file = mtx_name_files(filename)
+
+	with open(genes_file, 'r') as names:
+		genes = names.read().splitlines()
+
+	with open(motifs_file, 'r') as names:
+		motifs = names.read().splitlines()
+
+	return CountMatrix(genes, motifs, entries[:, 0] - 1, entries[:, 1] - 1, entries[:, 2])
+
+def read_npz(filename):
+	with numpy.load(filename) as archive:
+		return CountMatrix(archive['genes'].tolist(), archive['motifs'].tolist(), archive['row'], archive['col'], archive['data'])
+
+def read(filename, format = None):
+	# Read a count matrix, guessing the format if not given
+	if format is None:
+		format = guess_format(filename)
+
+	if format == 'dense':
+		return read_dense(filename)
+	elif format == 'coo':
+		return read_coo(filename)
+	elif format == 'mtx':
+		return read_mtx(filename)
+	elif format == 'npz':
+		return read_npz(filename)
+
+	raise ValueError('Unknown count matrix format: %s' % format)
+
+###################################################################################################################################################################################
@@ -0,0 +1,298 @@
+import tempfile
+import math
+import json
+
+###################################################################################################################################################################################
+
+# Streaming Cytoscape JSON (.cyjs) reader and writer
+# These read and write the same documents as networkx.cytoscape_graph/cytoscape_data + json.load/json.dump, without holding the whole network
+# (as a graph, a dictionary copy and a JSON string) in memory.
+
+CHUNK_SIZE = 2 ** 16
+
+# Number of edge records copied from the spool at a time when they can be copied in order
+EDGE_BLOCK = 2 ** 14
+
+def cyjs_filename(outfile):
+	# Ensure output file has correct file extension
+	if not outfile.endswith('.cyjs'):
+		outfile = outfile + '.cyjs'
+
+	return outfile
+
+###################################################################################################################################################################################
+
+class CyjsWriter(object):
+	# Incremental writer with the DiGraph methods used to build a GRN (has_node, add_node, add_edge, number_of_nodes, number_of_edges)
+	# Nodes are written to the output file as they are added. Edges are spooled to a temporary file and appended when the writer is closed,
+	# grouped by source node in node order (the order used by networkx). Adding an existing edge replaces its attributes, as with networkx.
+
+	def __init__(self, filename):
+		self.filename = filename
+		self.out = open(filename, 'w')
+		self.out.write('{"data": [], "directed": true, "multigraph": false, "elements": {"nodes": [')
+
+		self.nodes = dict() # Node -> index, in order added
+		self.edges = dict() # (source, target) -> position in edge_records[source index]
+		self.edge_records = list() # Per source node: list of (spool offset, length)
+
+		self.spool = tempfile.TemporaryFile()
+		self.spool_size = 0
+
+	def has_node(self, node):
+		return node in self.nodes
+
+	def add_node(self, node, **attributes):
+		if node in self.nodes:
+			raise ValueError('Node %s has already been written' % node)
+
+		data = dict(attributes)
+		data['id'] = attributes.get('id') or str(node)
+		data['value'] = node
+		data['name'] = attributes.get('name') or str(node)
+
+		if len(self.nodes) > 0:
+			self.out.write(', ')
+
+		self.out.write(json.dumps({'data': data}))
+
+		self.nodes[node] = len(self.nodes)
+		self.edge_records.append(list())
+
+	def add_edge(self, source, target, **attributes):
+		if source not in self.nodes or target not in self.nodes:
+			raise ValueError('Nodes must be added before the edges between them')
+
+		data = dict(attributes)
+		data['source'] = source
+		data['target'] = target
+
+		self.add_record(source, target, json.dumps({'data': data}))
+
+	def add_edges(self, sources, targets, **columns):
+		# Add many edges: sources and targets are lists of nodes, and each attribute a list with a value for every edge
+		# The same as add_edge for each edge in turn, but the values are encoded a column at a time, so this is much faster for large networks
+		missing = (set(sources) | set(targets)) - set(self.nodes)
+
+		if len(missing) > 0:
+			raise ValueError('Nodes must be added before the edges between them')
+
+		# Records have the same layout as json.dumps({'data': data}) in add_edge: the attributes in the order given, then source and target
+		template = '{"data": {%s}}' % ', '.join('%s: %%s' % json.dumps(key) for key in list(columns) + ['source', 'target'])
+		encoded = [encode_column(values) for values in list(columns.values()) + [sources, targets]]
+		records = [template % values for values in zip(*encoded)]
+
+		self.spool.write(''.join(records).encode('ascii'))
+
+		for source, target, length in zip(sources, targets, map(len, records)):
+			self.add_position(source, target, length)
+
+	def add_record(self, source, target, record):
+		# Records are ASCII (json.dumps escapes everything else), so their length in characters is their length in bytes
+		self.spool.write(record.encode('ascii'))
+		self.add_position(source, target, len(record))
+
+	def add_position(self, source, target, length):
+		# Record the position of an edge record just written to the spool
+		records = self.edge_records[self.nodes[source]]
+
+		if (source, target) in self.edges:
+			records[self.edges[(source, target)]] = (self.spool_size, length)
+		else:
+			self.edges[(source, target)] = len(records)
+			records.append((self.spool_size, length))
+
+		self.spool_size += length
+
+	def number_of_nodes(self):
+		return len(self.nodes)
+
+	def number_of_edges(self):
+		return len(self.edges)
+
+	def close(self):
+		self.out.write('], "edges": [')
+
+		# Edges can be copied straight from the spool if they were added grouped by source node, in node order, with no replacements
+		records = [record for source_records in self.edge_records for record in source_records]
+		position = 0
+		is_sequential = True
+
+		for offset, length in records:
+			if offset != position:
+				is_sequential = False
+				break
+
+			position += length
+
+		self.spool.seek(0)
+
+		if is_sequential:
+			# Copy blocks of records, splitting each block into its records
+			for block in range(0, len(records), EDGE_BLOCK):
+				block_records = records[block:block + EDGE_BLOCK]
+				block_start = block_records[0][0]
+				data = self.spool.read(position - block_start if block + EDGE_BLOCK >= len(records) else records[block + EDGE_BLOCK][0] - block_start).decode('ascii')
+
+				if block > 0:
+					self.out.write(', ')
+
+				self.out.write(', '.join([data[offset - block_start:offset - block_start + length] for offset, length in block_records]))
+		else:
+			for i, (offset, length) in enumerate(records):
+				self.spool.seek(offset)
+
+				if i > 0:
+					self.out.write(', ')
+
+				self.out.write(self.spool.read(length).decode('ascii'))
+
+		self.out.write(']}}')
+		self.out.close()
+		self.spool.close()
+
+		return self.filename
+
+def encode_column(values):
+	# JSON encoding of a list of values, as json.dumps would encode each of them
+	# Integers and finite floats are formatted directly (json.dumps uses int.__repr__ and float.__repr__); other values are encoded once per distinct value
+	types = set(map(type, values))
+
+	if types == set([int]):
+		return list(map(int.__repr__, values))
+
+	# The sum is finite if every value is (if it overflows, the values are encoded one at a time below)
+	if types == set([float]) and math.isfinite(sum(values)):
+		return list(map(float.__repr__, values))
+
+	# Values are keyed with their type, as equal values of different types (e.g. 1, 1.0 and True) have different encodings
+	try:
+		encoding = dict((key, json.dumps(key[1])) for key in set((type(value), value) for value in values))
+	except TypeError:
+		return list(map(json.dumps, values)) # Unhashable values
+
+	return [encoding[(type(value), value)] for value in values]
+
+###################################################################################################################################################################################
+
+class JsonStream(object):
+	# Minimal incremental JSON tokenizer. Values are decoded one at a time with json.JSONDecoder.raw_decode,
+	# so arrays can be iterated element by element without loading the whole document
+
+	def __init__(self, handle):
+		self.handle = handle
+		self.buffer = ''
+		self.position = 0
+		self.eof = False
+		self.decoder = json.JSONDecoder()
+
+	def fill(self):
+		chunk = self.handle.read(CHUNK_SIZE)
+
+		if chunk == '':
+			self.eof = True
+			return False
+
+		# Drop the part of the buffer that has already been consumed
+		self.buffer = self.buffer[self.position:] + chunk
+		self.position = 0
+
+		return True
+
+	def peek(self):
+		# Return the next non-whitespace character without consuming it
+		while True:
+			while self.position < len(self.buffer) and self.buffer[self.position] in ' \t\r\n':
+				self.position += 1
+
+			if self.position < len(self.buffer):
+				return self.buffer[self.position]
+
+			if not self.fill():
+				raise ValueError('Unexpected end of JSON document')
+
+	def expect(self, characters):
+		character = self.peek()
+
+		if character not in characters:
+			raise ValueError('Expected one of %s in JSON document but found %s' % (characters, character))
+
+		self.position += 1
+		return character
+
+	def decode(self):
+		# Decode the next complete value. A value is only accepted if it is followed by more input (or the end of the file),
+		# so that a number cut off at the end of the buffer is never returned
+		self.peek()
+
+		while True:
+			try:
+				value, end = self.decoder.raw_decode(self.buffer, self.position)
+
+				if end < len(self.buffer) or self.eof:
+					self.position = end
+					return value
+			except json.JSONDecodeError:
+				if self.eof:
+					raise
+
+			self.fill()
+
+	def iter_array(self):
+		self.expect('[')
+
+		if self.peek() == ']':
+			self.position += 1
+			return
+
+		while True:
+			yield self.decode()
+
+			# Elements are usually separated by ', ' (as written by json.dump and CyjsWriter), which is skipped without tokenizing
+			if self.buffer.startswith(', ', self.position) and self.position + 2 < len(self.buffer) and self.buffer[self.position + 2] not in ' \t\r\n':
+				self.position += 2
+			elif self.expect(',]') == ']':
+				return
+
+	def iter_object(self):
+		# Yield the keys of an object. The caller must consume each value (with decode, iter_array or iter_object)
+		self.expect('{')
+
+		if self.peek() == '}':
+			self.position += 1
+			return
+
+		while True:
+			key = self.decode()
+			self.expect(':')
+
+			yield key
+
+			if self.expect(',}') == '}':
+				return
+
+def iter_elements(filename):
+	# Yield ('node', data) and ('edge', data) for every element of a cyjs file, in file order
+	with open(filename, 'r') as cyjs:
+		stream = JsonStream(cyjs)
+
+		for key in stream.iter_object():
+			if key != 'elements':
+				stream.decode() # Skip graph attributes
+				continue
+
+			for element_type in stream.iter_object():
+				if element_type not in ('nodes', 'edges'):
+					stream.decode()
+					continue
+
+				for element in stream.iter_array():
+					yield element_type[:-1], element['data']
+
+def iter_edges(filename):
+	# Yield the data of every edge (source, target and edge attributes)
+	for element_type, data in iter_elements(filename):
+		if element_type == 'edge':
+			yield data
+
+###################################################################################################################################################################################
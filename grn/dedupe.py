@@ -0,0 +1,183 @@
+import tempfile
+import shutil
+import numpy
+import os
+
+###################################################################################################################################################################################
+
+# Removal of palindromic duplicate motif sites, used by findMotifs.py (scan.remove_duplicate_motifs)
+# Homer finds palindromic motifs on both strands. Sites are sorted by chromosome and start, and a site is a duplicate if the site before it is on the
+# same chromosome and the opposite strand, with centres (ceil of the mean of start and end) at most max_dist apart.
+#
+# Sites are read in chunks of up to CHUNK_SITES sites, held as parallel arrays of (chromosomes, starts, ends, strands, output lines). A file that fits in
+# one chunk is sorted in memory. Otherwise every chunk is sorted and saved as a run of .npy files, and the runs are merged through memory-mapped blocks
+# (an external merge sort), so memory use does not grow with the number of sites. Duplicates are found for a block of sorted sites at a time with array
+# operations, carrying the last site over to the next block, and the kept sites are written as each block is done.
+# The sort is stable: sites with the same chromosome and start (e.g. the two strands of a palindromic site) stay in the order they were found in.
+
+CHUNK_SITES = 2 ** 18
+
+SITE_COLUMNS = ['chroms', 'starts', 'ends', 'strands', 'lines']
+
+###################################################################################################################################################################################
+
+def site_arrays(chroms, starts, ends, strands, lines):
+	return numpy.array(chroms, dtype = bytes), numpy.array(starts, dtype = numpy.int64), numpy.array(ends, dtype = numpy.int64), numpy.array(strands, dtype = bytes), numpy.array(lines, dtype = bytes)
+
+def subset_sites(sites, index):
+	return tuple(values[index] for values in sites)
+
+def read_chunks(filename, chunk_sites = CHUNK_SITES):
+	# Yield the sites of a raw motif BED file (Homer's -mbed output or pwm.write_motif_bed) in chunks of up to chunk_sites sites
+	# Each site keeps its output line: chromosome, start, end, motif name, score and strand (BED6)
+	chroms = []
+	starts = []
+	ends = []
+	strands = []
+	lines = []
+
+	with open(filename, 'rb') as bed:
+		for line in bed:
+			if line.startswith((b'#', b'track', b'browser')) or not line.strip():
+				continue # Skip header and blank lines
+
+			fields = line.rstrip(b'\r\n').split(b'\t')
+			start = int(fields[1])
+			end = int(fields[2])
+
+			chroms.append(fields[0])
+			starts.append(start)
+			ends.append(end)
+			strands.append(fields[5])
+			lines.append(b'%s\t%d\t%d\t%s\t%s\t%s\n' % (fields[0], start, end, fields[3], fields[4], fields[5]))
+
+			if len(starts) == chunk_sites:
+				yield site_arrays(chroms, starts, ends, strands, lines)
+
+				chroms, starts, ends, strands, lines = [], [], [], [], []
+
+	if len(starts) > 0:
+		yield site_arrays(chroms, starts, ends, strands, lines)
+
+def sort_sites(sites):
+	# Same order as bedtools sort (chromosome, then start), keeping sites with the same chromosome and start in their current order
+	return subset_sites(sites, numpy.lexsort((sites[1], sites[0])))
+
+###################################################################################################################################################################################
+
+def write_run(run_dir, run, sites):
+	# Save sorted sites as a run of .npy files (one per column). Returns (file name prefix of the run, number of sites)
+	prefix = os.path.join(run_dir, str(run))
+
+	for column, values in zip(SITE_COLUMNS, sites):
+		numpy.save('%s.%s.npy' % (prefix, column), values)
+
+	return prefix, len(sites[1])
+
+def read_run(run, start, n):
+	# n sites of a run from start on. The files are memory-mapped for each read, so the number of open files does not grow with the number of runs
+	return tuple(numpy.array(numpy.load('%s.%s.npy' % (run[0], column), mmap_mode = 'r')[start:start + n]) for column in SITE_COLUMNS)
+
+def merge_runs(runs, block_sites):
+	# Yield the sites of sorted runs (from consecutive chunks) in blocks, in the order of a stable sort of all the sites
+	# A block of up to block_sites sites of every run is held in memory. The sites that can be merged are those up to the smallest last site of a
+	# block whose run has more sites, ordering sites with the same chromosome and start by run (earlier chunks first)
+	loaded = [0] * len(runs)
+	buffers = [None] * len(runs)
+
+	def load(r):
+		buffers[r] = read_run(runs[r], loaded[r], block_sites)
+		loaded[r] += len(buffers[r][1])
+
+	for r in range(len(runs)):
+		load(r)
+
+	while any(len(buffer[1]) > 0 for buffer in buffers):
+		# The last site of the block of every run with more sites after it: later sites of these runs come after it
+		limits = [(buffers[r][0][-1], int(buffers[r][1][-1]), r) for r in range(len(runs)) if len(buffers[r][1]) > 0 and loaded[r] < runs[r][1]]
+		bound = min(limits) if len(limits) > 0 else None
+		merged = []
+
+		for r in range(len(runs)):
+			chroms, starts = buffers[r][0], buffers[r][1]
+
+			if bound is None:
+				n = len(starts)
+			else:
+				bound_chrom, bound_start, bound_run = bound
+				before = (chroms < bound_chrom) | ((chroms == bound_chrom) & (starts < bound_start))
+
+				if r <= bound_run:
+					before |= (chroms == bound_chrom) & (starts == bound_start)
+
+				n = int(numpy.count_nonzero(before))
+
+			merged.append(subset_sites(buffers[r], slice(0, n)))
+			buffers[r] = subset_sites(buffers[r], slice(n, None))
+
+			if len(buffers[r][1]) == 0 and loaded[r] < runs[r][1]:
+				load(r)
+
+		# Blocks are concatenated in run order, so the stable sort keeps earlier runs first
+		yield sort_sites(tuple(numpy.concatenate([block[i] for block in merged]) for i in range(len(SITE_COLUMNS))))
+
+def sorted_sites(filename, tmp_dir = None, chunk_sites = CHUNK_SITES):
+	# Yield the sites of a raw motif BED file in blocks of sorted sites, sorting in memory if the file fits in one chunk and with an external merge sort
+	# (runs in a temporary directory in tmp_dir) otherwise
+	chunks = read_chunks(filename, chunk_sites)
+	first = next(chunks, None)
+	second = next(chunks, None)
+
+	if second is None:
+		if first is not None:
+			yield sort_sites(first)
+
+		return
+
+	run_dir = tempfile.mkdtemp(prefix = 'dedupe.', dir = tmp_dir)
+
+	try:
+		runs = [write_run(run_dir, 0, sort_sites(first)), write_run(run_dir, 1, sort_sites(second))]
+		del first, second
+
+		for chunk in chunks:
+			runs.append(write_run(run_dir, len(runs), sort_sites(chunk)))
+
+		for block in merge_runs(runs, max(1, chunk_sites // len(runs))):
+			yield block
+	finally:
+		shutil.rmtree(run_dir, ignore_errors = True)
+
+###################################################################################################################################################################################
+
+def duplicate_sites(chroms, centres, strands, previous, max_dist):
+	# Mask of the sorted sites that duplicate the site before them. previous is the (chromosome, centre, strand) of the site before the first one, or None
+	is_duplicate = numpy.zeros(len(centres), dtype = bool)
+	is_duplicate[1:] = (chroms[1:] == chroms[:-1]) & (strands[1:] != strands[:-1]) & (numpy.abs(centres[1:] - centres[:-1]) <= max_dist)
+
+	if previous is not None and len(centres) > 0:
+		prev_chrom, prev_centre, prev_strand = previous
+		is_duplicate[0] = chroms[0] == prev_chrom and strands[0] != prev_strand and abs(int(centres[0]) - prev_centre) <= max_dist
+
+	return is_duplicate
+
+def remove_duplicate_sites(raw_bed, out_bed, max_dist, tmp_dir = None, chunk_sites = CHUNK_SITES):
+	# Write the sites of raw_bed without palindromic duplicates to out_bed (BED6, sorted). Returns the number of sites written
+	n_sites = 0
+	previous = None
+
+	with open(out_bed, 'wb') as out:
+		for chroms, starts, ends, strands, lines in sorted_sites(raw_bed, tmp_dir, chunk_sites):
+			# The centre of a site is the mean of its start and end, rounded up
+			centres = (starts + ends + 1) // 2
+			keep = ~duplicate_sites(chroms, centres, strands, previous, max_dist)
+
+			out.write(b''.join(lines[keep].tolist()))
+			n_sites += int(numpy.count_nonzero(keep))
+
+			# Every site is compared with the site before it, whether or not that site was a duplicate
+			previous = (chroms[-1], int(centres[-1]), strands[-1])
+
+	return n_sites
+
+###################################################################################################################################################################################
@@ -0,0 +1,130 @@
+from grn import intervals
+from grn import store
+import hashlib
+import json
+import os
+
+###################################################################################################################################################################################
+
+# Persistent cache of footprint-filtered motif positions
+# Filtering every motif against a large footprint BED is repeated on every build with -f, although the footprints and motifs rarely change.
+# Filtered motif positions are saved as motif position stores in a cache directory, named by a hash of the footprint file's MD5 checksum and the
+# MD5 checksums of the motif files (taken from the motif store header), so a cache entry is only reused for identical inputs.
+# The least recently used entries are deleted when the cache grows beyond its maximum size.
+
+CACHE_DIR = 'footprint_cache'
+HASH_INDEX = 'hashes.json'
+ENTRY_SUFFIX = '.store'
+
+# Default maximum cache size in bytes
+MAX_CACHE_SIZE = 2 * 2 ** 30
+
+###################################################################################################################################################################################
+
+def footprint_checksum(footprint_file, cache_dir):
+	# MD5 checksum of a footprint file
+	# Checksums are remembered in the cache directory by path, size and modification time, so unchanged files are not re-read
+	index_file = os.path.join(cache_dir, HASH_INDEX)
+	path = os.path.abspath(footprint_file)
+	current = store.source_info(footprint_file, checksum = False)
+
+	try:
+		with open(index_file, 'r') as index:
+			checksums = json.load(index)
+	except (OSError, IOError, ValueError):
+		checksums = dict()
+
+	recorded = checksums.get(path)
+
+	if recorded is not None and recorded['size'] == current['size'] and recorded['mtime'] == current['mtime']:
+		return recorded['md5']
+
+	current['md5'] = store.md5sum(footprint_file)
+	checksums[path] = current
+
+	tmp_file = '%s.tmp.%d' % (index_file, os.getpid())
+
+	with open(tmp_file, 'w') as index:
+		json.dump(checksums, index)
+
+	os.replace(tmp_file, index_file)
+
+	return current['md5']
+
+def cache_key(footprint_md5, motif_sources):
+	# Cache entry name for a footprint file and a set of motif files (motif ID -> source info with MD5 checksum)
+	key = hashlib.md5()
+	key.update(json.dumps([footprint_md5, sorted((motif_id, source['md5']) for motif_id, source in motif_sources.items())]).encode())
+
+	return key.hexdigest()
+
+def evict(cache_dir, max_size, keep = None):
+	# Delete the least recently used cache entries until the cache is no larger than max_size bytes. The entry keep is never deleted
+	entries = []
+
+	for name in os.listdir(cache_dir):
+		if not name.endswith(ENTRY_SUFFIX):
+			continue
+
+		entry = os.path.join(cache_dir, name)
+
+		try:
+			stat = os.stat(entry)
+		except OSError:
+			continue # Deleted by another build
+
+		entries.append((stat.st_mtime_ns, stat.st_size, entry))
+
+	total_size = sum(size for last_used, size, entry in entries)
+	n_evicted = 0
+
+	for last_used, size, entry in sorted(entries):
+		if total_size <= max_size:
+			break
+
+		if entry == keep:
+			continue
+
+		try:
+			os.remove(entry)
+		except OSError:
+			pass
+
+		total_size -= size
+		n_evicted += 1
+
+	return n_evicted
+
+###################################################################################################################################################################################
+
+def load_filtered_motifs(motif_dir, motif_positions, footprint_file, cache_dir = None, max_size = MAX_CACHE_SIZE):
+	# Motif positions (as loaded from the motif store of motif_dir) that overlap a footprint, read from the cache if possible
+	# Returns (motif ID -> Intervals, True if the result came from the cache)
+	if cache_dir is None:
+		cache_dir = os.path.join(motif_dir, CACHE_DIR)
+
+	if not os.path.exists(cache_dir):
+		os.makedirs(cache_dir, exist_ok = True)
+
+	header, data_offset = store.read_header(os.path.join(motif_dir, store.STORE_FILE))
+	entry = os.path.join(cache_dir, cache_key(footprint_checksum(footprint_file, cache_dir), header['sources']) + ENTRY_SUFFIX)
+
+	if os.path.exists(entry):
+		try:
+			filtered = store.load(entry)
+
+			# Mark the entry as recently used
+			os.utime(entry)
+
+			return filtered, True
+		except (OSError, IOError, ValueError):
+			pass # Evicted or damaged - filter again
+
+	filtered = intervals.filter_overlapping(motif_positions, intervals.read_bed(footprint_file))
+
+	store.write(entry, filtered, header['sources'])
+	evict(cache_dir, max_size, keep = entry)
+
+	return filtered, False
+
+###################################################################################################################################################################################
@@ -0,0 +1,256 @@
+import numpy
+import gzip
+
+###################################################################################################################################################################################
+
+# In-memory interval index used to count overlaps between peaks and motif positions without calling bedtools.
+#
+# Every interval end point is packed into a single int64 key:
+#	key = (group * number of chromosomes + chromosome index) * CHROM_SHIFT + position
+# so that sorted keys from all chromosomes (and all motifs) can be searched with one call to numpy.searchsorted.
+# Overlaps follow bedtools semantics for half-open BED intervals: a and b overlap if a.start < b.end and b.start < a.end
+
+CHROM_SHIFT = 2 ** 32
+
+# Upper limit on the number of query keys searched at once (controls peak memory use)
+MAX_QUERY_KEYS = 2 ** 23
+
+###################################################################################################################################################################################
+
+class Intervals(object):
+	# A set of BED intervals stored as NumPy arrays. Names (4th BED column) and scores (5th BED column, e.g. motif scores) are optional
+	# Start and end arrays may be any integer type (e.g. memory-mapped int32 arrays from a motif store)
+	# blocks is an optional list of (chromosome, number of intervals) for intervals already grouped by chromosome
+
+	def __init__(self, chroms, starts, ends, names = None, blocks = None, scores = None):
+		self.chroms = numpy.asarray(chroms, dtype = str)
+		self.starts = starts if isinstance(starts, numpy.ndarray) else numpy.asarray(starts, dtype = numpy.int64)
+		self.ends = ends if isinstance(ends, numpy.ndarray) else numpy.asarray(ends, dtype = numpy.int64)
+		self.names = None if names is None else numpy.asarray(names, dtype = str)
+		self.scores = scores if scores is None or isinstance(scores, numpy.ndarray) else numpy.asarray(scores, dtype = float)
+		self.blocks = blocks
+
+	@classmethod
+	def from_blocks(cls, blocks):
+		# Build from a list of (chromosome, starts, ends) or (chromosome, starts, ends, scores) with one entry per chromosome
+		# Scores are kept if every block has them
+		chroms = [block[0] for block in blocks]
+		lengths = [len(block[1]) for block in blocks]
+
+		if len(blocks) == 0:
+			return cls([], [], [])
+
+		def concatenate(column):
+			return numpy.concatenate([block[column] for block in blocks]) if len(blocks) > 1 else blocks[0][column]
+
+		scores = concatenate(3) if all(len(block) > 3 and block[3] is not None for block in blocks) else None
+
+		return cls(numpy.repeat(numpy.array(chroms, dtype = str), lengths), concatenate(1), concatenate(2), blocks = list(zip(chroms, lengths)), scores = scores)
+
+	def __len__(self):
+		return len(self.starts)
+
+	def subset(self, index):
+		names = None if self.names is None else self.names[index]
+		scores = None if self.scores is None else self.scores[index]
+		return Intervals(self.chroms[index], self.starts[index], self.ends[index], names, scores = scores)
+
+	def sort(self):
+		# Same order as bedtools sort: chromosome (lexicographic), then start, then end
+		return self.subset(numpy.lexsort((self.ends, self.starts, self.chroms)))
+
+def read_bed(filename, names = False, scores = False):
+	# With scores, the 5th column is read as a score (e.g. the motif score written by findMotifs.py), with NaN for intervals without one
+	# If no interval has a score, the Intervals have no scores
+	chroms = []
+	starts = []
+	ends = []
+	gene_ids = []
+	site_scores = []
+
+	# bgzip-compressed files (see tabix.py) are read through gzip
+	with (gzip.open(filename, 'rt') if filename.endswith('.gz') else open(filename, 'r')) as bed:
+		for line in bed:
+			if line.startswith(('#', 'track', 'browser')) or not line.strip():
+				continue # Skip header and blank lines
+
+			fields = line.rstrip('\r\n').split('\t')
+
+			chroms.append(fields[0])
+			starts.append(int(fields[1]))
+			ends.append(int(fields[2]))
+
+			if names:
+				gene_ids.append(fields[3])
+
+			if scores:
+				site_scores.append(float(fields[4]) if len(fields) > 4 and fields[4] not in ('', '.') else numpy.nan)
+
+	has_scores = scores and not numpy.isnan(site_scores).all()
+
+	return Intervals(chroms, numpy.array(starts, dtype = numpy.int64), numpy.array(ends, dtype = numpy.int64), gene_ids if names else None, scores = numpy.array(site_scores) if has_scores else None)
+
+###################################################################################################################################################################################
+
+def chrom_codes(intervals, chrom_index):
+	# Convert chromosome names to integer codes. chrom_index is shared between interval sets so codes are comparable
+	if len(intervals) == 0:
+		return numpy.zeros(0, dtype = numpy.int64)
+
+	if intervals.blocks is not None:
+		codes = numpy.array([chrom_index.setdefault(chrom, len(chrom_index)) for chrom, length in intervals.blocks], dtype = numpy.int64)
+		return numpy.repeat(codes, [length for chrom, length in intervals.blocks])
+
+	unique_chroms, inverse = numpy.unique(intervals.chroms, return_inverse = True)
+	codes = numpy.array([chrom_index.setdefault(chrom, len(chrom_index)) for chrom in unique_chroms], dtype = numpy.int64)
+
+	return codes[inverse]
+
+def count_overlaps(query, targets):
+	# For each query interval, count the number of target intervals that overlap it
+	chrom_index = dict()
+	query_chroms = chrom_codes(query, chrom_index) * CHROM_SHIFT
+	target_chroms = chrom_codes(targets, chrom_index) * CHROM_SHIFT
+
+	target_starts = numpy.sort(target_chroms + targets.starts)
+	target_ends = numpy.sort(target_chroms + targets.ends)
+
+	# Targets starting before the query ends, minus targets that end before the query starts
+	# Targets on other chromosomes cancel out of the difference
+	n_start_before_end = numpy.searchsorted(target_starts, query_chroms + query.ends, side = 'left')
+	n_end_before_start = numpy.searchsorted(target_ends, query_chroms + query.starts, side = 'right')
+
+	return n_start_before_end - n_end_before_start
+
+def filter_overlapping(interval_sets, targets):
+	# Keep the intervals of every set (a dictionary of ID -> Intervals) that overlap at least one target interval
+	# The targets are sorted once and the sets are tested in batches of up to MAX_QUERY_KEYS intervals, rather than one intersect per set
+	chrom_index = dict()
+	target_chroms = chrom_codes(targets, chrom_index) * CHROM_SHIFT
+
+	target_starts = numpy.sort(target_chroms + targets.starts)
+	target_ends = numpy.sort(target_chroms + targets.ends)
+
+	set_ids = list(interval_sets)
+	filtered = dict()
+	batch = []
+	batch_size = 0
+
+	for n, set_id in enumerate(set_ids):
+		batch.append(set_id)
+		batch_size += len(interval_sets[set_id])
+
+		if batch_size < MAX_QUERY_KEYS and n < len(set_ids) - 1:
+			continue
+
+		query_chroms = numpy.concatenate([chrom_codes(interval_sets[i], chrom_index) for i in batch]) * CHROM_SHIFT
+		query_starts = query_chroms + numpy.concatenate([interval_sets[i].starts for i in batch])
+		query_ends = query_chroms + numpy.concatenate([interval_sets[i].ends for i in batch])
+
+		overlaps = numpy.searchsorted(target_starts, query_ends, side = 'left') > numpy.searchsorted(target_ends, query_starts, side = 'right')
+		offset = 0
+
+		for i in batch:
+			filtered[i] = interval_sets[i].subset(overlaps[offset:offset + len(interval_sets[i])])
+			offset += len(interval_sets[i])
+
+		batch = []
+		batch_size = 0
+
+	return filtered
+
+def iter_motif_peak_counts(peaks, motif_positions):
+	# For each motif, yield (motif ID, number of motif sites overlapping each peak)
+	# Motifs are searched in batches, with all motifs in a batch handled by a single searchsorted call
+	motif_ids = list(motif_positions)
+
+	chrom_index = dict()
+	peak_chroms = chrom_codes(peaks, chrom_index)
+	motif_chroms = [chrom_codes(motif_positions[motif_id], chrom_index) for motif_id in motif_ids]
+	group_shift = max(len(chrom_index), 1) * CHROM_SHIFT
+
+	peak_starts = peak_chroms * CHROM_SHIFT + peaks.starts
+	peak_ends = peak_chroms * CHROM_SHIFT + peaks.ends
+
+	batch_size = max(1, MAX_QUERY_KEYS // max(len(peaks), 1))
+
+	for batch_start in range(0, len(motif_ids), batch_size):
+		batch = motif_ids[batch_start:batch_start + batch_size]
+		target_starts = []
+		target_ends = []
+
+		for group, motif_id in enumerate(batch):
+			sites = motif_positions[motif_id]
+			codes = motif_chroms[batch_start + group] * CHROM_SHIFT + group * group_shift
+
+			target_starts.append(codes + sites.starts)
+			target_ends.append(codes + sites.ends)
+
+		target_starts = numpy.sort(numpy.concatenate(target_starts))
+		target_ends = numpy.sort(numpy.concatenate(target_ends))
+
+		offsets = numpy.arange(len(batch), dtype = numpy.int64)[:, None] * group_shift
+
+		n_start_before_end = numpy.searchsorted(target_starts, (peak_ends + offsets).ravel(), side = 'left')
+		n_end_before_start = numpy.searchsorted(target_ends, (peak_starts + offsets).ravel(), side = 'right')
+		counts = (n_start_before_end - n_end_before_start).reshape(len(batch), len(peaks))
+
+		for group, motif_id in enumerate(batch):
+			yield motif_id, counts[group]
+
+def iter_motif_peak_counts_by_score(peaks, motif_positions, motif_cutoffs):
+	# For each motif, yield (motif ID, cutoffs x peaks array of the number of motif sites with a score of at least each cutoff overlapping each peak)
+	# motif_cutoffs is motif ID -> array of score cutoffs. Sites are put into buckets by the number of cutoffs they pass, and the buckets of all
+	# motifs are counted in one pass (as separate motifs in iter_motif_peak_counts), so every site is searched once whatever the number of cutoffs.
+	# The count at a cutoff is the sum of the buckets of the sites passing it. Sites without a score (NaN) pass no cutoff
+	buckets = dict()
+	orders = dict()
+
+	for motif_id, sites in motif_positions.items():
+		cutoffs = numpy.asarray(motif_cutoffs[motif_id], dtype = float)
+		order = numpy.argsort(cutoffs, kind = 'stable')
+		orders[motif_id] = order
+
+		# Scores and cutoffs are compared as float32 (as in the motif store), so a score equal to a cutoff passes whichever way it was read
+		if len(sites) == 0:
+			n_passed = numpy.zeros(0, dtype = numpy.int64)
+		elif sites.scores is None:
+			raise ValueError('Motif positions for %s have no scores. Scan the motifs again with findMotifs.py to keep scores' % motif_id)
+		else:
+			scores = numpy.asarray(sites.scores, dtype = numpy.float32)
+			n_passed = numpy.where(numpy.isnan(scores), 0, numpy.searchsorted(cutoffs[order].astype(numpy.float32), scores, side = 'right'))
+
+		for bucket in range(1, len(cutoffs) + 1):
+			buckets[(motif_id, bucket)] = sites.subset(n_passed == bucket)
+
+	motif_counts = None
+
+	for (motif_id, bucket), peak_counts in iter_motif_peak_counts(peaks, buckets):
+		order = orders[motif_id]
+
+		if bucket == 1:
+			motif_counts = numpy.zeros((len(order), len(peaks)), dtype = peak_counts.dtype)
+
+		motif_counts[bucket - 1] = peak_counts
+
+		if bucket == len(order):
+			# Sites in bucket b pass the b lowest cutoffs
+			counts = numpy.empty_like(motif_counts)
+			counts[order] = numpy.cumsum(motif_counts[::-1], axis = 0)[::-1]
+
+			yield motif_id, counts
+
+def gene_hit_counts(peaks, peak_counts):
+	# Sum per-peak motif counts for each gene (4th column of the peak file)
+	# Genes are returned in the order in which they are first hit, matching the order of a bedtools intersect of sorted peaks
+	hit = numpy.flatnonzero(peak_counts)
+
+	if len(hit) == 0:
+		return []
+
+	genes, first_hit, inverse = numpy.unique(peaks.names[hit], return_index = True, return_inverse = True)
+	totals = numpy.bincount(inverse, weights = peak_counts[hit]).astype(numpy.int64)
+
+	return [(str(genes[i]), int(totals[i])) for i in numpy.argsort(first_hit, kind = 'stable')]
+
+###################################################################################################################################################################################
@@ -0,0 +1,314 @@
+from grn import intervals
+from grn import cyjs
+import numpy
+import json
+
+###################################################################################################################################################################################
+
+# Reading expression/annotation data and building the GRN graph
+# Shared by build_gene_regulatory_network.py and build_gene_regulatory_network_batch.py
+# networkx is only imported to build or write an in-memory graph, so scripts that stream networks (cyjs.CyjsWriter) start without it
+
+def read_expression(filename, min_value = float('-inf')):
+	# Read gene expression data with gene ID (1st column) and expression value (2nd column). Genes below min_value are skipped
+	gene_expression = dict()
+
+	with open(filename, 'r') as exprs:
+		for num,line in enumerate(exprs):
+			if num == 0:
+				continue # Skip first line
+
+			gene_id, value = line.strip().split('\t')
+			value = float(value)
+
+			if value >= min_value:
+				gene_expression[gene_id] = value
+
+	return gene_expression
+
+def read_expression_matrix(filename):
+	# Read a gene expression table with gene ID (1st column) and one column per sample
+	# Returns (gene IDs, sample names, genes x samples array). Missing values (NA or empty) are stored as NaN
+	gene_index = dict()
+	rows = []
+
+	with open(filename, 'r') as exprs:
+		for num,line in enumerate(exprs):
+			fields = line.rstrip('\r\n').split('\t')
+
+			if num == 0:
+				samples = fields[1:]
+				continue
+
+			values = [float(value) if value not in ('', 'NA', 'NaN', 'nan') else numpy.nan for value in fields[1:]]
+
+			# Later rows replace earlier rows for the same gene, as with read_expression
+			if fields[0] in gene_index:
+				rows[gene_index[fields[0]]] = values
+			else:
+				gene_index[fields[0]] = len(rows)
+				rows.append(values)
+
+	values = numpy.array(rows, dtype = float).reshape(len(rows), len(samples))
+
+	return list(gene_index), samples, values
+
+def read_tf_annotation(filename):
+	# Read TF annotation data as a list of (gene ID, motif ID), in file order
+	tf_annotation = []
+
+	with open(filename, 'r') as annot:
+		for num,line in enumerate(annot):
+			if num == 0:
+				continue # Skip first line
+
+			gene_id, motif_id = line.strip().split('\t')
+			tf_annotation.append((gene_id, motif_id))
+
+	return tf_annotation
+
+###################################################################################################################################################################################
+
+def select_reference_genes(tf_annotation, gene_expression, motifs):
+	# For each motif, find the TF gene with the highest expression. Use this as the reference source node for that motif
+	# Returns (motif ID -> [gene ID, expression], list of expressed TF genes)
+	motif_associated_genes = []
+	motif_ref_gene = dict()
+
+	for gene_id, motif_id in tf_annotation:
+		if motif_id not in motifs:
+			continue # Skip if motif is not included in the motif bed file directory
+
+		# Check gene is expressed
+		if gene_id in gene_expression:
+			value = gene_expression[gene_id]
+			motif_associated_genes.append(gene_id)
+
+			# Check if motif has already been found
+			# If not, add it to the motif_ref_gene dictionary with an empty gene ID and -Inf expression value
+			if motif_id not in motif_ref_gene:
+				motif_ref_gene[motif_id] = ['', float('-inf')]
+
+			# Check if expression of gene is higher than the current motif reference gene. If yes, replace it
+			if value > motif_ref_gene[motif_id][1]:
+				motif_ref_gene[motif_id] = [gene_id, value]
+
+	return motif_ref_gene, motif_associated_genes
+
+def select_reference_genes_matrix(tf_annotation, genes, values, min_value, motifs):
+	# Vectorized version of select_reference_genes for every sample (column) of an expression matrix at once
+	# Returns a list with one motif_ref_gene dictionary per sample
+	gene_index = dict((gene_id, i) for i, gene_id in enumerate(genes))
+	motif_rows = dict()
+
+	for gene_id, motif_id in tf_annotation:
+		if motif_id in motifs and gene_id in gene_index:
+			motif_rows.setdefault(motif_id, []).append(gene_index[gene_id])
+
+	# Values that are missing or below the minimum can never be selected
+	masked = numpy.where(values >= min_value, values, -numpy.inf)
+	sample_columns = numpy.arange(values.shape[1])
+	motif_ref_genes = [dict() for sample in sample_columns]
+
+	for motif_id, rows in motif_rows.items():
+		rows = numpy.array(rows)
+
+		# argmax returns the first maximum, matching the strict > comparison in select_reference_genes
+		best = numpy.argmax(masked[rows], axis = 0)
+		best_values = masked[rows[best], sample_columns]
+
+		for sample in numpy.flatnonzero(best_values > -numpy.inf):
+			motif_ref_genes[sample][motif_id] = [genes[rows[best[sample]]], float(best_values[sample])]
+
+	return motif_ref_genes
+
+###################################################################################################################################################################################
+
+def target_counts(gene_hits, gene_expression, tf_genes = None):
+	# Total number of motifs for each target gene of a motif: expressed genes (and TF genes, if tf_genes is given) from a list of (gene ID, number of motifs)
+	gene_motif_count = dict()
+
+	for gene_id, hit_count in gene_hits:
+		# Unless the full GRN has been requested, skip gene if not a TF
+		if tf_genes is not None and gene_id not in tf_genes:
+			continue
+
+		# Skip if gene is not expressed
+		if gene_id not in gene_expression:
+			continue
+
+		# Check if gene already count and add if not
+		if gene_id not in gene_motif_count:
+			gene_motif_count[gene_id] = 0
+
+		gene_motif_count[gene_id] += hit_count
+
+	return gene_motif_count
+
+def build_graph(motif_gene_hits, motif_ref_gene, gene_expression, tf_genes = None, grn = None, provenance = None, profiler = None, significance = None, cutoff_hits = None):
+	# Build the GRN from (motif ID, [(gene ID, number of motifs), ...]) pairs
+	# If tf_genes is given, only these genes are included as targets (otherwise the full network is built)
+	# grn can be a cyjs.CyjsWriter to stream the network straight to a file. By default a networkx DiGraph is built
+	# If provenance (motif ID -> gene ID -> [[chrom, start, end, count], ...]) is given, each edge gets a provenance attribute listing
+	# [motif ID, chrom, start, end, count] for every peak behind it, including motifs whose edge was replaced by a later motif with the same reference gene
+	# If a profiling.Profiler is given, the number of edges made by each motif is counted
+	# If significance ((motif ID, gene ID) -> (p-value, FDR), see significance.edge_significance) is given, only the edges in it are added, with pvalue and fdr attributes
+	# If cutoff_hits (motif ID -> [(label, [(gene ID, number of motifs), ...]), ...], e.g. the hits at several motif score cutoffs) is given, each edge
+	# gets a count_<label> attribute with its count in each of these (0 if the target is not hit)
+	if grn is None:
+		import networkx as nx
+		grn = nx.DiGraph()
+
+	edge_provenance = dict()
+
+	for motif_id, gene_hits in motif_gene_hits:
+		if motif_id not in motif_ref_gene:
+			continue # Skip if motif has no annotation data
+
+		source_node, source_node_exprs = motif_ref_gene[motif_id]
+
+		# Count the number of motifs associated with each gene
+		gene_motif_count = target_counts(gene_hits, gene_expression, tf_genes)
+
+		if cutoff_hits is not None:
+			cutoff_counts = [(label, target_counts(hits, gene_expression, tf_genes)) for label, hits in cutoff_hits[motif_id]]
+
+		# Create nodes/edges
+		for target_node in gene_motif_count:
+			# With significance data, only the edges that are kept in the final network are added
+			# (edges replaced by a later motif with the same reference gene, and edges pruned by FDR, are not in the table)
+			if significance is not None and (motif_id, target_node) not in significance:
+				if provenance is not None:
+					edge_provenance.setdefault((source_node, target_node), []).extend([motif_id] + peak for peak in provenance[motif_id][target_node])
+
+				continue
+
+			# Check if source and target nodes are already present in GRN. Add them if not
+			if not grn.has_node(source_node):
+				grn.add_node(source_node, expression = source_node_exprs)
+
+			if not grn.has_node(target_node):
+				target_node_exprs = gene_expression[target_node]
+				grn.add_node(target_node, expression = target_node_exprs)
+
+			attributes = dict(count = gene_motif_count[target_node], source_motif = motif_id)
+
+			if cutoff_hits is not None:
+				for label, counts in cutoff_counts:
+					attributes['count_%s' % label] = counts.get(target_node, 0)
+
+			if significance is not None:
+				attributes['pvalue'], attributes['fdr'] = significance[(motif_id, target_node)]
+
+			if provenance is not None:
+				peaks = edge_provenance.setdefault((source_node, target_node), [])
+				peaks.extend([motif_id] + peak for peak in provenance[motif_id][target_node])
+				attributes['provenance'] = peaks
+
+			grn.add_edge(source_node, target_node, **attributes)
+
+		if profiler is not None:
+			profiler.count('motifs', motif_id, edges = len(gene_motif_count))
+
+	return grn
+
+def write_cyjs(grn, outfile):
+	# Write network as a Cytoscape JSON file. Returns the name of the file written
+	import networkx as nx
+
+	cytoscape = nx.cytoscape_data(grn)
+	outfile = cyjs.cyjs_filename(outfile)
+
+	out = open(outfile, 'w')
+	json.dump(cytoscape, out)
+	out.close()
+
+	return outfile
+
+###################################################################################################################################################################################
+
+# Per-edge peak provenance, used to update a network from gained/lost peaks without rebuilding it (update_gene_regulatory_network.py)
+
+def peak_hits(peaks, peak_counts):
+	# Per-peak version of intervals.gene_hit_counts for sorted peaks with gene IDs
+	# Returns gene ID -> [[chrom, start, end, number of motifs], ...] for the peaks containing the motif, in peak order
+	hits = dict()
+
+	for i in numpy.flatnonzero(peak_counts):
+		hits.setdefault(str(peaks.names[i]), []).append([str(peaks.chroms[i]), int(peaks.starts[i]), int(peaks.ends[i]), int(peak_counts[i])])
+
+	return hits
+
+def read_provenance(filename):
+	# Read the per-edge peak provenance of a network built with provenance
+	# Returns motif ID -> gene ID -> [[chrom, start, end, count], ...]
+	motif_peak_hits = dict()
+
+	for data in cyjs.iter_edges(filename):
+		if 'provenance' not in data:
+			raise ValueError('%s has no peak provenance. Build it with provenance (-P) to update it' % filename)
+
+		for motif_id, chrom, start, end, count in data['provenance']:
+			motif_peak_hits.setdefault(motif_id, dict()).setdefault(data['target'], []).append([chrom, start, end, count])
+
+	return motif_peak_hits
+
+def remove_peaks(motif_peak_hits, peaks):
+	# Remove peaks (matched by coordinates) from a provenance table. Returns the number of peak/motif hits removed
+	# Each peak removes at most one hit per motif and gene, so duplicated peaks must be removed once for each copy
+	removed = dict()
+
+	for chrom, start, end in zip(peaks.chroms, peaks.starts, peaks.ends):
+		key = (str(chrom), int(start), int(end))
+		removed[key] = removed.get(key, 0) + 1
+
+	n_removed = 0
+
+	for motif_id in motif_peak_hits:
+		gene_hits = motif_peak_hits[motif_id]
+
+		for gene_id in list(gene_hits):
+			remaining = []
+			taken = dict()
+
+			for hit in gene_hits[gene_id]:
+				key = tuple(hit[:3])
+
+				if taken.get(key, 0) < removed.get(key, 0):
+					taken[key] = taken.get(key, 0) + 1
+					n_removed += 1
+				else:
+					remaining.append(hit)
+
+			if len(remaining) > 0:
+				gene_hits[gene_id] = remaining
+			else:
+				del gene_hits[gene_id]
+
+	return n_removed
+
+def add_peaks(motif_peak_hits, peaks, motif_positions):
+	# Count motifs in (sorted) new peaks and add them to a provenance table. Returns the number of peak/motif hits added
+	n_added = 0
+
+	for motif_id, peak_counts in intervals.iter_motif_peak_counts(peaks, motif_positions):
+		for gene_id, hits in peak_hits(peaks, peak_counts).items():
+			motif_peak_hits.setdefault(motif_id, dict()).setdefault(gene_id, []).extend(hits)
+			n_added += len(hits)
+
+	return n_added
+
+def provenance_gene_hits(motif_peak_hits, motifs):
+	# Yield (motif ID, [(gene ID, number of motifs), ...]) from a provenance table, in the same order as a build from sorted peaks:
+	# genes in the order of their first peak. Hits are sorted in place
+	for motif_id in motifs:
+		gene_hits = motif_peak_hits.get(motif_id, dict())
+
+		for hits in gene_hits.values():
+			hits.sort(key = lambda hit: (hit[0], hit[1], hit[2]))
+
+		genes = sorted(gene_hits, key = lambda gene_id: tuple(gene_hits[gene_id][0][:3]))
+
+		yield motif_id, [(gene_id, sum(hit[3] for hit in gene_hits[gene_id])) for gene_id in genes]
+
+###################################################################################################################################################################################
@@ -0,0 +1,206 @@
+import threading
+import resource
+import cProfile
+import time
+import json
+import sys
+import os
+
+###################################################################################################################################################################################
+
+# Optional instrumentation for the command line scripts: nested stage timers, memory (RSS) sampling, per-item counters and progress reports
+# Scripts add the --profile and --cprofile options with add_arguments and create a Profiler with from_args.
+# When neither option is given, stage() returns a shared do-nothing context manager, progress() returns the iterable unchanged and count() returns
+# immediately, so the instrumentation can be left in place at no real cost.
+
+# Seconds between RSS samples and between progress reports
+SAMPLE_INTERVAL = 0.2
+PROGRESS_INTERVAL = 10
+
+###################################################################################################################################################################################
+
+def current_rss():
+	# Current resident set size in MB (Linux), or the peak so far where /proc is not available
+	try:
+		with open('/proc/self/statm', 'r') as statm:
+			return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2 ** 20
+	except (OSError, IOError, ValueError):
+		return peak_rss()
+
+def peak_rss():
+	# Peak resident set size of this process in MB (ru_maxrss is in kilobytes on Linux and bytes on macOS)
+	return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (2 ** 20 if sys.platform == 'darwin' else 2 ** 10)
+
+def add_arguments(parser):
+	parser.add_argument('--profile', dest = 'profile', type = str, required = False, help = 'Write a JSON report of the time and memory used by each stage (and per-motif counters) to this file, and report progress of long loops')
+	parser.add_argument('--cprofile', dest = 'cprofile', type = str, required = False, help = 'Write cProfile statistics to this file (for use with pstats or snakeviz)')
+
+def from_args(args):
+	return Profiler(args.profile, args.cprofile)
+
+###################################################################################################################################################################################
+
+class NullStage(object):
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *exception):
+		return False
+
+NULL_STAGE = NullStage()
+
+class Stage(object):
+	# A timed stage. Stages with the same name under the same parent are merged (calls counts how often the stage was entered)
+
+	def __init__(self, profiler, name):
+		self.profiler = profiler
+		self.name = name
+		self.elapsed = 0.0
+		self.calls = 0
+		self.rss_start = None
+		self.rss_end = None
+		self.rss_peak = 0.0
+		self.children = list()
+
+	def child(self, name):
+		for stage in self.children:
+			if stage.name == name:
+				return stage
+
+		stage = Stage(self.profiler, name)
+		self.children.append(stage)
+
+		return stage
+
+	def __enter__(self):
+		self.calls += 1
+		self.start_time = time.time()
+		self.rss_start = current_rss() if self.rss_start is None else self.rss_start
+		self.rss_peak = max(self.rss_peak, self.rss_start)
+		self.profiler.stack.append(self)
+
+		return self
+
+	def __exit__(self, *exception):
+		self.profiler.stack.pop()
+		self.elapsed += time.time() - self.start_time
+		self.rss_end = current_rss()
+		self.rss_peak = max(self.rss_peak, self.rss_end)
+
+		return False
+
+	def report(self):
+		report = {'name': self.name, 'elapsed': round(self.elapsed, 4), 'calls': self.calls,
+			'rss_start_mb': round(self.rss_start or 0, 1), 'rss_end_mb': round(self.rss_end or 0, 1), 'rss_peak_mb': round(self.rss_peak, 1)}
+
+		if len(self.children) > 0:
+			report['stages'] = [stage.report() for stage in self.children]
+
+		return report
+
+###################################################################################################################################################################################
+
+class Profiler(object):
+
+	def __init__(self, report_file = None, cprofile_file = None):
+		self.report_file = report_file
+		self.cprofile_file = cprofile_file
+		self.enabled = report_file is not None
+
+		self.root = Stage(self, 'total')
+		self.stack = list()
+		self.counters = dict()
+		self.samples = list()
+
+		self.sampler = None
+		self.stopped = threading.Event()
+		self.cprofile = None
+
+	def start(self):
+		if self.cprofile_file:
+			self.cprofile = cProfile.Profile()
+			self.cprofile.enable()
+
+		if not self.enabled:
+			return
+
+		self.start_time = time.time()
+		self.root.__enter__()
+
+		self.sampler = threading.Thread(target = self.sample)
+		self.sampler.daemon = True
+		self.sampler.start()
+
+	def sample(self):
+		# Record the RSS at regular intervals and update the peak RSS of the stages that are running
+		while not self.stopped.wait(SAMPLE_INTERVAL):
+			rss = current_rss()
+			self.samples.append([round(time.time() - self.start_time, 2), round(rss, 1)])
+
+			for stage in list(self.stack):
+				stage.rss_peak = max(stage.rss_peak, rss)
+
+	def stage(self, name):
+		# Context manager timing a stage, nested inside the stage that is currently running
+		if not self.enabled:
+			return NULL_STAGE
+
+		return self.stack[-1].child(name)
+
+	def count(self, group, key, **values):
+		# Add values to the counters of an item (e.g. group 'motifs', key = motif ID, values hits/edges/elapsed)
+		if not self.enabled:
+			return
+
+		counters = self.counters.setdefault(group, dict()).setdefault(key, dict())
+
+		for name, value in values.items():
+			counters[name] = counters.get(name, 0) + value
+
+	def progress(self, iterable, label, total = None):
+		# Iterate while reporting progress to stderr every PROGRESS_INTERVAL seconds
+		if not self.enabled:
+			return iterable
+
+		return self.report_progress(iterable, label, len(iterable) if total is None else total)
+
+	def report_progress(self, iterable, label, total):
+		start_time = time.time()
+		last_report = start_time
+
+		for i, item in enumerate(iterable):
+			yield item
+
+			now = time.time()
+
+			if now - last_report >= PROGRESS_INTERVAL:
+				last_report = now
+				elapsed = now - start_time
+				remaining = elapsed / (i + 1) * (total - i - 1) if total else 0
+
+				sys.stderr.write('%s: %d/%d (%.0f%%), %.0f s elapsed, ~%.0f s remaining, %.0f MB\n' % (label, i + 1, total, (i + 1) / max(total, 1) * 100, elapsed, remaining, current_rss()))
+
+	def finish(self):
+		# Stop profiling and write the report and cProfile statistics
+		if self.cprofile is not None:
+			self.cprofile.disable()
+			self.cprofile.dump_stats(self.cprofile_file)
+
+		if not self.enabled:
+			return
+
+		self.stopped.set()
+		self.sampler.join()
+		self.root.__exit__()
+
+		report = {'command': sys.argv, 'start_time': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(self.start_time)),
+			'elapsed': round(self.root.elapsed, 4), 'peak_rss_mb': round(peak_rss(), 1), 'stages': [stage.report() for stage in self.root.children],
+			'counters': self.counters, 'rss_samples': self.samples}
+
+		with open(self.report_file, 'w') as out:
+			json.dump(report, out, indent = 1)
+
+		sys.stderr.write('Wrote profile to %s\n' % self.report_file)
+
+###################################################################################################################################################################################
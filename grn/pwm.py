@@ -0,0 +1,216 @@
+from grn import intervals
+import numpy
+import mmap
+
+###################################################################################################################################################################################
+
+# Native motif scanner used by findMotifs.py as an alternative to Homer
+# Peak sequences are extracted once from a memory-mapped FASTA file (with a samtools .fai index) and every PWM is scored
+# against them on both strands using vectorized log-odds sums
+
+# Bases are encoded as A = 0, C = 1, G = 2, T = 3 and anything else (N, separators between peaks) = 4
+BASE_CODES = numpy.full(256, 4, dtype = numpy.uint8)
+
+for code, bases in enumerate(['Aa', 'Cc', 'Gg', 'Tt']):
+	for base in bases:
+		BASE_CODES[ord(base)] = code
+
+# Homer log-odds scores are calculated against a uniform background
+BACKGROUND = 0.25
+
+# Smallest probability allowed in a PWM, to avoid log(0)
+MIN_PROBABILITY = 0.001
+
+# Score given to a window position containing an N, so that these windows can never pass the threshold
+N_SCORE = -1e6
+
+# Number of sequence positions scored at once
+SCORE_CHUNK = 2 ** 22
+
+###################################################################################################################################################################################
+
+class Motif(object):
+	# A Homer PWM: the log-odds matrix (motif length x 5, with a column for N) and the detection threshold from the header line
+
+	def __init__(self, name, probabilities, threshold):
+		probabilities = numpy.maximum(numpy.asarray(probabilities, dtype = float), MIN_PROBABILITY)
+		probabilities = probabilities / probabilities.sum(axis = 1)[:, None]
+
+		self.name = name
+		self.threshold = threshold
+		self.log_odds = numpy.hstack([numpy.log(probabilities / BACKGROUND), numpy.full((len(probabilities), 1), N_SCORE)])
+
+		# Reverse complement: reverse the positions and swap A<->T and C<->G
+		self.log_odds_rc = self.log_odds[::-1][:, [3, 2, 1, 0, 4]]
+
+	def __len__(self):
+		return len(self.log_odds)
+
+def read_homer_motif(filename, name = None):
+	# Read a Homer .motif file. The header line is:
+	# >consensus	motif name	log-odds threshold	...
+	probabilities = []
+
+	with open(filename, 'r') as motif_file:
+		for num,line in enumerate(motif_file):
+			fields = line.strip().split('\t')
+
+			if num == 0:
+				header_name = fields[1]
+				threshold = float(fields[2])
+				continue
+
+			if len(fields) == 4:
+				probabilities.append([float(value) for value in fields])
+
+	return Motif(name if name else header_name, probabilities, threshold)
+
+###################################################################################################################################################################################
+
+class Genome(object):
+	# Memory-mapped FASTA file with random access through its .fai index (samtools faidx)
+
+	def __init__(self, fasta):
+		self.index = dict()
+
+		with open(fasta + '.fai', 'r') as fai:
+			for line in fai:
+				chrom, length, offset, line_bases, line_width = line.strip().split('\t')[:5]
+				self.index[chrom] = (int(length), int(offset), int(line_bases), int(line_width))
+
+		self.fasta_file = open(fasta, 'rb')
+		self.fasta = mmap.mmap(self.fasta_file.fileno(), 0, access = mmap.ACCESS_READ)
+
+	def fetch(self, chrom, start, end):
+		# Return the encoded sequence of chrom:start-end (0-based, half-open)
+		length, offset, line_bases, line_width = self.index[chrom]
+
+		start = max(0, start)
+		end = min(length, end)
+
+		if end <= start:
+			return numpy.zeros(0, dtype = numpy.uint8)
+
+		byte_start = offset + (start // line_bases) * line_width + start % line_bases
+		byte_end = offset + ((end - 1) // line_bases) * line_width + (end - 1) % line_bases + 1
+
+		sequence = numpy.frombuffer(self.fasta[byte_start:byte_end], dtype = numpy.uint8)
+		sequence = sequence[(sequence != ord('\n')) & (sequence != ord('\r'))]
+
+		return BASE_CODES[sequence]
+
+	def close(self):
+		self.fasta.close()
+		self.fasta_file.close()
+
+class PeakSequences(object):
+	# The sequences of all peaks concatenated into one array, separated by an N so that no window spans two peaks
+
+	def __init__(self, genome, peaks):
+		# peaks is a BED file or an Intervals
+		if not isinstance(peaks, intervals.Intervals):
+			peaks = intervals.read_bed(peaks)
+
+		self.chroms = []
+		self.starts = []
+		self.missing = 0
+
+		sequences = []
+		offsets = []
+		position = 0
+
+		for chrom, start, end in zip(peaks.chroms.tolist(), peaks.starts.tolist(), peaks.ends.tolist()):
+			if chrom not in genome.index:
+				self.missing += 1
+				continue # Skip peaks on chromosomes that are not in the FASTA file
+
+			sequence = genome.fetch(chrom, start, end)
+
+			self.chroms.append(chrom)
+			self.starts.append(max(0, start))
+			offsets.append(position)
+			sequences.append(sequence)
+			sequences.append(numpy.full(1, 4, dtype = numpy.uint8))
+			position += len(sequence) + 1
+
+		self.chroms = numpy.array(self.chroms, dtype = str)
+		self.starts = numpy.array(self.starts, dtype = numpy.int64)
+		self.offsets = numpy.array(offsets, dtype = numpy.int64)
+		self.codes = numpy.concatenate(sequences) if sequences else numpy.zeros(0, dtype = numpy.uint8)
+
+	def __len__(self):
+		return len(self.starts)
+
+###################################################################################################################################################################################
+
+def window_scores(codes, log_odds):
+	# Log-odds score of every window of len(log_odds) in codes, summed one motif position at a time
+	n_windows = len(codes) - len(log_odds) + 1
+	scores = numpy.zeros(max(n_windows, 0))
+
+	for i in range(len(log_odds)):
+		scores += log_odds[i][codes[i:i + n_windows]]
+
+	return scores
+
+def scan_sequences(sequences, motif):
+	# Find all windows scoring at or above the motif threshold on either strand
+	# Returns parallel arrays of (chromosome, start, end, score, strand)
+	width = len(motif)
+	positions = []
+	scores = []
+	strands = []
+
+	for chunk_start in range(0, len(sequences.codes), SCORE_CHUNK):
+		codes = sequences.codes[chunk_start:chunk_start + SCORE_CHUNK + width - 1]
+
+		for strand, log_odds in (('+', motif.log_odds), ('-', motif.log_odds_rc)):
+			chunk_scores = window_scores(codes, log_odds)[:SCORE_CHUNK]
+			hits = numpy.flatnonzero(chunk_scores >= motif.threshold)
+
+			positions.append(hits + chunk_start)
+			scores.append(chunk_scores[hits])
+			strands.append(numpy.full(len(hits), strand))
+
+	positions = numpy.concatenate(positions) if positions else numpy.zeros(0, dtype = numpy.int64)
+	scores = numpy.concatenate(scores) if scores else numpy.zeros(0)
+	strands = numpy.concatenate(strands) if strands else numpy.zeros(0, dtype = str)
+
+	# Convert positions in the concatenated sequence back to genomic coordinates
+	peak = numpy.searchsorted(sequences.offsets, positions, side = 'right') - 1
+	starts = sequences.starts[peak] + positions - sequences.offsets[peak]
+
+	return sequences.chroms[peak], starts, starts + width, scores, strands
+
+def write_motif_bed(filename, name, hits):
+	# Write hits in the same 6 column format as Homer's -mbed output
+	chroms, starts, ends, scores, strands = hits
+
+	with open(filename, 'w') as out:
+		for i in range(len(starts)):
+			out.write('%s\t%d\t%d\t%s\t%.6f\t%s\n' % (chroms[i], starts[i], ends[i], name, scores[i], strands[i]))
+
+def read_motif_bed(filename):
+	# Read hits from a 6 column motif BED file (Homer's -mbed output or write_motif_bed)
+	chroms = []
+	starts = []
+	ends = []
+	scores = []
+	strands = []
+
+	with open(filename, 'r') as bed:
+		for line in bed:
+			if line.startswith(('#', 'track', 'browser')) or not line.strip():
+				continue
+
+			fields = line.rstrip('\r\n').split('\t')
+
+			chroms.append(fields[0])
+			starts.append(int(fields[1]))
+			ends.append(int(fields[2]))
+			scores.append(float(fields[4]))
+			strands.append(fields[5])
+
+	return numpy.array(chroms, dtype = str), numpy.array(starts, dtype = numpy.int64), numpy.array(ends, dtype = numpy.int64), numpy.array(scores), numpy.array(strands, dtype = str)
+
+###################################################################################################################################################################################
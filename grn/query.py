@@ -0,0 +1,191 @@
+from grn import cyjs
+import sqlite3
+import json
+
+###################################################################################################################################################################################
+
+# Indexed GRN store and module queries used by extract_TF_module_from_GRN.py
+# A cyjs file is compiled into an SQLite database with indexes on the edge source motif, source and target, so module queries
+# only touch the matching edges instead of re-reading the whole network
+# Compiling costs more than reading the network once, so a single query for the direct targets of some motifs in a cyjs file (the motif module)
+# is answered while streaming its edges instead (stream_module)
+
+SQLITE_MAGIC = b'SQLite format 3\x00'
+
+SCHEMA = '''
+CREATE TABLE metadata (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE nodes (name TEXT PRIMARY KEY, expression REAL, data TEXT);
+CREATE TABLE edges (source TEXT, target TEXT, source_motif TEXT, count INTEGER, data TEXT);
+'''
+
+INDEXES = '''
+CREATE INDEX edges_source_motif ON edges (source_motif, count);
+CREATE INDEX edges_source ON edges (source);
+CREATE INDEX edges_target ON edges (target);
+'''
+
+# Number of rows inserted per executemany call while compiling
+BATCH_SIZE = 10000
+
+###################################################################################################################################################################################
+
+def is_index(filename):
+	# Check whether a file is a compiled GRN index (an SQLite database) rather than a cyjs file
+	with open(filename, 'rb') as grn_file:
+		return grn_file.read(len(SQLITE_MAGIC)) == SQLITE_MAGIC
+
+def compile_index(cyjs_file, database = ':memory:'):
+	# Compile a cyjs file into an indexed SQLite database. Returns the open connection
+	connection = sqlite3.connect(database)
+	connection.executescript('DROP TABLE IF EXISTS metadata; DROP TABLE IF EXISTS nodes; DROP TABLE IF EXISTS edges;')
+	connection.executescript(SCHEMA)
+
+	nodes = list()
+	edges = list()
+	n_nodes = 0
+	n_edges = 0
+
+	for element_type, data in cyjs.iter_elements(cyjs_file):
+		if element_type == 'node':
+			nodes.append((data.get('value', data.get('name')), data.get('expression'), json.dumps(data)))
+			n_nodes += 1
+		else:
+			edges.append((data['source'], data['target'], data.get('source_motif'), data.get('count'), json.dumps(data)))
+			n_edges += 1
+
+		if len(nodes) >= BATCH_SIZE:
+			connection.executemany('INSERT OR REPLACE INTO nodes VALUES (?, ?, ?)', nodes)
+			nodes = list()
+
+		if len(edges) >= BATCH_SIZE:
+			connection.executemany('INSERT INTO edges VALUES (?, ?, ?, ?, ?)', edges)
+			edges = list()
+
+	connection.executemany('INSERT OR REPLACE INTO nodes VALUES (?, ?, ?)', nodes)
+	connection.executemany('INSERT INTO edges VALUES (?, ?, ?, ?, ?)', edges)
+	connection.executescript(INDEXES)
+
+	connection.executemany('INSERT INTO metadata VALUES (?, ?)', [('source', cyjs_file), ('nodes', str(n_nodes)), ('edges', str(n_edges))])
+	connection.commit()
+
+	return connection
+
+def open_network(filename):
+	# Open a GRN for querying: compiled indexes are opened directly, cyjs files are compiled into memory
+	if is_index(filename):
+		return GRNIndex(sqlite3.connect(filename))
+
+	return GRNIndex(compile_index(filename))
+
+def can_stream(filename, queries):
+	# Whether queries of (motifs, mode, minimum count, hops, direction) can be answered by stream_module: a single direct-target query on a cyjs file
+	if len(queries) != 1 or is_index(filename):
+		return False
+
+	motifs, mode, min_count, hops, direction = queries[0]
+
+	return hops == 1 and direction == 'downstream'
+
+def stream_module(filename, motifs, mode = 'union', min_count = 0):
+	# Targets of the given motifs with at least min_count motifs (as GRNIndex.module) in one pass over the edges of a cyjs file
+	# Returns (targets, number of nodes, number of edges)
+	if mode not in ('union', 'intersection'):
+		raise ValueError('Unknown module mode: %s' % mode)
+
+	motifs = set(motifs)
+	target_motifs = dict()
+	n_nodes = 0
+	n_edges = 0
+
+	for element_type, data in cyjs.iter_elements(filename):
+		if element_type == 'node':
+			n_nodes += 1
+			continue
+
+		n_edges += 1
+
+		# Edges without a count are never followed, as in the index (where NULL >= min_count is not true)
+		if data.get('source_motif') in motifs and data.get('count') is not None and data['count'] >= min_count:
+			target_motifs.setdefault(data['target'], set()).add(data['source_motif'])
+
+	if mode == 'union':
+		return set(target_motifs), n_nodes, n_edges
+
+	return set(target for target, hit_motifs in target_motifs.items() if len(hit_motifs) == len(motifs)), n_nodes, n_edges
+
+###################################################################################################################################################################################
+
+class GRNIndex(object):
+
+	def __init__(self, connection):
+		self.connection = connection
+
+	def number_of_nodes(self):
+		return self.connection.execute('SELECT COUNT(*) FROM nodes').fetchone()[0]
+
+	def number_of_edges(self):
+		return self.connection.execute('SELECT COUNT(*) FROM edges').fetchone()[0]
+
+	def motifs(self):
+		return [row[0] for row in self.connection.execute('SELECT DISTINCT source_motif FROM edges ORDER BY source_motif')]
+
+	def motif_sources(self, motifs):
+		# The source (TF reference) genes of a set of motifs
+		placeholders = ', '.join('?' * len(motifs))
+		query = 'SELECT DISTINCT source FROM edges WHERE source_motif IN (%s)' % placeholders
+
+		return set(row[0] for row in self.connection.execute(query, list(motifs)))
+
+	def module(self, motifs, mode = 'union', min_count = 0):
+		# Targets of the given motifs with at least min_count motifs
+		# union: targets of any of the motifs; intersection: targets of every motif
+		placeholders = ', '.join('?' * len(motifs))
+
+		if mode == 'union':
+			query = 'SELECT DISTINCT target FROM edges WHERE source_motif IN (%s) AND count >= ?' % placeholders
+			rows = self.connection.execute(query, list(motifs) + [min_count])
+		elif mode == 'intersection':
+			query = 'SELECT target FROM edges WHERE source_motif IN (%s) AND count >= ? GROUP BY target HAVING COUNT(DISTINCT source_motif) = ?' % placeholders
+			rows = self.connection.execute(query, list(motifs) + [min_count, len(set(motifs))])
+		else:
+			raise ValueError('Unknown module mode: %s' % mode)
+
+		return set(row[0] for row in rows)
+
+	def neighbours(self, nodes, direction = 'downstream', min_count = 0):
+		# Targets (downstream) or sources (upstream) of a set of nodes, through edges of any motif with at least min_count motifs
+		if direction == 'downstream':
+			query = 'SELECT DISTINCT edges.target FROM edges JOIN frontier ON edges.source = frontier.name WHERE edges.count >= ?'
+		elif direction == 'upstream':
+			query = 'SELECT DISTINCT edges.source FROM edges JOIN frontier ON edges.target = frontier.name WHERE edges.count >= ?'
+		else:
+			raise ValueError('Unknown direction: %s' % direction)
+
+		self.connection.execute('CREATE TEMP TABLE IF NOT EXISTS frontier (name TEXT PRIMARY KEY)')
+		self.connection.execute('DELETE FROM frontier')
+		self.connection.executemany('INSERT OR IGNORE INTO frontier VALUES (?)', [(node,) for node in nodes])
+
+		return set(row[0] for row in self.connection.execute(query, [min_count]))
+
+	def query(self, motifs, mode = 'union', min_count = 0, hops = 1, direction = 'downstream'):
+		# Genes within a number of hops of a set of motifs
+		# downstream: hop 1 is the motif module (the targets of the motifs), each further hop adds the targets of the genes found so far
+		# upstream: hop 1 is the regulators of the motifs' source genes, each further hop adds their regulators
+		if direction == 'downstream':
+			frontier = self.module(motifs, mode, min_count)
+		else:
+			frontier = self.neighbours(self.motif_sources(motifs), direction, min_count)
+
+		found = set(frontier)
+
+		for hop in range(1, hops):
+			frontier = self.neighbours(frontier, direction, min_count) - found
+
+			if len(frontier) == 0:
+				break
+
+			found.update(frontier)
+
+		return found
+
+###################################################################################################################################################################################
@@ -0,0 +1,290 @@
+from grn import scan_cache
+from grn import dedupe
+from grn import intervals
+from grn import tabix
+from grn import pwm
+import subprocess
+import tempfile
+import numpy
+import socket
+import shutil
+import errno
+import time
+import os
+
+###################################################################################################################################################################################
+
+# Motif scanning jobs used by findMotifs.py
+# Each job runs in its own scratch directory inside the output directory, so several motifs can be scanned at once.
+# Finished BED files are moved into place with an atomic rename, so a <motif>.bed file in the output directory is always complete.
+# Motifs can be found either with Homer (annotatePeaks.pl) or with the native PWM scanner in grn.pwm
+# With compress, motif BED files are written bgzip-compressed with a tabix index (<motif>.bed.gz and <motif>.bed.gz.tbi, see tabix.py)
+# With a scan cache (see scan_cache.py), only the peaks that have not been scanned for a motif before are passed to the scanner
+# The manifest records the checksum of the peak file each motif was scanned for, so motifs are scanned again when the peak file changes
+# Every scratch directory records the host and process ID of the job using it (SCRATCH_OWNER), so a run only removes the scratch directories left
+# behind by jobs that are no longer running, and never those of another run still scanning into the same output directory
+
+MANIFEST = 'manifest.tsv'
+SCRATCH_PREFIX = '.scratch.'
+SCRATCH_OWNER = 'owner'
+
+# Scratch directories without an owner (from older versions, or a job killed as it started) are removed once they are this old (seconds)
+STALE_SCRATCH_AGE = 3600
+
+###################################################################################################################################################################################
+
+def remove_duplicate_motifs(raw_bed, out_bed, max_dist):
+	# Homer has trouble dealing with palindromic motifs which result in each motif being found twice.
+	# These need to be removed (see dedupe.py). Sites are written with their motif name, score and strand (BED6), so builds can apply score cutoffs
+	# Sites that do not fit in memory are sorted through temporary files next to out_bed (in the scratch directory of the job)
+	return dedupe.remove_duplicate_sites(raw_bed, out_bed, max_dist, os.path.dirname(os.path.abspath(out_bed)))
+
+def make_scratch(out_dir, motif):
+	# Create a scratch directory for a job in the output directory, owned by this process
+	scratch = tempfile.mkdtemp(prefix = '%s%s.' % (SCRATCH_PREFIX, motif), dir = out_dir)
+
+	with open(os.path.join(scratch, SCRATCH_OWNER), 'w') as owner:
+		owner.write('%s\t%d\n' % (socket.gethostname(), os.getpid()))
+
+	return scratch
+
+def run_homer(bed, genome, motif_file, raw_bed, scratch):
+	# Search for motif in BED file using Homer
+	motif = os.path.basename(motif_file).replace('.motif', '')
+	homer = ['annotatePeaks.pl', bed, genome, '-noann', '-m', motif_file, '-mbed', raw_bed]
+
+	with open(os.path.join(scratch, 'Homer_output.tsv'), 'w') as homer_output, open(os.path.join(scratch, 'Homer.log'), 'w') as homer_log:
+		status = subprocess.call(homer, stdout = homer_output, stderr = homer_log, cwd = scratch)
+
+	if status != 0 or not os.path.exists(raw_bed):
+		raise RuntimeError('annotatePeaks.pl failed for %s (exit status %d)' % (motif, status))
+
+def scan_motif(bed, genome, motif_file, out_dir, max_dist, compress = False, cache = None):
+	# Search for a single motif with Homer and write the de-duplicated sites to <out_dir>/<motif>.bed
+	# Returns (motif, number of sites, elapsed seconds, number of peaks read from the scan cache, number of peaks scanned)
+	motif = os.path.basename(motif_file).replace('.motif', '')
+	start_time = time.time()
+
+	scratch = make_scratch(out_dir, motif)
+
+	try:
+		raw_bed = os.path.join(scratch, '%s_raw.bed' % motif)
+		scratch_bed = os.path.join(scratch, '%s.bed' % motif)
+
+		if cache is None:
+			run_homer(bed, genome, motif_file, raw_bed, scratch)
+			n_cached, n_scanned = 0, 0
+		else:
+			def scan_missing(missing_peaks):
+				missing_bed = os.path.join(scratch, 'missing_peaks.bed')
+				homer_bed = os.path.join(scratch, '%s_homer.bed' % motif)
+
+				write_peaks(missing_bed, missing_peaks)
+				run_homer(missing_bed, genome, motif_file, homer_bed, scratch)
+
+				return pwm.read_motif_bed(homer_bed), scan_cache.peak_keys(missing_peaks)
+
+			n_cached, n_scanned = cached_scan(cache, motif_file, motif, scan_missing, raw_bed)
+
+		n_sites = remove_duplicate_motifs(raw_bed, scratch_bed, max_dist)
+		move_motif_bed(scratch_bed, out_dir, motif, compress)
+	finally:
+		shutil.rmtree(scratch, ignore_errors = True)
+
+	return motif, n_sites, time.time() - start_time, n_cached, n_scanned
+
+def move_motif_bed(scratch_bed, out_dir, motif, compress = False):
+	# Move a finished motif BED file into the output directory, compressing and indexing it first if requested
+	# The index is moved before the compressed file, so a <motif>.bed.gz file in the output directory always has its index
+	if compress:
+		compressed_bed = tabix.compress(scratch_bed)
+		os.replace(compressed_bed + tabix.INDEX_SUFFIX, os.path.join(out_dir, '%s.bed.gz%s' % (motif, tabix.INDEX_SUFFIX)))
+		os.replace(compressed_bed, os.path.join(out_dir, '%s.bed.gz' % motif))
+	else:
+		os.replace(scratch_bed, os.path.join(out_dir, '%s.bed' % motif))
+
+def motif_bed_exists(out_dir, motif):
+	return os.path.exists(os.path.join(out_dir, '%s.bed' % motif)) or os.path.exists(os.path.join(out_dir, '%s.bed.gz' % motif))
+
+# Peaks looked up in the scan cache, and the peak sequences used by the native scanner
+# These are set once per process (before the worker pool is started, so forked workers share them)
+cache_peaks = None
+cache_peak_keys = None
+native_sequences = None
+native_peak_keys = None
+
+def load_cache_peaks(bed):
+	global cache_peaks, cache_peak_keys
+
+	cache_peaks = intervals.read_bed(bed)
+	cache_peak_keys = scan_cache.peak_keys(cache_peaks)
+
+	return cache_peaks
+
+def write_peaks(filename, peaks):
+	# Write peaks as a BED file for Homer, with a unique peak ID in the 4th column
+	with open(filename, 'w') as out:
+		for i, (chrom, start, end) in enumerate(zip(peaks.chroms.tolist(), peaks.starts.tolist(), peaks.ends.tolist())):
+			out.write('%s\t%d\t%d\tpeak%d\t0\t+\n' % (chrom, start, end, i))
+
+def cached_scan(cache, motif_file, motif, scan_missing, raw_bed):
+	# Write the raw sites of a motif in the peaks of load_cache_peaks to raw_bed, using the scan cache for the peaks scanned before
+	# scan_missing(peaks not in the cache) scans at least these peaks and returns (sites, keys of the peaks scanned); the sites are added to the cache
+	# Returns (number of peaks read from the cache, number of peaks scanned)
+	entry = cache.entry_file(motif_file)
+	cached_peaks, hits = scan_cache.read_entry(entry)
+	missing = scan_cache.missing_peaks(cached_peaks, cache_peak_keys)
+	n_missing = int(missing.sum())
+
+	if n_missing > 0:
+		new_hits, scanned_peaks = scan_missing(cache_peaks.subset(missing))
+
+		hits = scan_cache.merge_hits(hits, new_hits)
+		scan_cache.write_entry(entry, numpy.union1d(cached_peaks, scanned_peaks), hits)
+
+	pwm.write_motif_bed(raw_bed, motif, scan_cache.select_hits(hits, cache_peaks))
+
+	return len(missing) - n_missing, n_missing
+
+def load_native_sequences(fasta, bed, cache = None, motif_files = ()):
+	# Read the peak sequences for the native scanner
+	# With a scan cache, only the peaks missing from the cache for at least one of the motifs are read (peaks from load_cache_peaks)
+	global native_sequences, native_peak_keys
+
+	if cache is None:
+		peaks = bed
+	else:
+		missing = numpy.zeros(len(cache_peaks), dtype = bool)
+
+		for motif_file in motif_files:
+			missing |= scan_cache.missing_peaks(scan_cache.read_entry_peaks(cache.entry_file(motif_file)), cache_peak_keys)
+
+		peaks = cache_peaks.subset(missing)
+		native_peak_keys = cache_peak_keys[missing]
+
+	genome = pwm.Genome(fasta)
+	native_sequences = pwm.PeakSequences(genome, peaks)
+	genome.close()
+
+	return native_sequences
+
+def scan_motif_native(motif_file, out_dir, max_dist, compress = False, cache = None):
+	# Search for a single motif with the native PWM scanner and write the de-duplicated sites to <out_dir>/<motif>.bed
+	# Returns (motif, number of sites, elapsed seconds, number of peaks read from the scan cache, number of peaks scanned)
+	motif = os.path.basename(motif_file).replace('.motif', '')
+	start_time = time.time()
+
+	scratch = make_scratch(out_dir, motif)
+
+	try:
+		raw_bed = os.path.join(scratch, '%s_raw.bed' % motif)
+		scratch_bed = os.path.join(scratch, '%s.bed' % motif)
+
+		pwm_motif = pwm.read_homer_motif(motif_file, motif)
+
+		if cache is None:
+			pwm.write_motif_bed(raw_bed, pwm_motif.name, pwm.scan_sequences(native_sequences, pwm_motif))
+			n_cached, n_scanned = 0, 0
+		else:
+			# The sequences loaded are those missing from the cache for any motif, so they cover the peaks missing for this one
+			n_cached, n_scanned = cached_scan(cache, motif_file, pwm_motif.name, lambda missing_peaks: (pwm.scan_sequences(native_sequences, pwm_motif), native_peak_keys), raw_bed)
+
+		n_sites = remove_duplicate_motifs(raw_bed, scratch_bed, max_dist)
+		move_motif_bed(scratch_bed, out_dir, motif, compress)
+	finally:
+		shutil.rmtree(scratch, ignore_errors = True)
+
+	return motif, n_sites, time.time() - start_time, n_cached, n_scanned
+
+###################################################################################################################################################################################
+
+def read_manifest(out_dir):
+	# Read the motifs completed by previous runs: motif -> (number of sites, elapsed seconds, checksum of the peak file)
+	# The checksum is None for entries written before checksums were recorded
+	completed = dict()
+	manifest = os.path.join(out_dir, MANIFEST)
+
+	if not os.path.exists(manifest):
+		return completed
+
+	with open(manifest, 'r') as manifest_file:
+		for num,line in enumerate(manifest_file):
+			if num == 0:
+				continue # Skip header line
+
+			if not line.endswith('\n'):
+				continue # Skip a line truncated by an interrupted run
+
+			fields = line.rstrip('\n').split('\t')
+
+			try:
+				motif, n_sites, elapsed = fields[0], int(fields[1]), float(fields[2])
+			except (IndexError, ValueError):
+				continue # Skip a truncated line that a later run terminated (see open_manifest)
+
+			# Only trust entries whose BED file is still present
+			if motif_bed_exists(out_dir, motif):
+				completed[motif] = (n_sites, elapsed, fields[3] if len(fields) > 3 else None)
+
+	return completed
+
+def open_manifest(out_dir):
+	manifest = os.path.join(out_dir, MANIFEST)
+	is_new = not os.path.exists(manifest) or os.path.getsize(manifest) == 0
+	is_truncated = False
+
+	if not is_new:
+		with open(manifest, 'rb') as manifest_file:
+			manifest_file.seek(-1, os.SEEK_END)
+			is_truncated = manifest_file.read(1) != b'\n'
+
+	manifest_file = open(manifest, 'a')
+
+	if is_new:
+		manifest_file.write('Motif\tSites\tSeconds\tPeaks\n')
+	elif is_truncated:
+		manifest_file.write('\n') # Terminate a line truncated by an interrupted run
+
+	manifest_file.flush()
+
+	return manifest_file
+
+def process_is_running(pid):
+	try:
+		os.kill(pid, 0)
+	except OSError as error:
+		return error.errno == errno.EPERM # The process exists but belongs to another user
+
+	return True
+
+def scratch_is_stale(scratch):
+	# A scratch directory is stale if the process that owns it (on this host) is no longer running
+	# Directories owned by a process on another host (with a shared output directory) are never stale, as the process cannot be checked
+	try:
+		with open(os.path.join(scratch, SCRATCH_OWNER), 'r') as owner:
+			fields = owner.read().split('\t')
+
+		host, pid = fields[0], int(fields[1])
+	except (IOError, OSError, IndexError, ValueError):
+		# No (complete) owner file: the job may have only just created the directory
+		try:
+			return time.time() - os.path.getmtime(scratch) > STALE_SCRATCH_AGE
+		except OSError:
+			return False
+
+	return host == socket.gethostname() and not process_is_running(pid)
+
+def remove_stale_scratch(out_dir):
+	# Remove scratch directories left behind by interrupted runs. Returns the number removed
+	n_removed = 0
+
+	for name in os.listdir(out_dir):
+		scratch = os.path.join(out_dir, name)
+
+		if name.startswith(SCRATCH_PREFIX) and os.path.isdir(scratch) and scratch_is_stale(scratch):
+			shutil.rmtree(scratch, ignore_errors = True)
+			n_removed += 1
+
+	return n_removed
+
+###################################################################################################################################################################################
@@ -0,0 +1,130 @@
+from grn import intervals
+from grn import store
+import hashlib
+import numpy
+import json
+import os
+
+###################################################################################################################################################################################
+
+# Persistent cache of motif scan results used by findMotifs.py
+# An entry is kept for every motif file, genome and scanner (named by a hash of the motif file's MD5 checksum, the genome and the scanner) and
+# records the peaks that have been scanned (by their exact coordinates) and the raw sites found in them, before palindromic duplicates are removed.
+# When a peak set is scanned, only the peaks that are not yet in the entry are passed to the scanner. Their sites are merged into the entry and the
+# sites lying within the requested peaks are taken from it, so scanning a grown peak set costs time in proportion to the new peaks only.
+# Palindromic duplicates are removed after the sites are merged, so the result is the same as scanning every peak.
+#
+# Sites are held as parallel arrays of (chromosome, start, end, score, strand), as returned by pwm.scan_sequences
+
+CACHE_DIR = 'scan_cache'
+ENTRY_SUFFIX = '.npz'
+CACHE_VERSION = 1
+
+###################################################################################################################################################################################
+
+def genome_key(genome):
+	# Homer genome versions are used as given. FASTA files (native scanner) are identified by their size and the checksum of their .fai index
+	if os.path.exists(genome + '.fai'):
+		return 'fasta:%d:%s' % (os.path.getsize(genome), store.md5sum(genome + '.fai'))
+
+	return genome
+
+class ScanCache(object):
+	# The cache directory for one genome and scanner
+
+	def __init__(self, cache_dir, genome, backend):
+		if not os.path.exists(cache_dir):
+			os.makedirs(cache_dir, exist_ok = True)
+
+		self.cache_dir = cache_dir
+		self.genome = genome_key(genome)
+		self.backend = backend
+
+	def entry_file(self, motif_file):
+		key = hashlib.md5()
+		key.update(json.dumps([CACHE_VERSION, store.md5sum(motif_file), self.genome, self.backend]).encode())
+
+		return os.path.join(self.cache_dir, key.hexdigest() + ENTRY_SUFFIX)
+
+###################################################################################################################################################################################
+
+def peak_keys(peaks):
+	# chrom:start-end key of every peak
+	return numpy.array(['%s:%d-%d' % peak for peak in zip(peaks.chroms.tolist(), peaks.starts.tolist(), peaks.ends.tolist())], dtype = str)
+
+def empty_hits():
+	return numpy.zeros(0, dtype = str), numpy.zeros(0, dtype = numpy.int64), numpy.zeros(0, dtype = numpy.int64), numpy.zeros(0), numpy.zeros(0, dtype = str)
+
+def subset_hits(hits, index):
+	return tuple(values[index] for values in hits)
+
+def read_entry_peaks(entry):
+	# Sorted keys of the peaks recorded in a cache entry (none if there is no entry)
+	try:
+		with numpy.load(entry) as cache:
+			return cache['peaks']
+	except (OSError, IOError, ValueError, KeyError):
+		return numpy.zeros(0, dtype = str)
+
+def read_entry(entry):
+	# (sorted peak keys, sites) of a cache entry
+	try:
+		with numpy.load(entry) as cache:
+			hits = (cache['chrom_names'][cache['chroms']], cache['starts'].astype(numpy.int64), cache['ends'].astype(numpy.int64), cache['scores'], numpy.where(cache['minus'], '-', '+'))
+
+			return cache['peaks'], hits
+	except (OSError, IOError, ValueError, KeyError):
+		return numpy.zeros(0, dtype = str), empty_hits()
+
+def write_entry(entry, peaks, hits):
+	# Write a cache entry, replacing any existing entry atomically. Chromosomes are stored as codes and positions as 32-bit integers
+	chroms, starts, ends, scores, strands = hits
+	chrom_names, chrom_codes = numpy.unique(chroms, return_inverse = True)
+
+	if len(starts) > 0 and (starts.min() < 0 or ends.max() > numpy.iinfo(numpy.int32).max):
+		raise ValueError('Motif positions do not fit in a 32-bit integer')
+
+	tmp_file = '%s.tmp.%d.npz' % (entry, os.getpid())
+	numpy.savez(tmp_file, peaks = peaks, chrom_names = chrom_names, chroms = chrom_codes.astype(numpy.int32), starts = starts.astype(numpy.int32), ends = ends.astype(numpy.int32), scores = scores, minus = strands == '-')
+	os.replace(tmp_file, entry)
+
+###################################################################################################################################################################################
+
+def missing_peaks(cached_peaks, keys):
+	# Boolean mask of the peaks (keys from peak_keys) that are not in the cache
+	return ~numpy.isin(keys, cached_peaks)
+
+def merge_hits(hits, new_hits):
+	# Union of two sets of sites, sorted by chromosome, start and strand, with sites found in both kept once
+	hits = tuple(numpy.concatenate([values, new_values]) for values, new_values in zip(hits, new_hits))
+	chroms, starts, ends, scores, strands = hits
+
+	order = numpy.lexsort((strands, ends, starts, chroms))
+	chroms, starts, ends, strands = chroms[order], starts[order], ends[order], strands[order]
+
+	is_new = numpy.ones(len(order), dtype = bool)
+	is_new[1:] = (chroms[1:] != chroms[:-1]) | (starts[1:] != starts[:-1]) | (ends[1:] != ends[:-1]) | (strands[1:] != strands[:-1])
+
+	return subset_hits(hits, order[is_new])
+
+def select_hits(hits, peaks):
+	# Sites lying entirely within the peaks, each repeated once for every peak that contains it (as when the peaks are scanned, e.g. overlapping peaks)
+	chroms, starts, ends, scores, strands = hits
+
+	if len(starts) == 0:
+		return hits
+
+	# A peak shorter than the sites cannot contain any of them. Without these, a peak that starts at or before a site and does not end before it contains it
+	peaks = peaks.subset(peaks.ends - peaks.starts >= (ends - starts).min())
+
+	chrom_index = dict()
+	peak_codes = intervals.chrom_codes(peaks, chrom_index) * intervals.CHROM_SHIFT
+	hit_codes = intervals.chrom_codes(intervals.Intervals(chroms, starts, ends), chrom_index) * intervals.CHROM_SHIFT
+
+	# Peaks on other chromosomes cancel out of the difference
+	n_start_before = numpy.searchsorted(numpy.sort(peak_codes + peaks.starts), hit_codes + starts, side = 'right')
+	n_end_before = numpy.searchsorted(numpy.sort(peak_codes + peaks.ends), hit_codes + ends, side = 'left')
+
+	return subset_hits(hits, numpy.repeat(numpy.arange(len(starts)), n_start_before - n_end_before))
+
+###################################################################################################################################################################################
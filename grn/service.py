@@ -0,0 +1,284 @@
+from grn import footprint_cache
+from grn import intervals
+from grn import api
+from grn import cyjs
+import collections
+import socketserver
+import threading
+import http.server
+import signal
+import socket
+import json
+import time
+import sys
+import os
+
+###################################################################################################################################################################################
+
+# Long-running GRN build service used by grn_service.py
+# Motif positions and TF annotation are loaded once when the service starts. Expression tables, peak sets and footprint-filtered motif positions
+# are loaded on first use and kept in memory (and re-read if the file changes), so each request only has to count motifs and build the graph.
+#
+# Requests are JSON documents sent with POST to /build:
+#	peaks			Annotated BED file of peaks (gene ID in 4th column), or
+#	peak_list		List of [chrom, start, end, gene ID]
+#	exprs			Gene expression file, or
+#	expression		Dictionary of gene ID -> expression value
+#	min_expression	Minimum gene expression value (default 0)
+#	all_genes		Include all genes, not just TF genes (default false)
+#	footprints		BED file of footprints to filter motifs against (optional)
+#	out				Write the network to this cyjs file in the output directory of the service instead of returning it (optional)
+# The response is the Cytoscape JSON document of the network, or a summary if out was given. GET /status describes the loaded data.
+#
+# As the service reads and writes files for its clients, requests are only accepted from local clients and not from web pages open in a browser:
+# POST requests must have a Content-Type of application/json (which a browser only sends across origins after a CORS preflight, which is not answered),
+# the Host header must name the service (so a web page cannot reach it through a DNS name it controls), and networks are only written inside the
+# output directory given when the service is started.
+
+# Maximum number of peak sets and expression tables kept in memory
+MAX_CACHED_FILES = 32
+
+LOCAL_HOSTS = ['localhost', '127.0.0.1', '::1']
+WILDCARD_HOSTS = ['', '0.0.0.0', '::']
+
+###################################################################################################################################################################################
+
+class FileCache(object):
+	# Parsed files, re-read when their size or modification time changes. The least recently used file is dropped above max_size entries
+
+	def __init__(self, load, max_size = MAX_CACHED_FILES):
+		self.load = load
+		self.max_size = max_size
+		self.entries = collections.OrderedDict()
+		self.lock = threading.Lock()
+
+	def get(self, filename):
+		filename = os.path.abspath(filename)
+		stat = os.stat(filename)
+		version = (stat.st_size, stat.st_mtime_ns)
+
+		with self.lock:
+			entry = self.entries.get(filename)
+
+			if entry is not None and entry[0] == version:
+				self.entries.move_to_end(filename)
+				return entry[1]
+
+		# Parse outside the lock so other requests are not held up
+		value = self.load(filename)
+
+		with self.lock:
+			self.entries[filename] = (version, value)
+			self.entries.move_to_end(filename)
+
+			while len(self.entries) > self.max_size:
+				self.entries.popitem(last = False)
+
+		return value
+
+	def __len__(self):
+		return len(self.entries)
+
+class GRNService(object):
+
+	def __init__(self, motif_dir, annot, cache_dir = None, cache_size = footprint_cache.MAX_CACHE_SIZE, out_dir = None):
+		self.motif_dir = motif_dir
+		self.annot = annot
+		self.out_dir = os.path.abspath(out_dir) if out_dir is not None else None
+		self.cache_dir = cache_dir
+		self.cache_size = cache_size
+
+		self.peaks = FileCache(api.load_peaks)
+		self.expression = FileCache(api.load_expression)
+		self.filtered_motifs = FileCache(lambda footprints: api.filter_motifs(self.motif_dir, self.motif_positions, footprints, self.cache_dir, self.cache_size))
+
+		self.n_requests = 0
+		self.load()
+
+	def load(self):
+		# (Re)load the motif positions and TF annotation
+		self.motif_positions = api.load_motifs(self.motif_dir, log = sys.stderr)
+		self.tf_annotation = api.load_tf_annotation(self.annot)
+		self.filtered_motifs.entries.clear()
+
+	def status(self):
+		return {'motif_dir': os.path.abspath(self.motif_dir), 'motifs': len(self.motif_positions), 'annotation': os.path.abspath(self.annot),
+			'tf_annotations': len(self.tf_annotation), 'peak_sets': list(self.peaks.entries), 'expression_tables': list(self.expression.entries),
+			'footprint_sets': list(self.filtered_motifs.entries), 'out_dir': self.out_dir, 'requests': self.n_requests}
+
+	def output_file(self, out):
+		# Path of the cyjs file for the out of a request, which must be inside the output directory
+		if self.out_dir is None:
+			raise ValueError('the service was started without an output directory (-o), so networks cannot be written to file')
+
+		outfile = os.path.realpath(os.path.join(self.out_dir, cyjs.cyjs_filename(str(out))))
+
+		if os.path.commonpath([outfile, os.path.realpath(self.out_dir)]) != os.path.realpath(self.out_dir):
+			raise ValueError('out must be a file in the output directory of the service (%s)' % self.out_dir)
+
+		return outfile
+
+	def build(self, request):
+		# Build a network for a request (see above). Returns the response document
+		start_time = time.time()
+
+		if not isinstance(request, dict):
+			raise ValueError('the request must be a JSON object')
+
+		self.n_requests += 1
+
+		if 'peaks' in request:
+			peaks = self.peaks.get(request['peaks'])
+		elif 'peak_list' in request:
+			peak_list = request['peak_list']
+			peaks = intervals.Intervals([peak[0] for peak in peak_list], [int(peak[1]) for peak in peak_list], [int(peak[2]) for peak in peak_list], [peak[3] for peak in peak_list]).sort()
+		else:
+			raise ValueError('a peak file (peaks) or list of peaks (peak_list) is required')
+
+		if 'exprs' in request:
+			gene_expression = self.expression.get(request['exprs'])
+		elif 'expression' in request:
+			gene_expression = dict((gene_id, float(value)) for gene_id, value in request['expression'].items())
+		else:
+			raise ValueError('an expression file (exprs) or expression values (expression) are required')
+
+		min_expression = float(request.get('min_expression', 0))
+		gene_expression = dict((gene_id, value) for gene_id, value in gene_expression.items() if value >= min_expression)
+
+		motif_positions = self.filtered_motifs.get(request['footprints']) if request.get('footprints') else self.motif_positions
+		all_genes = bool(request.get('all_genes', False))
+
+		if request.get('out'):
+			grn = api.build_network(peaks, motif_positions, gene_expression, self.tf_annotation, all_genes, cyjs.CyjsWriter(self.output_file(request['out'])))
+			outfile = grn.close()
+
+			return {'out': outfile, 'nodes': grn.number_of_nodes(), 'edges': grn.number_of_edges(), 'elapsed': round(time.time() - start_time, 4)}
+
+		grn = api.build_network(peaks, motif_positions, gene_expression, self.tf_annotation, all_genes)
+
+		return api.network_data(grn)
+
+###################################################################################################################################################################################
+
+class RequestHandler(http.server.BaseHTTPRequestHandler):
+
+	def send_json(self, status, document):
+		body = json.dumps(document).encode()
+
+		self.send_response(status)
+		self.send_header('Content-Type', 'application/json')
+		self.send_header('Content-Length', str(len(body)))
+		self.end_headers()
+		self.wfile.write(body)
+
+	def host_is_allowed(self):
+		# The Host header must name the service, without which a web page could reach it through a DNS name resolving to this machine
+		if self.server.allowed_hosts is None:
+			return True
+
+		host = self.headers.get('Host', '')
+		host = host[1:host.find(']')] if host.startswith('[') else host.rsplit(':', 1)[0] if host.count(':') == 1 else host
+
+		return host.lower() in self.server.allowed_hosts
+
+	def do_GET(self):
+		if not self.host_is_allowed():
+			self.send_json(403, {'error': 'unknown host %s' % self.headers.get('Host')})
+		elif self.path == '/status':
+			self.send_json(200, self.server.service.status())
+		else:
+			self.send_json(404, {'error': 'unknown path %s' % self.path})
+
+	def do_POST(self):
+		if not self.host_is_allowed():
+			self.send_json(403, {'error': 'unknown host %s' % self.headers.get('Host')})
+			return
+
+		# Browsers send other content types (e.g. text/plain) across origins without asking first, so these are refused
+		if self.headers.get('Content-Type', '').split(';')[0].strip().lower() != 'application/json':
+			self.send_json(415, {'error': 'requests must have a Content-Type of application/json'})
+			return
+
+		try:
+			length = int(self.headers.get('Content-Length', 0))
+			request = json.loads(self.rfile.read(length).decode()) if length > 0 else dict()
+
+			if self.path == '/build':
+				self.send_json(200, self.server.service.build(request))
+			elif self.path == '/reload':
+				self.server.service.load()
+				self.send_json(200, self.server.service.status())
+			else:
+				self.send_json(404, {'error': 'unknown path %s' % self.path})
+		except (ValueError, KeyError, IndexError, OSError, IOError) as error:
+			self.send_json(400, {'error': str(error)})
+		except Exception as error:
+			# Any other error (e.g. a value of the wrong type in the request) still gets a reply
+			self.send_json(500, {'error': '%s: %s' % (type(error).__name__, error)})
+
+	def address_string(self):
+		# Unix socket clients have no address
+		return self.client_address[0] if self.client_address else 'local'
+
+	def log_message(self, format, *args):
+		sys.stderr.write('%s %s\n' % (time.strftime('%Y-%m-%d %H:%M:%S'), format % args))
+
+class HTTPServer(socketserver.ThreadingMixIn, http.server.HTTPServer):
+	daemon_threads = True
+
+class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+	daemon_threads = True
+
+	def server_bind(self):
+		socketserver.UnixStreamServer.server_bind(self)
+		self.server_name = 'localhost'
+		self.server_port = 0
+
+def allowed_hosts(host):
+	# Host header values accepted by a service listening on host (the local names, the address itself, and the names of this machine if it listens
+	# on every address)
+	hosts = set(LOCAL_HOSTS)
+	hosts.add(host.lower())
+
+	if host in WILDCARD_HOSTS:
+		hosts.update([socket.gethostname().lower(), socket.getfqdn().lower()])
+
+	return hosts
+
+def make_server(service, host = '127.0.0.1', port = 8765, socket_file = None):
+	# Server for a service, on a Unix socket if socket_file is given, otherwise over HTTP on host:port. Returns (server, address)
+	if socket_file is not None:
+		if os.path.exists(socket_file):
+			os.remove(socket_file)
+
+		server = UnixHTTPServer(socket_file, RequestHandler)
+		server.allowed_hosts = None # Only local processes can connect to a Unix socket, not browsers
+		address = socket_file
+	else:
+		server = HTTPServer((host, port), RequestHandler)
+		server.allowed_hosts = allowed_hosts(host)
+		address = 'http://%s:%d' % (host, server.server_port)
+
+	server.service = service
+
+	return server, address
+
+def serve(service, host = '127.0.0.1', port = 8765, socket_file = None):
+	# Serve requests until interrupted, on a Unix socket if socket_file is given, otherwise over HTTP on host:port
+	server, address = make_server(service, host, port, socket_file)
+
+	# Shut down cleanly (removing the socket file) on SIGTERM as well as Ctrl-C
+	signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+	sys.stderr.write('Serving %d motifs on %s\n' % (len(service.motif_positions), address))
+
+	try:
+		server.serve_forever()
+	except (KeyboardInterrupt, SystemExit):
+		pass
+	finally:
+		server.server_close()
+
+		if socket_file is not None and os.path.exists(socket_file):
+			os.remove(socket_file)
+
+###################################################################################################################################################################################
@@ -0,0 +1,186 @@
+from grn import intervals
+from grn import network
+import multiprocessing
+import numpy
+
+###################################################################################################################################################################################
+
+# Permutation null model for the significance of GRN edges
+# The count of an edge is the number of sites of its motif in the peaks of its target gene. Two null models are available:
+#
+#	shuffle		The sites of the motif that fall in peaks are placed again uniformly at random over all peak bases, as with bedtools shuffle -incl peaks.
+#				The number of sites landing in the peaks of each gene then follows a multinomial distribution with probabilities proportional to the
+#				(motif width-adjusted) total peak length of each gene, so a whole batch of permutations is drawn with one numpy multinomial call.
+#	background	For each peak of the gene, a peak of similar length is drawn from a background peak set (e.g. the union of ATAC-Seq peaks of all samples)
+#				and the motif sites in the drawn peaks are summed. Background peaks are binned by length, and all draws for a batch of permutations
+#				and all target genes of a motif are made as one array.
+#
+# The empirical p-value of an edge is (1 + number of permutations with at least the observed count) / (1 + number of permutations), and the FDR is
+# the Benjamini-Hochberg adjusted p-value over all edges of the network. Motifs are tested in parallel in a process pool.
+
+DEFAULT_PERMUTATIONS = 1000
+
+# Number of length bins for background peaks
+LENGTH_BINS = 10
+
+# Upper limit on the number of values drawn at once (controls peak memory use)
+MAX_DRAWS = 2 ** 22
+
+###################################################################################################################################################################################
+
+def final_edges(motif_gene_hits, motif_ref_gene, gene_expression, tf_genes = None):
+	# The edges of the network built by network.build_graph from the same data, as {(motif ID, gene ID): count}
+	# An edge made by a motif is replaced by a later motif with the same reference gene, so only the last one is kept
+	edges = dict()
+
+	for motif_id, gene_hits in motif_gene_hits:
+		if motif_id not in motif_ref_gene:
+			continue
+
+		source_node = motif_ref_gene[motif_id][0]
+
+		for gene_id, count in network.target_counts(gene_hits, gene_expression, tf_genes).items():
+			edges[(source_node, gene_id)] = (motif_id, count)
+
+	return dict(((motif_id, gene_id), count) for (source_node, gene_id), (motif_id, count) in edges.items())
+
+def gene_peaks(peaks):
+	# Gene ID -> indices of its peaks (4th column of the peak file)
+	genes, inverse = numpy.unique(peaks.names, return_inverse = True)
+	order = numpy.argsort(inverse, kind = 'stable')
+	bounds = numpy.searchsorted(inverse[order], numpy.arange(len(genes) + 1))
+
+	return dict((str(gene_id), order[bounds[i]:bounds[i + 1]]) for i, gene_id in enumerate(genes))
+
+def motif_width(sites):
+	# Median width of the sites of a motif
+	return int(numpy.median(sites.ends - sites.starts)) if len(sites) > 0 else 1
+
+def benjamini_hochberg(pvalues):
+	# FDR (Benjamini-Hochberg adjusted p-values) for an array of p-values
+	pvalues = numpy.asarray(pvalues, dtype = float)
+
+	if len(pvalues) == 0:
+		return pvalues
+
+	order = numpy.argsort(pvalues)
+	adjusted = pvalues[order] * len(pvalues) / numpy.arange(1, len(pvalues) + 1)
+	adjusted = numpy.minimum.accumulate(adjusted[::-1])[::-1]
+
+	fdr = numpy.empty(len(pvalues))
+	fdr[order] = numpy.minimum(adjusted, 1)
+
+	return fdr
+
+###################################################################################################################################################################################
+
+# Null models. Each returns, for every target gene, the number of permutations with at least the observed count
+# seed is a list of integers, so that each motif gets its own random stream whatever the number of processes
+
+def shuffle_exceedances(n_sites, probabilities, observed, n_permutations, seed):
+	# n_sites motif sites placed over the target genes (probabilities[:-1]) and all other peaks (probabilities[-1])
+	rng = numpy.random.default_rng(seed)
+	exceed = numpy.zeros(len(observed), dtype = numpy.int64)
+	batch_size = max(1, MAX_DRAWS // len(probabilities))
+
+	for batch_start in range(0, n_permutations, batch_size):
+		null_counts = rng.multinomial(n_sites, probabilities, size = min(batch_size, n_permutations - batch_start))
+		exceed += (null_counts[:, :-1] >= observed).sum(axis = 0)
+
+	return exceed
+
+def background_exceedances(background_counts, bin_starts, bin_sizes, peak_bins, gene_offsets, observed, n_permutations, seed):
+	# background_counts are the motif counts of background peaks sorted by length, in bins starting at bin_starts
+	# peak_bins are the length bins of the peaks of all target genes, the peaks of target gene i being peak_bins[gene_offsets[i]:gene_offsets[i + 1]]
+	rng = numpy.random.default_rng(seed)
+	exceed = numpy.zeros(len(observed), dtype = numpy.int64)
+	batch_size = max(1, MAX_DRAWS // max(len(peak_bins), 1))
+
+	starts = bin_starts[peak_bins]
+	sizes = bin_sizes[peak_bins]
+
+	for batch_start in range(0, n_permutations, batch_size):
+		draws = starts + (rng.random((min(batch_size, n_permutations - batch_start), len(peak_bins))) * sizes).astype(numpy.int64)
+		null_counts = numpy.add.reduceat(background_counts[draws], gene_offsets[:-1], axis = 1)
+		exceed += (null_counts >= observed).sum(axis = 0)
+
+	return exceed
+
+###################################################################################################################################################################################
+
+def length_bins(lengths, n_bins = LENGTH_BINS):
+	# Order of intervals by length, and the start and size of each length bin (quantiles of the lengths) in that order
+	order = numpy.argsort(lengths, kind = 'stable')
+	bin_starts = numpy.linspace(0, len(lengths), n_bins + 1).astype(numpy.int64)
+	bin_starts = numpy.unique(bin_starts[:-1])
+	bin_sizes = numpy.diff(numpy.append(bin_starts, len(lengths)))
+	bin_edges = lengths[order][bin_starts[1:]]
+
+	return order, bin_starts, bin_sizes, bin_edges
+
+def edge_significance(motif_gene_hits, motif_ref_gene, gene_expression, tf_genes, peaks, motif_positions, n_permutations = DEFAULT_PERMUTATIONS, background = None,
+	processes = 1, seed = 0, max_fdr = None):
+	# Empirical p-value and FDR of every edge of the network built from motif_gene_hits (a list of (motif ID, [(gene ID, number of motifs), ...]))
+	# peaks are the Intervals the hits were counted in and background is an optional Intervals of background peaks (otherwise motif sites are shuffled within peaks)
+	# Returns {(motif ID, gene ID): (p-value, FDR)}, without the edges with FDR above max_fdr if it is given
+	edges = final_edges(motif_gene_hits, motif_ref_gene, gene_expression, tf_genes)
+	motif_sites = dict((motif_id, sum(count for gene_id, count in gene_hits)) for motif_id, gene_hits in motif_gene_hits)
+
+	motif_targets = dict()
+
+	for (motif_id, gene_id), count in edges.items():
+		motif_targets.setdefault(motif_id, []).append((gene_id, count))
+
+	peak_index = gene_peaks(peaks)
+	peak_lengths = (peaks.ends - peaks.starts).astype(numpy.int64)
+
+	if background is not None:
+		if len(background) == 0:
+			raise ValueError('the background peak set is empty')
+
+		background_lengths = (background.ends - background.starts).astype(numpy.int64)
+		background_order, bin_starts, bin_sizes, bin_edges = length_bins(background_lengths)
+		peak_length_bins = numpy.searchsorted(bin_edges, peak_lengths, side = 'right')
+
+		test_motifs = [motif_id for motif_id in motif_positions if motif_id in motif_targets]
+		background_counts = dict((motif_id, counts[background_order]) for motif_id, counts in intervals.iter_motif_peak_counts(background, dict((motif_id, motif_positions[motif_id]) for motif_id in test_motifs)))
+	else:
+		gene_lengths = dict((gene_id, (int(peak_lengths[index].sum()), len(index))) for gene_id, index in peak_index.items())
+		total_length = int(peak_lengths.sum())
+
+	pool = multiprocessing.Pool(processes) if processes > 1 else None
+	results = []
+
+	for n, motif_id in enumerate(motif_targets):
+		target_genes = [gene_id for gene_id, count in motif_targets[motif_id]]
+		observed = numpy.array([count for gene_id, count in motif_targets[motif_id]], dtype = numpy.int64)
+
+		if background is not None:
+			target_peaks = [peak_index[gene_id] for gene_id in target_genes]
+			gene_offsets = numpy.cumsum([0] + [len(index) for index in target_peaks])
+			task = (background_exceedances, (background_counts[motif_id], bin_starts, bin_sizes, peak_length_bins[numpy.concatenate(target_peaks)], gene_offsets, observed, n_permutations, [seed, n]))
+		else:
+			# Sites overlapping a peak by at least one base may start up to motif width - 1 bases before it
+			extra = motif_width(motif_positions[motif_id]) - 1
+			target_lengths = numpy.array([gene_lengths[gene_id][0] + gene_lengths[gene_id][1] * extra for gene_id in target_genes], dtype = float)
+			probabilities = target_lengths / (total_length + len(peaks) * extra)
+			probabilities = numpy.append(probabilities, max(0.0, 1 - probabilities.sum()))
+			task = (shuffle_exceedances, (motif_sites[motif_id], probabilities / probabilities.sum(), observed, n_permutations, [seed, n]))
+
+		if pool is not None:
+			results.append((motif_id, target_genes, pool.apply_async(task[0], task[1])))
+		else:
+			results.append((motif_id, target_genes, task[0](*task[1])))
+
+	if pool is not None:
+		pool.close()
+		results = [(motif_id, target_genes, result.get()) for motif_id, target_genes, result in results]
+		pool.join()
+
+	keys = [(motif_id, gene_id) for motif_id, target_genes, exceed in results for gene_id in target_genes]
+	pvalues = (1 + numpy.concatenate([exceed for motif_id, target_genes, exceed in results] or [numpy.zeros(0)])) / (1 + n_permutations)
+	fdr = benjamini_hochberg(pvalues)
+
+	return dict((key, (float(pvalue), float(q))) for key, pvalue, q in zip(keys, pvalues, fdr) if max_fdr is None or q <= max_fdr)
+
+###################################################################################################################################################################################
@@ -0,0 +1,193 @@
+from grn import intervals
+import hashlib
+import numpy
+import json
+import os
+
+###################################################################################################################################################################################
+
+# Binary motif position store
+# A directory of motif BED files is packed into a single file holding per-motif, per-chromosome int32 start/end arrays that are memory-mapped when read.
+# The file layout is:
+#	MAGIC (8 bytes) | header length (uint64) | JSON header (padded to 8 bytes) | int32 data
+# The header records the size, modification time and MD5 checksum of every source BED file, so a stale store can be detected and rebuilt.
+# Motif scores (5th column of the BED files written by findMotifs.py) are stored as a float32 array after the start/end arrays of each block.
+
+MAGIC = b'GRNMSTR1'
+STORE_FILE = 'motif_positions.store'
+VERSION = 2
+
+###################################################################################################################################################################################
+
+def md5sum(filename):
+	md5 = hashlib.md5()
+
+	with open(filename, 'rb') as source:
+		for chunk in iter(lambda: source.read(2 ** 20), b''):
+			md5.update(chunk)
+
+	return md5.hexdigest()
+
+def motif_bed_files(motif_dir):
+	# Motif ID -> BED file for every .bed (or bgzip-compressed .bed.gz) file in the motif directory
+	# If a motif has both, the compressed file is used
+	motif_files = dict()
+
+	for motif_bed_file in sorted(os.listdir(motif_dir)):
+		for extension in ('.bed.gz', '.bed'):
+			if motif_bed_file.endswith(extension):
+				motif_id = motif_bed_file[:-len(extension)]
+
+				if extension == '.bed.gz' or motif_id not in motif_files:
+					motif_files[motif_id] = os.path.join(motif_dir, motif_bed_file)
+
+				break
+
+	return motif_files
+
+def source_info(filename, checksum = True):
+	stat = os.stat(filename)
+	info = {'size': stat.st_size, 'mtime': stat.st_mtime_ns}
+
+	if checksum:
+		info['md5'] = md5sum(filename)
+
+	return info
+
+###################################################################################################################################################################################
+
+def pack(motif_dir, store_file = None):
+	# Convert a directory of motif BED files into a binary store. Returns the path of the store
+	if store_file is None:
+		store_file = os.path.join(motif_dir, STORE_FILE)
+
+	motif_positions = dict()
+	sources = dict()
+
+	for motif_id, motif_bed_file in sorted(motif_bed_files(motif_dir).items()):
+		sources[motif_id] = source_info(motif_bed_file)
+		motif_positions[motif_id] = intervals.read_bed(motif_bed_file, scores = True)
+
+	return write(store_file, motif_positions, sources)
+
+def write(store_file, motif_positions, sources):
+	# Write motif ID -> Intervals to a binary store, recording sources (motif ID -> source file info) in the header
+	# Each block is recorded as [motif ID, chromosome, offset, number of sites, 1 if scores are stored]
+	header = {'version': VERSION, 'sources': sources, 'blocks': list()}
+	data = list()
+	offset = 0
+
+	for motif_id, sites in motif_positions.items():
+		if len(sites) > 0 and (sites.starts.min() < 0 or sites.ends.max() > numpy.iinfo(numpy.int32).max):
+			raise ValueError('Motif positions for %s do not fit in a 32-bit integer' % motif_id)
+
+		# Group sites by chromosome, keeping their original order within each chromosome
+		order = numpy.argsort(sites.chroms, kind = 'stable')
+		chroms, first, counts = numpy.unique(sites.chroms[order], return_index = True, return_counts = True)
+
+		for chrom, i, n in zip(chroms, first, counts):
+			block = order[i:i + n]
+
+			header['blocks'].append([motif_id, str(chrom), offset, int(n), int(sites.scores is not None)])
+			data.append(sites.starts[block].astype(numpy.int32))
+			data.append(sites.ends[block].astype(numpy.int32))
+			offset += 2 * int(n)
+
+			if sites.scores is not None:
+				data.append(sites.scores[block].astype(numpy.float32))
+				offset += int(n)
+
+	header = json.dumps(header).encode()
+	header += b' ' * (-len(header) % 8)
+
+	# Write to a temporary file and rename it, so that concurrent builds never see a partial store
+	tmp_file = '%s.tmp.%d' % (store_file, os.getpid())
+
+	with open(tmp_file, 'wb') as out:
+		out.write(MAGIC)
+		out.write(numpy.uint64(len(header)).tobytes())
+		out.write(header)
+
+		for array in data:
+			out.write(array.tobytes())
+
+	os.replace(tmp_file, store_file)
+
+	return store_file
+
+def read_header(store_file):
+	with open(store_file, 'rb') as store:
+		if store.read(len(MAGIC)) != MAGIC:
+			raise ValueError('%s is not a motif position store' % store_file)
+
+		header_length = int(numpy.frombuffer(store.read(8), dtype = numpy.uint64)[0])
+		header = json.loads(store.read(header_length).decode())
+
+	return header, len(MAGIC) + 8 + header_length
+
+def is_stale(store_file, motif_dir):
+	# A store is stale if the set of motif BED files has changed, or if any file has changed content.
+	# Files whose size and modification time match are trusted without re-computing their checksum
+	if not os.path.exists(store_file):
+		return True
+
+	try:
+		header, data_offset = read_header(store_file)
+	except ValueError:
+		return True
+
+	if header.get('version') != VERSION:
+		return True
+
+	motif_files = motif_bed_files(motif_dir)
+
+	if set(motif_files) != set(header['sources']):
+		return True
+
+	for motif_id, motif_bed_file in motif_files.items():
+		recorded = header['sources'][motif_id]
+		current = source_info(motif_bed_file, checksum = False)
+
+		if current['size'] != recorded['size']:
+			return True
+
+		if current['mtime'] != recorded['mtime'] and md5sum(motif_bed_file) != recorded['md5']:
+			return True
+
+	return False
+
+def load(store_file):
+	# Memory-map a store. Returns a dictionary of motif ID -> Intervals
+	header, data_offset = read_header(store_file)
+
+	motif_blocks = dict((motif_id, list()) for motif_id in header['sources'])
+
+	if os.path.getsize(store_file) > data_offset:
+		data = numpy.memmap(store_file, dtype = numpy.int32, mode = 'r', offset = data_offset)
+	else:
+		data = numpy.zeros(0, dtype = numpy.int32)
+
+	# Blocks of version 1 stores (e.g. older footprint cache entries) have no scores
+	for block in header['blocks']:
+		motif_id, chrom, offset, n = block[:4]
+		scores = data[offset + 2 * n:offset + 3 * n].view(numpy.float32) if len(block) > 4 and block[4] else None
+
+		motif_blocks[motif_id].append((chrom, data[offset:offset + n], data[offset + n:offset + 2 * n], scores))
+
+	return dict((motif_id, intervals.Intervals.from_blocks(motif_blocks[motif_id])) for motif_id in motif_blocks)
+
+def load_motif_positions(motif_dir, store_file = None):
+	# Load the motif positions for a motif directory through its store, packing it first if it is missing or stale.
+	# Returns (motif ID -> Intervals, True if the store was rebuilt)
+	if store_file is None:
+		store_file = os.path.join(motif_dir, STORE_FILE)
+
+	rebuilt = False
+
+	if is_stale(store_file, motif_dir):
+		pack(motif_dir, store_file)
+		rebuilt = True
+
+	return load(store_file), rebuilt
+
+###################################################################################################################################################################################
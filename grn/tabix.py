@@ -0,0 +1,112 @@
+from grn import intervals
+import numpy
+import os
+
+try:
+	import pysam
+except ImportError:
+	pysam = None
+
+###################################################################################################################################################################################
+
+# bgzip-compressed, tabix-indexed BED files (<name>.bed.gz with a <name>.bed.gz.tbi index) for motif positions and footprints
+# Compressed files are read in full like plain BED files (intervals.read_bed), or through the index for the records overlapping a set of regions,
+# so a build restricted to a few loci (build_gene_regulatory_network.py --regions) only decompresses the blocks it needs.
+# Compression and indexed reads use pysam, which is only needed for these files.
+
+COMPRESSED_SUFFIX = '.gz'
+INDEX_SUFFIX = '.tbi'
+
+###################################################################################################################################################################################
+
+def require_pysam():
+	if pysam is None:
+		raise ImportError('pysam is needed for bgzip-compressed, indexed BED files (pip install pysam)')
+
+def is_indexed(filename):
+	return filename.endswith(COMPRESSED_SUFFIX) and os.path.exists(filename + INDEX_SUFFIX)
+
+def compress(bed_file):
+	# bgzip and index a sorted BED file, replacing it with <bed_file>.gz and <bed_file>.gz.tbi. Returns the name of the compressed file
+	require_pysam()
+
+	return pysam.tabix_index(bed_file, preset = 'bed', force = True)
+
+def compress_bed(bed_file, keep_original = False):
+	# Sort a BED file (by chromosome, start and end, dropping header lines), bgzip it and index it as <bed_file>.gz. Returns the name of the compressed file
+	require_pysam()
+
+	with open(bed_file, 'r') as bed:
+		lines = [line if line.endswith('\n') else line + '\n' for line in bed if line.strip() and not line.startswith(('#', 'track', 'browser'))]
+
+	fields = [line.split('\t', 3) for line in lines]
+	order = sorted(range(len(lines)), key = lambda i: (fields[i][0], int(fields[i][1]), int(fields[i][2])))
+
+	sorted_bed = '%s.sorted.%d' % (bed_file, os.getpid())
+
+	with open(sorted_bed, 'w') as out:
+		out.writelines(lines[i] for i in order)
+
+	compressed_bed = compress(sorted_bed)
+
+	os.replace(compressed_bed + INDEX_SUFFIX, bed_file + COMPRESSED_SUFFIX + INDEX_SUFFIX)
+	os.replace(compressed_bed, bed_file + COMPRESSED_SUFFIX)
+
+	if not keep_original:
+		os.remove(bed_file)
+
+	return bed_file + COMPRESSED_SUFFIX
+
+def merge_regions(regions, padding = 0):
+	# Sorted, non-overlapping (chrom, start, end) regions covering an Intervals, each extended by padding on both sides
+	regions = regions.sort()
+	merged = list()
+
+	for chrom, start, end in zip(regions.chroms.tolist(), (regions.starts - padding).tolist(), (regions.ends + padding).tolist()):
+		start = max(start, 0)
+
+		if len(merged) > 0 and merged[-1][0] == chrom and start <= merged[-1][2]:
+			merged[-1][2] = max(merged[-1][2], end)
+		else:
+			merged.append([chrom, start, end])
+
+	return merged
+
+def fetch(filename, regions, scores = False):
+	# Read the records of an indexed BED file that overlap any of the merged regions (from merge_regions). Returns Intervals
+	# With scores, the 5th column (e.g. motif scores) is read as with intervals.read_bed
+	require_pysam()
+
+	chroms = []
+	starts = []
+	ends = []
+	site_scores = []
+
+	with pysam.TabixFile(filename) as bed:
+		contigs = set(bed.contigs)
+		previous_chrom, previous_end = None, 0
+
+		for chrom, start, end in regions:
+			if chrom not in contigs:
+				continue
+
+			for record in bed.fetch(chrom, start, end):
+				fields = record.split('\t')
+				record_start = int(fields[1])
+
+				# A record that starts before the end of the previous region on the same chromosome overlaps it as well, and has already been read
+				if chrom == previous_chrom and record_start < previous_end:
+					continue
+
+				chroms.append(fields[0])
+				starts.append(record_start)
+				ends.append(int(fields[2]))
+
+				if scores:
+					site_scores.append(float(fields[4]) if len(fields) > 4 and fields[4] not in ('', '.') else numpy.nan)
+
+			previous_chrom, previous_end = chrom, end
+
+	return intervals.Intervals(chroms, numpy.array(starts, dtype = numpy.int64), numpy.array(ends, dtype = numpy.int64), scores = numpy.array(site_scores) if scores and not numpy.isnan(site_scores).all() else None)
+
+###################################################################################################################################################################################
@@ -0,0 +1,26 @@
+#!/usr/bin/env python
+from grn import footprint_cache
+from grn import service
+import argparse
+
+###################################################################################################################################################################################
+
+# Read command line arguments
+parser = argparse.ArgumentParser(description = 'Run a local service that keeps motif positions and expression data in memory and builds Gene Regulatory Networks on request')
+parser.add_argument('dir', type = str, help = 'Directory of BED files with the genomic coordinates for each TF motif to inlclude in the GRNs')
+parser.add_argument('annot', type = str, help = 'Transcription Factor (TF) annotation file with gene ID and name of the motif it can bind to')
+parser.add_argument('-H', '--host', dest = 'H', type = str, default = '127.0.0.1', help = 'Address to listen on. Default = 127.0.0.1 (local connections only)')
+parser.add_argument('-p', '--port', dest = 'p', type = int, default = 8765, help = 'Port to listen on. Default = 8765')
+parser.add_argument('-s', '--socket', dest = 's', type = str, required = False, help = 'Listen on this Unix socket instead of a TCP port')
+parser.add_argument('-o', '--out-dir', dest = 'o', type = str, required = False, help = 'Directory that networks requested with out are written to. Default: networks can only be returned, not written to file')
+parser.add_argument('-C', '--cache', dest = 'C', type = str, required = False, help = 'Directory for the cache of footprint-filtered motif positions. Default: footprint_cache in the motif directory')
+parser.add_argument('--cache-size', dest = 'cache_size', type = float, default = footprint_cache.MAX_CACHE_SIZE / 2 ** 20, help = 'Maximum size of the footprint cache in MB. Default = %(default)d')
+
+args = parser.parse_args()
+
+###################################################################################################################################################################################
+
+grn_service = service.GRNService(args.dir, args.annot, args.C, args.cache_size * 2 ** 20, args.o)
+service.serve(grn_service, args.H, args.p, args.s)
+
+###################################################################################################################################################################################
@@ -0,0 +1,36 @@
+#!/usr/bin/env python
+from grn import tabix
+import argparse
+import sys
+import os
+
+###################################################################################################################################################################################
+
+# Read command line arguments
+parser = argparse.ArgumentParser(description = 'bgzip-compress and tabix-index BED files (e.g. motif directories and footprints) for region-restricted GRN builds')
+parser.add_argument('beds', type = str, nargs = '+', help = 'BED files, or directories in which to compress every .bed file (e.g. motif directories)')
+parser.add_argument('-k', '--keep', dest = 'k', action = 'store_true', required = False, help = 'Keep the uncompressed files. Default: False')
+
+args = parser.parse_args()
+
+###################################################################################################################################################################################
+
+bed_files = list()
+
+for path in args.beds:
+	if os.path.isdir(path):
+		bed_files.extend(os.path.join(path, bed_file) for bed_file in sorted(os.listdir(path)) if bed_file.endswith('.bed'))
+	else:
+		bed_files.append(path)
+
+input_size = 0
+output_size = 0
+
+for bed_file in bed_files:
+	input_size += os.path.getsize(bed_file)
+	compressed_bed = tabix.compress_bed(bed_file, args.k)
+	output_size += os.path.getsize(compressed_bed) + os.path.getsize(compressed_bed + tabix.INDEX_SUFFIX)
+
+sys.stdout.write('Compressed and indexed %d BED files (%.1f MB -> %.1f MB)\n' % (len(bed_files), input_size / 2 ** 20, output_size / 2 ** 20))
+
+###################################################################################################################################################################################
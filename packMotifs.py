@@ -0,0 +1,35 @@
+#!/usr/bin/env python
+from grn import store
+import argparse
+import sys
+import os
+
+###################################################################################################################################################################################
+
+# Read command line arguments
+parser = argparse.ArgumentParser(description = 'Pack a directory of motif BED files into a binary motif position store')
+parser.add_argument('dir', type = str, help = 'Directory of BED files with the genomic coordinates for each TF motif')
+parser.add_argument('-o', '--out', dest = 'o', type = str, required = False, help = 'Output store file. Default = <dir>/%s' % store.STORE_FILE)
+parser.add_argument('-c', '--check', dest = 'c', action = 'store_true', required = False, help = 'Only check whether the store is up to date. Exits with status 1 if it is stale')
+
+args = parser.parse_args()
+
+###################################################################################################################################################################################
+
+store_file = args.o if args.o else os.path.join(args.dir, store.STORE_FILE)
+is_stale = store.is_stale(store_file, args.dir)
+
+if args.c:
+	sys.stdout.write('%s is %s\n' % (store_file, 'stale' if is_stale else 'up to date'))
+	sys.exit(1 if is_stale else 0)
+
+if not is_stale:
+	sys.stdout.write('%s is already up to date\n' % store_file)
+	sys.exit(0)
+
+store.pack(args.dir, store_file)
+header, data_offset = store.read_header(store_file)
+
+sys.stdout.write('Packed %d motifs (%d sites) into %s\n' % (len(header['sources']), sum(block[3] for block in header['blocks']), store_file))
+
+###################################################################################################################################################################################
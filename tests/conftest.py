@@ -0,0 +1,6 @@
+import sys
+import os
+
+# The tests import the shared modules (grn) and run the scripts from the repository directory
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
@@ -0,0 +1,184 @@
+from conftest import REPO_DIR
+from grn import intervals
+from grn import annotate
+import subprocess
+import numpy
+import sys
+import os
+
+###################################################################################################################################################################################
+
+def make_intervals(sites, names = None):
+	return intervals.Intervals([site[0] for site in sites], numpy.array([site[1] for site in sites], dtype = numpy.int64), numpy.array([site[2] for site in sites], dtype = numpy.int64), names).sort()
+
+def test_nearest_tss_with_chromosome_missing_from_query():
+	# chr2 has TSSs but no query intervals, and sorts between the query chromosomes
+	query = make_intervals([('chr1', 1000, 1200), ('chr3', 5000, 5200), ('chr3', 9000, 9200)])
+	tss = make_intervals([('chr1', 1500, 1501), ('chr2', 100, 101), ('chr2', 8000, 8001), ('chr3', 5300, 5301), ('chr3', 9050, 9051)], ['A', 'B', 'C', 'D', 'E'])
+
+	genes, distances = annotate.nearest_tss(query, tss, 1000)
+
+	assert genes.tolist() == ['A', 'D', 'E']
+	assert distances.tolist() == [400, 200, 50]
+
+def test_nearest_tss_with_chromosome_missing_from_tss():
+	query = make_intervals([('chr1', 1000, 1200), ('chr2', 100, 200), ('chr3', 5000, 5200)])
+	tss = make_intervals([('chr1', 1500, 1501), ('chr3', 5300, 5301)], ['A', 'D'])
+
+	genes, distances = annotate.nearest_tss(query, tss, 1000)
+
+	assert genes.tolist() == ['A', '', 'D']
+	assert distances.tolist() == [400, -1, 200]
+
+def test_nearest_tss_max_dist():
+	query = make_intervals([('chr1', 1000, 1200), ('chr1', 50000, 50200)])
+	tss = make_intervals([('chr1', 1500, 1501)], ['A'])
+
+	genes, distances = annotate.nearest_tss(query, tss, 1000)
+
+	assert genes.tolist() == ['A', '']
+	assert distances.tolist() == [400, -1]
+
+###################################################################################################################################################################################
+
+def write_annotation_data(directory, seed = 0):
+	# Random peaks, CHiC sites (for two cell types) and TSSs. The TSS file has chromosomes with no peaks, between and after the peak chromosomes
+	random = numpy.random.RandomState(seed)
+	peak_chroms = ['chr1', 'chr10', 'chr22', 'chr3']
+	tss_chroms = peak_chroms + ['chr2', 'chr21', 'chrM', 'chrUn_KI270302v1']
+
+	with open(str(directory.join('peaks.bed')), 'w') as bed:
+		for chrom in peak_chroms:
+			for start in random.randint(0, 1000000, 200):
+				bed.write('%s\t%d\t%d\n' % (chrom, start, start + random.randint(100, 1000)))
+
+	for cell_type in ['CD34', 'Ery']:
+		with open(str(directory.join('%s_CHiC.bed' % cell_type)), 'w') as chic:
+			chic.write('chrom\tstart\tend\tID\tgene\n')
+
+			for chrom in peak_chroms:
+				for start in random.randint(0, 1000000, 50):
+					chic.write('%s\t%d\t%d\t.\t%s_%s_%d\n' % (chrom, start, start + 5000, cell_type, chrom, start))
+
+	with open(str(directory.join('tss.bed')), 'w') as tss:
+		for chrom in tss_chroms:
+			for position in random.randint(0, 1000000, 100):
+				tss.write('%s\t%d\t%d\tgene_%s_%d\t0\t%s\n' % (chrom, position, position + 1, chrom, position, '+' if position % 2 else '-'))
+
+def run_annotate(directory, chic_files, out, jobs, homer = False):
+	# With homer, sites without a CHiC annotation are annotated by the stub annotatePeaks.pl of the benchmarks (nearest TSS in tss.bed), through a
+	# wrapper that logs every run to homer_runs.log. Otherwise the TSS file is used directly
+	script = os.path.join(REPO_DIR, 'HiC_annotation_data', 'annotateBed_with_CHiC.py')
+	env = dict(os.environ)
+
+	if homer:
+		wrapper_dir = directory.join('homer')
+
+		if not wrapper_dir.check():
+			wrapper_dir.mkdir()
+			wrapper = wrapper_dir.join('annotatePeaks.pl')
+			wrapper.write('#!/bin/sh\necho run >> "%s"\nexec "%s" "$@"\n' % (directory.join('homer_runs.log'), os.path.join(REPO_DIR, 'benchmarks', 'stub_homer', 'annotatePeaks.pl')))
+			wrapper.chmod(0o755)
+
+		env['PATH'] = str(wrapper_dir) + os.pathsep + env.get('PATH', '')
+		env['STUB_HOMER_TSS'] = str(directory.join('tss.bed'))
+		options = []
+	else:
+		options = ['-t', 'tss.bed']
+
+	subprocess.check_call([sys.executable, script, 'peaks.bed'] + chic_files + [out, '-j', str(jobs)] + options, cwd = str(directory), env = env, stderr = subprocess.DEVNULL)
+
+	with open(str(directory.join(out)), 'r') as annotated:
+		return annotated.read()
+
+def test_annotate_jobs_match_single_process(tmpdir):
+	write_annotation_data(tmpdir)
+
+	for chic_files in [['CD34_CHiC.bed'], ['CD34_CHiC.bed', 'Ery_CHiC.bed']]:
+		single = run_annotate(tmpdir, chic_files, 'single.bed', 1)
+
+		assert single.count('\n') > 700
+		assert 'gene_chr3_' in single and 'gene_chr22_' in single
+
+		for jobs in [2, 4]:
+			assert run_annotate(tmpdir, chic_files, 'parallel.bed', jobs) == single
+
+def test_annotate_jobs_run_homer_once(tmpdir):
+	write_annotation_data(tmpdir)
+	homer_runs = tmpdir.join('homer_runs.log')
+
+	for chic_files in [['CD34_CHiC.bed'], ['CD34_CHiC.bed', 'Ery_CHiC.bed']]:
+		single = run_annotate(tmpdir, chic_files, 'single.bed', 1, homer = True)
+
+		assert 'gene_chr3_' in single and 'gene_chr22_' in single
+
+		for jobs in [1, 4]:
+			if homer_runs.check():
+				homer_runs.remove()
+
+			assert run_annotate(tmpdir, chic_files, 'parallel.bed', jobs, homer = True) == single
+			assert homer_runs.read().count('run') == 1
+
+###################################################################################################################################################################################
+
+def test_chic_cache_touched_file_is_not_checksummed_again(tmpdir, monkeypatch):
+	write_annotation_data(tmpdir)
+	chic_file = str(tmpdir.join('CD34_CHiC.bed'))
+
+	chic, rebuilt = annotate.load_chic(chic_file)
+	assert rebuilt
+
+	checksums = list()
+	md5sum = annotate.store.md5sum
+	monkeypatch.setattr(annotate.store, 'md5sum', lambda filename: checksums.append(filename) or md5sum(filename))
+
+	# Only the modification time changes: the cache is kept, and only checksummed once
+	stat = os.stat(chic_file)
+	os.utime(chic_file, ns = (stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+
+	for run in range(2):
+		cached, rebuilt = annotate.load_chic(chic_file)
+
+		assert not rebuilt
+		assert cached.names.tolist() == chic.names.tolist()
+
+	assert checksums == [chic_file]
+
+	# The contents change but not the size: the cache is rebuilt
+	with open(chic_file, 'r') as chic_input:
+		lines = chic_input.readlines()
+
+	with open(chic_file, 'w') as chic_output:
+		chic_output.writelines(lines[:1] + lines[1:][::-1])
+
+	os.utime(chic_file, ns = (stat.st_atime_ns, stat.st_mtime_ns + 2 * 10**9))
+
+	assert annotate.load_chic(chic_file)[1]
+
+def test_chic_cache_unreadable_is_rebuilt(tmpdir):
+	write_annotation_data(tmpdir)
+	chic_file = str(tmpdir.join('CD34_CHiC.bed'))
+	cache_file = chic_file + annotate.CACHE_SUFFIX
+
+	chic, rebuilt = annotate.load_chic(chic_file)
+
+	with open(cache_file, 'rb') as cache:
+		data = cache.read()
+
+	# Truncated, empty, not a NumPy file, no source info and source info that is not JSON
+	for content in [data[:len(data) // 2], b'', b'not a cache\n' * 10, None, 'not json']:
+		if content is None:
+			numpy.savez(cache_file, chroms = chic.chroms, starts = chic.starts, ends = chic.ends, genes = chic.names)
+		elif isinstance(content, str):
+			numpy.savez(cache_file, chroms = chic.chroms, starts = chic.starts, ends = chic.ends, genes = chic.names, source = numpy.array(content))
+		else:
+			with open(cache_file, 'wb') as cache:
+				cache.write(content)
+
+		assert annotate.cache_is_stale(cache_file, chic_file)
+
+		cached, rebuilt = annotate.load_chic(chic_file)
+
+		assert rebuilt
+		assert cached.names.tolist() == chic.names.tolist()
+		assert not annotate.cache_is_stale(cache_file, chic_file)
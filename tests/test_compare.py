@@ -0,0 +1,44 @@
+from conftest import REPO_DIR
+from grn import compare
+from grn import cyjs
+import subprocess
+import numpy
+import json
+import sys
+import os
+
+###################################################################################################################################################################################
+
+def write_network(filename, edges, expression):
+	# edges: list of (source node, target node, motif, count)
+	grn = cyjs.CyjsWriter(filename)
+
+	for node in sorted(set([edge[0] for edge in edges] + [edge[1] for edge in edges])):
+		grn.add_node(node, expression = expression)
+
+	for source, target, motif_id, count in edges:
+		grn.add_edge(source, target, source_motif = motif_id, count = count)
+
+	return grn.close()
+
+def test_unique_names():
+	for names in [[], ['b', 'a', 'b'], ['x%d' % (i % 97) for i in range(1000)] + ['é', 'Z', 'a b', '']]:
+		distinct, codes = compare.unique_names(names)
+		expected, expected_codes = numpy.unique(numpy.array(names, dtype = str), return_inverse = True)
+
+		assert distinct.tolist() == expected.tolist()
+		assert codes.tolist() == expected_codes.ravel().tolist()
+
+def test_compare_duplicate_source_target_pairs(tmpdir):
+	# RUNX1 and RUNX2 motifs share the source node RUNX1, so their edges to the same target collapse into one (the edge of the last motif)
+	reference = write_network(str(tmpdir.join('A.cyjs')), [('RUNX1', 'GATA1', 'RUNX1', 2), ('RUNX1', 'GATA1', 'RUNX2', 3), ('RUNX1', 'SPI1', 'RUNX1', 1), ('GATA1', 'SPI1', 'GATA', 4)], 1.0)
+	condition = write_network(str(tmpdir.join('B.cyjs')), [('RUNX1', 'GATA1', 'RUNX1', 8), ('GATA1', 'RUNX1', 'GATA', 1), ('GATA1', 'SPI1', 'GATA', 4)], 2.0)
+	out = str(tmpdir.join('merged.cyjs'))
+
+	subprocess.check_call([sys.executable, os.path.join(REPO_DIR, 'compare_GRNs.py'), reference, condition, out], stdout = subprocess.DEVNULL, stderr = subprocess.DEVNULL)
+
+	with open(out, 'r') as merged:
+		edges = [element['data'] for element in json.load(merged)['elements']['edges']]
+
+	assert [(edge['source'], edge['target'], edge['source_motif']) for edge in edges] == [('GATA1', 'RUNX1', 'GATA'), ('GATA1', 'SPI1', 'GATA'), ('RUNX1', 'GATA1', 'RUNX2'), ('RUNX1', 'SPI1', 'RUNX1')]
+	assert [(edge['count_A'], edge['count_B'], edge['status_B'], edge['log2fc_B']) for edge in edges] == [(0, 1, 'gained', 1.0), (4, 4, 'unchanged', 0.0), (3, 0, 'lost', -2.0), (1, 0, 'lost', -1.0)]
@@ -0,0 +1,55 @@
+from grn import cyjs
+import json
+
+###################################################################################################################################################################################
+
+NODES = ['n1', 'n2', 'n3', 'gène']
+
+# Columns with mixed types, equal values of different types, strings that need escaping, non-finite and overflowing floats
+COLUMNS = dict(mixed = [1, True, 1.0, float('nan'), None, 7], name = ['x', 'é', 'x"y', '', 'x', 'q'], score = [0.1, 1e-7, 3.0, -2.5, 1e300, 1e308],
+	large = [1e308] * 6, other = [[1], {'k': 2}, 'z', 5, False, 0], count = [1, 2, 3, 4, 5, 6])
+
+def write_edges(filename, sources, targets, bulk):
+	grn = cyjs.CyjsWriter(filename)
+
+	for node in NODES:
+		grn.add_node(node)
+
+	if bulk:
+		# In two parts, so that an edge of the second replaces one of the first
+		grn.add_edges(sources[:3], targets[:3], **dict((key, values[:3]) for key, values in COLUMNS.items()))
+		grn.add_edges(sources[3:], targets[3:], **dict((key, values[3:]) for key, values in COLUMNS.items()))
+	else:
+		for i in range(len(sources)):
+			grn.add_edge(sources[i], targets[i], **dict((key, values[i]) for key, values in COLUMNS.items()))
+
+	grn.close()
+
+	with open(filename, 'r') as cyjs_file:
+		return cyjs_file.read()
+
+def test_add_edges_matches_add_edge(tmpdir):
+	# Edges in the order they are written (copied from the spool in blocks), and out of order with a replaced edge
+	for sources, targets in [(['n1', 'n1', 'n1', 'n2', 'n3', 'gène'], ['n1', 'n2', 'n3', 'n1', 'n2', 'n3']), (['n1', 'n2', 'n1', 'n3', 'n1', 'n3'], ['n2', 'n3', 'n2', 'n1', 'n1', 'n3'])]:
+		for edge_block in [1, 2, cyjs.EDGE_BLOCK]:
+			original_block, cyjs.EDGE_BLOCK = cyjs.EDGE_BLOCK, edge_block
+
+			try:
+				single = write_edges(str(tmpdir.join('single.cyjs')), sources, targets, False)
+				bulk = write_edges(str(tmpdir.join('bulk.cyjs')), sources, targets, True)
+			finally:
+				cyjs.EDGE_BLOCK = original_block
+
+			assert bulk == single
+			assert [element_type for element_type, data in cyjs.iter_elements(str(tmpdir.join('bulk.cyjs')))] == ['node'] * len(NODES) + ['edge'] * len(set(zip(sources, targets)))
+
+def test_iter_elements_matches_json(tmpdir):
+	filename = str(tmpdir.join('grn.cyjs'))
+	write_edges(filename, ['n1', 'n2', 'n1', 'n3', 'n1', 'n3'], ['n2', 'n3', 'n2', 'n1', 'n1', 'n3'], True)
+
+	with open(filename, 'r') as cyjs_file:
+		document = json.load(cyjs_file)
+
+	expected = [('node', element['data']) for element in document['elements']['nodes']] + [('edge', element['data']) for element in document['elements']['edges']]
+
+	assert json.dumps(list(cyjs.iter_elements(filename))) == json.dumps(expected)
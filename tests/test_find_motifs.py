@@ -0,0 +1,99 @@
+from conftest import REPO_DIR
+from grn import scan
+import subprocess
+import socket
+import shutil
+import numpy
+import sys
+import os
+
+###################################################################################################################################################################################
+
+# findMotifs.py runs against the stub annotatePeaks.pl of the benchmarks, so Homer is not needed
+STUB_HOMER_DIR = os.path.join(REPO_DIR, 'benchmarks', 'stub_homer')
+MOTIFS = ['AP1', 'CTCF', 'GATA', 'RUNX']
+
+def write_inputs(directory, seed = 0):
+	random = numpy.random.RandomState(seed)
+	motif_dir = directory.mkdir('motifs')
+
+	with open(str(directory.join('peaks.bed')), 'w') as bed:
+		for chrom in ['chr1', 'chr2', 'chrX']:
+			for start in sorted(random.randint(0, 1000000, 300)):
+				bed.write('%s\t%d\t%d\n' % (chrom, start, start + 200))
+
+	for motif in MOTIFS:
+		shutil.copy(os.path.join(REPO_DIR, 'motif_PWM_database', '%s.motif' % motif), str(motif_dir))
+
+def find_motifs(directory, out, fail = ()):
+	# Run findMotifs.py with two jobs. Returns (exit status, standard output)
+	env = dict(os.environ)
+	env['PATH'] = STUB_HOMER_DIR + os.pathsep + env.get('PATH', '')
+	env['STUB_HOMER_FAIL'] = ','.join(fail)
+
+	process = subprocess.run([sys.executable, os.path.join(REPO_DIR, 'findMotifs.py'), 'peaks.bed', 'motifs', 'hg38', out, '-j', '2'], cwd = str(directory), env = env, stdout = subprocess.PIPE, stderr = subprocess.DEVNULL)
+
+	return process.returncode, process.stdout.decode()
+
+def motif_output(out_dir):
+	# Motif BED files and manifest entries (without the time taken) of an output directory
+	output = dict()
+
+	for motif in MOTIFS:
+		if os.path.exists(os.path.join(out_dir, '%s.bed' % motif)):
+			with open(os.path.join(out_dir, '%s.bed' % motif), 'r') as bed:
+				output[motif] = bed.read()
+
+	manifest = scan.read_manifest(out_dir)
+
+	return output, dict((motif, (n_sites, checksum)) for motif, (n_sites, elapsed, checksum) in manifest.items())
+
+def test_resume_after_failed_and_interrupted_jobs(tmpdir):
+	for motif in MOTIFS:
+		assert os.path.exists(os.path.join(REPO_DIR, 'motif_PWM_database', '%s.motif' % motif))
+
+	write_inputs(tmpdir)
+
+	status, stdout = find_motifs(tmpdir, 'clean')
+	clean = motif_output(str(tmpdir.join('clean')))
+
+	assert status == 0
+	assert sorted(clean[0]) == MOTIFS and sorted(clean[1]) == MOTIFS
+	assert all(len(sites) > 0 for sites in clean[0].values())
+
+	# A run in which one job fails: its BED file is never moved into place, and it is not recorded in the manifest
+	out_dir = str(tmpdir.join('resumed'))
+	status, stdout = find_motifs(tmpdir, 'resumed', fail = ['CTCF'])
+	output = motif_output(out_dir)
+
+	assert status == 1
+	assert sorted(output[0]) == ['AP1', 'GATA', 'RUNX'] and sorted(output[1]) == ['AP1', 'GATA', 'RUNX']
+	assert output[0]['AP1'] == clean[0]['AP1']
+	assert not any(name.startswith(scan.SCRATCH_PREFIX) for name in os.listdir(out_dir))
+
+	# A job killed while writing GATA: its scratch directory is left behind (owned by a process that has exited), the BED file was not renamed
+	# into place, and the manifest ends with a truncated line
+	os.remove(os.path.join(out_dir, 'GATA.bed'))
+	scratch = scan.make_scratch(out_dir, 'GATA')
+
+	with open(os.path.join(scratch, scan.SCRATCH_OWNER), 'w') as owner:
+		process = subprocess.Popen([sys.executable, '-c', 'pass'])
+		process.wait()
+		owner.write('%s\t%d\n' % (socket.gethostname(), process.pid))
+
+	with open(os.path.join(scratch, 'GATA.bed'), 'w') as partial:
+		partial.write(clean[0]['GATA'][:100])
+
+	with open(os.path.join(out_dir, scan.MANIFEST), 'r') as manifest:
+		lines = [line for line in manifest if not line.startswith('GATA\t')]
+
+	with open(os.path.join(out_dir, scan.MANIFEST), 'w') as manifest:
+		manifest.write(''.join(lines) + 'GATA\t12')
+
+	# Re-running scans only the failed and interrupted motifs, and gives the same output as the clean run
+	status, stdout = find_motifs(tmpdir, 'resumed')
+
+	assert status == 0
+	assert 'Scanning 2 motifs (2 already complete)' in stdout
+	assert motif_output(out_dir) == clean
+	assert not any(name.startswith(scan.SCRATCH_PREFIX) for name in os.listdir(out_dir))
@@ -0,0 +1,47 @@
+from grn import query
+from grn import cyjs
+import numpy
+
+###################################################################################################################################################################################
+
+def write_network(filename, seed = 0):
+	random = numpy.random.RandomState(seed)
+	genes = ['G%d' % i for i in range(50)]
+	grn = cyjs.CyjsWriter(filename)
+
+	for gene in genes:
+		grn.add_node(gene, expression = 1.0)
+
+	for i, motif in enumerate(['AP1', 'CEBP', 'ETS', 'RUNX']):
+		for target in random.choice(len(genes), 30, replace = False):
+			grn.add_edge(genes[i], genes[target], source_motif = motif, count = int(random.randint(1, 5)))
+
+	# An edge without a motif count, which is never followed
+	grn.add_edge(genes[10], genes[11], source_motif = 'AP1')
+
+	return grn.close()
+
+def test_stream_module_matches_index(tmpdir):
+	filename = write_network(str(tmpdir.join('grn.cyjs')))
+	index = query.open_network(filename)
+
+	for motifs in [['AP1'], ['AP1', 'RUNX'], ['AP1', 'CEBP', 'ETS'], ['missing'], ['AP1', 'missing']]:
+		for mode in ['union', 'intersection']:
+			for min_count in [0, 2, 4]:
+				module, n_nodes, n_edges = query.stream_module(filename, motifs, mode, min_count)
+
+				assert module == index.module(motifs, mode, min_count)
+				assert module == index.query(motifs, mode, min_count)
+				assert (n_nodes, n_edges) == (index.number_of_nodes(), index.number_of_edges())
+
+def test_can_stream(tmpdir):
+	filename = write_network(str(tmpdir.join('grn.cyjs')))
+	index_file = str(tmpdir.join('grn.db'))
+	query.compile_index(filename, index_file).close()
+
+	assert query.can_stream(filename, [(['AP1'], 'union', 0, 1, 'downstream')])
+	assert query.can_stream(filename, [(['AP1', 'ETS'], 'intersection', 2, 1, 'downstream')])
+	assert not query.can_stream(filename, [(['AP1'], 'union', 0, 2, 'downstream')])
+	assert not query.can_stream(filename, [(['AP1'], 'union', 0, 1, 'upstream')])
+	assert not query.can_stream(filename, [(['AP1'], 'union', 0, 1, 'downstream')] * 2)
+	assert not query.can_stream(index_file, [(['AP1'], 'union', 0, 1, 'downstream')])
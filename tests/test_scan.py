@@ -0,0 +1,38 @@
+from grn import scan
+import subprocess
+import socket
+import time
+import sys
+import os
+
+###################################################################################################################################################################################
+
+def write_owner(scratch, host, pid):
+	with open(os.path.join(scratch, scan.SCRATCH_OWNER), 'w') as owner:
+		owner.write('%s\t%d\n' % (host, pid))
+
+def finished_pid():
+	# The process ID of a process that has exited
+	process = subprocess.Popen([sys.executable, '-c', 'pass'])
+	process.wait()
+
+	return process.pid
+
+def test_remove_stale_scratch(tmpdir):
+	out_dir = str(tmpdir)
+	running = scan.make_scratch(out_dir, 'running')
+	finished = scan.make_scratch(out_dir, 'finished')
+	other_host = scan.make_scratch(out_dir, 'other_host')
+	new_without_owner = os.path.join(out_dir, scan.SCRATCH_PREFIX + 'new')
+	old_without_owner = os.path.join(out_dir, scan.SCRATCH_PREFIX + 'old')
+	motif_bed = os.path.join(out_dir, 'motif.bed')
+
+	write_owner(finished, socket.gethostname(), finished_pid())
+	write_owner(other_host, socket.gethostname() + '.other', finished_pid())
+	os.mkdir(new_without_owner)
+	os.mkdir(old_without_owner)
+	os.utime(old_without_owner, (time.time() - 2 * scan.STALE_SCRATCH_AGE, time.time() - 2 * scan.STALE_SCRATCH_AGE))
+	open(motif_bed, 'w').close()
+
+	assert scan.remove_stale_scratch(out_dir) == 2
+	assert sorted(os.listdir(out_dir)) == sorted(os.path.basename(path) for path in [running, other_host, new_without_owner, motif_bed])
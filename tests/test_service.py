@@ -0,0 +1,108 @@
+from grn import service
+import http.client
+import threading
+import json
+import os
+
+###################################################################################################################################################################################
+
+def write_service_data(directory):
+	# A motif directory with one motif, its TF annotation, and peaks and expression for a request
+	motif_dir = directory.mkdir('motifs')
+
+	with open(str(motif_dir.join('AP1.bed')), 'w') as bed:
+		bed.write('chr1\t150\t160\tAP1\t8.0\t+\nchr1\t1150\t1160\tAP1\t8.0\t+\n')
+
+	with open(str(directory.join('annotation.tsv')), 'w') as annotation:
+		annotation.write('Name\tmotif family\nJUN\tAP1\n')
+
+	with open(str(directory.join('peaks.bed')), 'w') as peaks:
+		peaks.write('chr1\t100\t200\tJUN\nchr1\t1100\t1200\tFOS\n')
+
+	with open(str(directory.join('expression.tsv')), 'w') as expression:
+		expression.write('Gene\tFPKM\nJUN\t10\nFOS\t5\n')
+
+	return str(motif_dir), str(directory.join('annotation.tsv'))
+
+def start_service(directory, out_dir = None):
+	motif_dir, annot = write_service_data(directory)
+	server, address = service.make_server(service.GRNService(motif_dir, annot, str(directory.join('cache')), out_dir = out_dir), '127.0.0.1', 0)
+
+	thread = threading.Thread(target = server.serve_forever)
+	thread.daemon = True
+	thread.start()
+
+	return server
+
+def post(server, body, content_type = 'application/json', host = None):
+	# Returns (HTTP status, response document)
+	connection = http.client.HTTPConnection('127.0.0.1', server.server_port, timeout = 30)
+	headers = {'Content-Type': content_type}
+
+	if host is not None:
+		headers['Host'] = host
+
+	connection.request('POST', '/build', body = json.dumps(body), headers = headers)
+	response = connection.getresponse()
+	status, document = response.status, json.loads(response.read().decode())
+	connection.close()
+
+	return status, document
+
+def test_service_refuses_cross_origin_requests(tmpdir):
+	out_dir = tmpdir.mkdir('out')
+	server = start_service(tmpdir, str(out_dir))
+	request = {'peaks': str(tmpdir.join('peaks.bed')), 'exprs': str(tmpdir.join('expression.tsv')), 'out': 'grn'}
+
+	try:
+		# Simple requests a web page can send without a preflight, and requests through another host name
+		assert post(server, request, 'text/plain')[0] == 415
+		assert post(server, request, 'application/x-www-form-urlencoded')[0] == 415
+		assert post(server, request, host = 'attacker.example.com:%d' % server.server_port)[0] == 403
+		assert os.listdir(str(out_dir)) == []
+
+		# Networks are only written inside the output directory
+		for out in [str(tmpdir.join('outside')), '../outside', os.path.join('..', '..', 'outside')]:
+			status, document = post(server, dict(request, out = out))
+
+			assert status == 400 and 'output directory' in document['error']
+
+		assert not os.path.exists(str(tmpdir.join('outside.cyjs')))
+
+		status, document = post(server, request, 'application/json; charset=utf-8', 'localhost:%d' % server.server_port)
+
+		assert status == 200
+		assert document['out'] == str(out_dir.join('grn.cyjs')) and document['edges'] > 0
+		assert os.listdir(str(out_dir)) == ['grn.cyjs']
+	finally:
+		server.shutdown()
+		server.server_close()
+
+def test_service_without_output_directory(tmpdir):
+	server = start_service(tmpdir)
+
+	try:
+		status, document = post(server, {'peaks': str(tmpdir.join('peaks.bed')), 'exprs': str(tmpdir.join('expression.tsv')), 'out': 'grn'})
+
+		assert status == 400 and '-o' in document['error']
+	finally:
+		server.shutdown()
+		server.server_close()
+
+def test_service_replies_to_unexpected_errors(tmpdir):
+	server = start_service(tmpdir)
+
+	try:
+		# A request of the wrong type, and values of the wrong type (TypeError)
+		assert post(server, [1, 2])[0] == 400
+
+		status, document = post(server, {'peaks': 1, 'exprs': str(tmpdir.join('expression.tsv'))})
+
+		assert status == 500 and 'TypeError' in document['error']
+
+		status, document = post(server, {'peak_list': [['chr1', 100, 200, 'JUN']], 'expression': {'JUN': 10}})
+
+		assert status == 200 and len(document['elements']['edges']) == 1
+	finally:
+		server.shutdown()
+		server.server_close()
@@ -0,0 +1,111 @@
+from conftest import REPO_DIR
+from grn import significance
+from grn import cyjs
+import subprocess
+import numpy
+import sys
+import os
+
+###################################################################################################################################################################################
+
+def test_benjamini_hochberg():
+	# Values from R's p.adjust(p, method = 'BH')
+	assert numpy.allclose(significance.benjamini_hochberg([0.01, 0.02, 0.03, 0.04, 0.05]), [0.05] * 5)
+	assert numpy.allclose(significance.benjamini_hochberg([0.01, 0.04, 0.03, 0.005]), [0.02, 0.04, 0.04, 0.02])
+	assert numpy.allclose(significance.benjamini_hochberg([0.001, 0.008, 0.039, 0.041, 0.042, 0.06, 0.074, 0.205, 0.212, 0.216]),
+		[0.01, 0.04, 0.084, 0.084, 0.084, 0.1, 0.1057142857, 0.216, 0.216, 0.216])
+	assert numpy.allclose(significance.benjamini_hochberg([0.9, 1.0]), [1.0, 1.0])
+	assert len(significance.benjamini_hochberg([])) == 0
+
+def test_exceedances():
+	observed = numpy.array([0, 5, 11], dtype = numpy.int64)
+
+	# Every permutation reaches a count of 0, and none can reach more sites than there are
+	exceed = significance.shuffle_exceedances(10, numpy.array([0.3, 0.3, 0.3, 0.1]), observed, 100, [0, 0])
+
+	assert exceed[0] == 100 and 0 < exceed[1] < 100 and exceed[2] == 0
+	assert significance.shuffle_exceedances(10, numpy.array([0.3, 0.3, 0.3, 0.1]), observed, 100, [0, 0]).tolist() == exceed.tolist()
+
+	# Two genes with one peak each, drawn from a single length bin of background peaks with 0 or 2 sites
+	background_counts = numpy.array([0, 2, 0, 2], dtype = numpy.int64)
+	args = (background_counts, numpy.array([0]), numpy.array([4]), numpy.array([0, 0]), numpy.array([0, 1, 2]), numpy.array([0, 3], dtype = numpy.int64), 100)
+
+	assert significance.background_exceedances(*(args + ([0, 0],))).tolist() == [100, 0]
+
+###################################################################################################################################################################################
+
+def write_network_data(directory, seed = 0):
+	# Six TFs (TF0-5) with one motif each (MTF0-5) and 40 other genes, all with three peaks. Motif m has 15 sites in the peaks of every gene g with
+	# g % 6 == m, and a few random sites elsewhere, so only these edges should be significant. The background peaks are the peaks and one more
+	# peak (without sites) per gene
+	random = numpy.random.RandomState(seed)
+	tfs = ['TF%d' % i for i in range(6)]
+	genes = tfs + ['G%d' % i for i in range(40)]
+	peaks = list()
+
+	with open(str(directory.join('peaks.bed')), 'w') as bed, open(str(directory.join('background.bed')), 'w') as background:
+		for g, gene_id in enumerate(genes):
+			for p in range(3):
+				start = 10000 * (g * 3 + p)
+				peaks.append((start, start + random.randint(200, 1000), gene_id))
+				bed.write('chr1\t%d\t%d\t%s\n' % peaks[-1])
+				background.write('chr1\t%d\t%d\n' % peaks[-1][:2])
+
+			start = 10000 * (g * 3 + 1) + 5000
+			background.write('chr1\t%d\t%d\n' % (start, start + random.randint(200, 1000)))
+
+	with open(str(directory.join('expression.tsv')), 'w') as expression:
+		expression.write('Gene\tFPKM\n')
+		expression.writelines('%s\t10\n' % gene_id for gene_id in genes)
+
+	with open(str(directory.join('annotation.tsv')), 'w') as annotation:
+		annotation.write('Name\tmotif family\n')
+		annotation.writelines('%s\tM%s\n' % (tf, tf) for tf in tfs)
+
+	motif_dir = directory.mkdir('motifs')
+
+	for m, tf in enumerate(tfs):
+		sites = list()
+
+		for g in range(len(genes)):
+			for k in range(15 if g % 6 == m else random.poisson(1)):
+				start, end, gene_id = peaks[g * 3 + random.randint(3)]
+				site_start = random.randint(start, end - 10)
+				sites.append(site_start)
+
+		with open(str(motif_dir.join('M%s.bed' % tf)), 'w') as bed:
+			bed.writelines('chr1\t%d\t%d\tM%s\t8.0\t+\n' % (site_start, site_start + 10, tf) for site_start in sorted(sites))
+
+def build_network(directory, out, options):
+	# Returns {(source motif, target gene): edge data} of the network
+	script = os.path.join(REPO_DIR, 'build_gene_regulatory_network.py')
+	subprocess.check_call([sys.executable, script, 'peaks.bed', 'motifs', 'expression.tsv', 'annotation.tsv', out, '-a'] + options, cwd = str(directory), stdout = subprocess.DEVNULL)
+
+	return dict(((data['source_motif'], data['target']), data) for element_type, data in cyjs.iter_elements(str(directory.join(out + '.cyjs'))) if element_type == 'edge')
+
+def test_significance_jobs_match_single_process(tmpdir):
+	write_network_data(tmpdir)
+
+	for null_model in [[], ['--background', 'background.bed']]:
+		single = build_network(tmpdir, 'single', ['-N', '200', '--seed', '3'] + null_model)
+
+		assert len(single) > 100
+		assert len(set(data['pvalue'] for data in single.values())) > 1
+
+		for jobs in [2, 4]:
+			assert build_network(tmpdir, 'parallel', ['-N', '200', '--seed', '3', '-j', str(jobs)] + null_model) == single
+
+def test_fdr_prunes_edges(tmpdir):
+	write_network_data(tmpdir)
+
+	tested = build_network(tmpdir, 'tested', ['-N', '200'])
+	pruned = build_network(tmpdir, 'pruned', ['-N', '200', '--fdr', '0.05', '-j', '2'])
+
+	assert 0 < len(pruned) < len(tested)
+	assert all(pruned[key] == tested[key] and data['fdr'] <= 0.05 for key, data in pruned.items())
+	assert all(key in pruned for key, data in tested.items() if data['fdr'] <= 0.05)
+
+	# The kept edges are those of the motifs enriched in the peaks of their targets
+	genes = ['TF%d' % i for i in range(6)] + ['G%d' % i for i in range(40)]
+
+	assert all(genes.index(target) % 6 == int(motif_id[3:]) for motif_id, target in pruned)
@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+from grn import intervals
+from grn import cyjs
+from grn import network
+from grn import api
+import argparse
+import sys
+
+###################################################################################################################################################################################
+
+# Read command line arguments
+parser = argparse.ArgumentParser(description = 'Update a Gene Regulatory Network (built with -P) for gained and lost peaks, without rebuilding it from all peaks')
+parser.add_argument('grn', type = str, help = 'Gene Regulatory Network (.cyjs) built by build_gene_regulatory_network.py with peak provenance (-P)')
+parser.add_argument('dir', type = str, help = 'Directory of BED files with the genomic coordinates for each TF motif used to build the GRN')
+parser.add_argument('exprs', type = str, help = 'Gene expression data file used to build the GRN')
+parser.add_argument('annot', type = str, help = 'Transcription Factor (TF) annotation file used to build the GRN')
+parser.add_argument('out', type = str, help = 'Output file')
+parser.add_argument('-A', '--added', dest = 'A', type = str, required = False, help = 'Annotated BED file of peaks (with associated gene ID in 4th column) to add to the GRN')
+parser.add_argument('-R', '--removed', dest = 'R', type = str, required = False, help = 'BED file of peaks to remove from the GRN')
+parser.add_argument('-f', type = str, required = False, help = 'The BED file of DNaseI/ATAC-Seq footprints used to build the GRN (if any)')
+parser.add_argument('-a', action = 'store_true', required = False, help = 'The GRN includes all genes - not just transcription factor genes. Default: False')
+parser.add_argument('-m', type = float, default = float(0), help = 'Minimum gene expression value used to build the GRN. Default = 0')
+
+args = parser.parse_args()
+
+# The options describing the network (-f, -a, -m) must match those used to build it, so that the result is the same as a full rebuild
+
+###################################################################################################################################################################################
+
+# Read the existing network's peak provenance
+motif_peak_hits = network.read_provenance(args.grn)
+sys.stdout.write('Read peak provenance for %d motifs from %s\n' % (len(motif_peak_hits), args.grn))
+
+# Read gained and lost peaks
+if args.A:
+	added_peaks = api.load_peaks(args.A)
+	sys.stdout.write('Read %d peaks to add from %s\n' % (len(added_peaks), args.A))
+else:
+	added_peaks = intervals.Intervals([], [], [], [])
+
+if args.R:
+	removed_peaks = intervals.read_bed(args.R)
+	sys.stdout.write('Read %d peaks to remove from %s\n' % (len(removed_peaks), args.R))
+else:
+	removed_peaks = intervals.Intervals([], [], [])
+
+###################################################################################################################################################################################
+
+# Read motif positions (through the motif store) and read expression and annotation data, as for a full build
+motif_positions = api.load_motifs(args.dir)
+
+gene_expression = api.load_expression(args.exprs, args.m)
+tf_annotation = api.load_tf_annotation(args.annot)
+motif_ref_gene, motif_associated_genes = api.select_reference_genes(tf_annotation, gene_expression, motif_positions)
+
+annotated_motifs = [motif_id for motif_id in motif_positions if motif_id in motif_ref_gene]
+
+###################################################################################################################################################################################
+
+# Apply the delta
+# Only motif sites inside the added peaks are counted (and filtered against footprints), so the cost depends on the size of the delta
+n_removed = network.remove_peaks(motif_peak_hits, removed_peaks)
+
+if len(added_peaks) > 0:
+	footprints = intervals.read_bed(args.f) if args.f else None
+	delta_positions = dict()
+
+	for motif_id in annotated_motifs:
+		sites = motif_positions[motif_id]
+		sites = sites.subset(intervals.count_overlaps(sites, added_peaks) > 0)
+
+		if footprints is not None:
+			sites = sites.subset(intervals.count_overlaps(sites, footprints) > 0)
+
+		delta_positions[motif_id] = sites
+
+	n_added = network.add_peaks(motif_peak_hits, added_peaks, delta_positions)
+else:
+	n_added = 0
+
+sys.stdout.write('Removed %d and added %d peak/motif hits\n' % (n_removed, n_added))
+
+###################################################################################################################################################################################
+
+# Write the updated GRN (with provenance, so it can be updated again)
+motif_gene_hits = network.provenance_gene_hits(motif_peak_hits, annotated_motifs)
+grn = network.build_graph(motif_gene_hits, motif_ref_gene, gene_expression, None if args.a else set(motif_associated_genes), cyjs.CyjsWriter(cyjs.cyjs_filename(args.out)), motif_peak_hits)
+sys.stdout.write('Built network with %d nodes and %d edges\n' % (grn.number_of_nodes(), grn.number_of_edges()))
+
+grn.close()
+
+###################################################################################################################################################################################